@@ -1,7 +1,18 @@
+import concurrent.futures
+import contextlib
 import datetime
+import hashlib
+import itertools
+import pathlib
+import queue
+import threading
+import time
 import typing
 import auto_requirements
-auto_requirements.ensure_requirements()
+# spawn 啟動的子程序（Windows / macOS 的多檔 TXT 匯入）會以 __mp_main__ 重新載入主程式，
+# 套件檢查只在主程序做一次
+if __name__ != "__mp_main__":
+    auto_requirements.ensure_requirements()
 
 import os
 import sqlite3
@@ -11,14 +22,18 @@ from tkinter import messagebox, filedialog
 import traceback
 import pandas as pd
 import plotly.graph_objects as go
-import yfinance as yf
 import re
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.widgets import DateEntry
 from gspread.exceptions import APIError
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import data_sources
+import gex_parser
+import price_fetch
+import sheet_fetch
+from ticker_index import TickerIndex
+from gex_parser import (TV_CODE_LABEL, parse_tv_code_frame, day_number as _day_number,
+                        day_to_date as _day_to_date, content_hash as _code_hash)
 
 # 全域控件
 root = None
@@ -28,6 +43,7 @@ ticker_filter = None
 start_date_filter = None
 end_date_filter = None
 tree = None
+table = None
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # 此 .py 檔所在資料夾
 DB_PATH = os.path.join(BASE_DIR, "stocks.db")
 
@@ -38,170 +54,816 @@ SERVICE_ACCOUNT_FILE = os.path.join(BASE_DIR, 'service_account.json')  # Service
 
 # 全域狀態追蹤使用者選擇
 user_conflict_choice = None  # "skip" 或 "overwrite" 或 "cancel"
-apply_to_all = False
 cancel_import = False
 inserted_count = 0
 all_tickers = []
+ticker_index = TickerIndex()
 
 # --- 資料庫相關 ---
+OHLC_LABELS = ('Open', 'High', 'Low', 'Close')
+
+# 圖表上的 GEX level 與線色（key 的順序即繪圖順序）
+LEVEL_COLORS = {
+    'Call Dominate':  '#FFD700',
+    'Call Wall':      '#FFA500',
+    'Call Wall CE':   '#FF7F50',
+    'Gamma Field':    "#D75BF6",
+    'Gamma Field CE': "#EAA1F8",
+    'Key Delta':      '#ADFF2F',
+    'Gamma Flip':     "#CBCBCB",
+    'Gamma Flip CE':  "#FFFFFF",
+    'Put Wall CE':    '#FF1493',
+    'Put Wall':       '#DC143C',
+    'Put Dominate':   '#8B0000',
+}
+# daily_levels 寬表：label → 欄位名稱（每個已知 level + OHLC 各一欄）
+WIDE_COLUMNS = {label: re.sub(r'\W+', '_', label.lower())
+                for label in (*LEVEL_COLORS, *OHLC_LABELS)}
+
+# --- 連線管理 ---
+class Database:
+    """
+    stocks.db 的連線管理
+    - WAL 模式：背景匯入 / OHLC 更新寫入時，表格查詢仍可同時讀取
+    - 一條寫入連線，以鎖序列化；writer() 區塊即一個交易（例外時 rollback），
+      巢狀的 writer() 併入最外層的交易，只在最外層結束時 commit
+    - exclusive()：持有寫入鎖但不開交易，給自行 commit 的結構升級與 VACUUM 使用
+    - 少量唯讀連線組成連線池，reader() 借出、用完歸還
+    """
+    PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",        # WAL 下 NORMAL 已可保證不損毀
+        "PRAGMA cache_size = -32000",         # 每條連線約 32 MB 頁面快取
+        "PRAGMA mmap_size = 268435456",       # 256 MB 記憶體映射讀取
+        "PRAGMA temp_store = MEMORY",
+    )
+    BUSY_TIMEOUT = 10                         # 秒；等待其他連線釋放鎖
+
+    def __init__(self, path, max_readers=4):
+        self.path = path
+        self.max_readers = max_readers
+        self._lock = threading.RLock()
+        self._writer = None
+        self._depth = 0                       # 目前 writer() 的巢狀層數
+        self._readers = queue.LifoQueue()
+        self._opened_readers = 0
+        self._local = threading.local()
+
+    def _open(self, readonly=False):
+        if readonly:
+            uri = pathlib.Path(self.path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=self.BUSY_TIMEOUT,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextlib.contextmanager
+    def writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = self._open()
+            if self._depth:
+                # 已在交易中：不 commit，交給最外層的區塊
+                self._depth += 1
+                try:
+                    yield self._writer
+                finally:
+                    self._depth -= 1
+                return
+            self._depth = 1
+            try:
+                with self._writer:
+                    yield self._writer
+            finally:
+                self._depth = 0
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """持有寫入鎖、不開交易的寫入連線；區塊內自行 commit（不可在 writer() 區塊內使用）"""
+        with self._lock:
+            if self._depth:
+                raise RuntimeError("exclusive() 不可在 writer() 交易內使用")
+            if self._writer is None:
+                self._writer = self._open()
+            yield self._writer
+
+    @contextlib.contextmanager
+    def reader(self):
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._writer is None:          # 唯讀連線需要 WAL 檔已存在
+                    self._writer = self._open()
+                can_open = self._opened_readers < self.max_readers
+                if can_open:
+                    self._opened_readers += 1
+            conn = self._open(readonly=True) if can_open else self._readers.get()
+        cancelled = getattr(self._local, "cancelled", None)
+        if cancelled is not None:
+            conn.set_progress_handler(cancelled, 1000)
+        try:
+            yield conn
+        finally:
+            if cancelled is not None:
+                conn.set_progress_handler(None, 0)
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextlib.contextmanager
+    def cancellable(self, cancelled: typing.Callable[[], bool]):
+        """區塊內此執行緒借出的唯讀連線，cancelled() 為 True 時中止執行中的查詢（sqlite3.OperationalError）"""
+        self._local.cancelled = cancelled
+        try:
+            yield
+        finally:
+            self._local.cancelled = None
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._opened_readers = 0
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+_db = None
+
+def get_db() -> Database:
+    """目前 DB_PATH 對應的 Database（DB_PATH 變更時重建）"""
+    global _db
+    if _db is None or _db.path != DB_PATH:
+        if _db is not None:
+            _db.close()
+        _db = Database(DB_PATH)
+    return _db
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS stock_data (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+    db = get_db()
+    # 每個升級步驟各自一個交易，不能包在 writer() 裡
+    with db.exclusive() as conn:
+        cursor = conn.cursor()
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            cursor.execute('''CREATE TABLE IF NOT EXISTS stock_data (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                ticker TEXT NOT NULL,
+                                date TEXT NOT NULL,
+                                label TEXT NOT NULL,
+                                value REAL NOT NULL)''')
+            conn.commit()
+        applied = _migrate_db(conn)
+    with db.writer() as conn:
+        _prune_tv_codes(conn)
+    if COMPACT_SCHEMA_VERSION in applied:
+        with db.exclusive() as conn:
+            conn.execute("VACUUM")                 # 轉換後釋放舊表空間（只做一次，不能在交易中執行）
+
+# --- 資料庫結構升級 ---
+# 以 PRAGMA user_version 記錄結構版本，啟動時由 init_db 依序套用尚未執行的步驟，
+# 舊的 stocks.db 會在原檔直接升級
+def _migrate_v1_unique_key(conn):
+    """
+    v1：(ticker, date, label) 唯一鍵 + OHLC 查詢用覆蓋索引
+    - 既有重複資料只保留最後寫入（id 最大）的一筆
+    - ux_stock_data_key 的前綴即可供 fetch_data / MAX(date) 依 ticker + 日期查詢，
+      不另建同前綴的索引（每次寫入要多維護一份）
+    - ix_stock_data_ticker_label：OHLC 依 ticker + label 查詢
+    """
+    conn.execute("""DELETE FROM stock_data WHERE id NOT IN (
+                        SELECT MAX(id) FROM stock_data GROUP BY ticker, date, label)""")
+    conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS ux_stock_data_key
+                    ON stock_data (ticker, date, label)""")
+    conn.execute("""CREATE INDEX IF NOT EXISTS ix_stock_data_ticker_label
+                    ON stock_data (ticker, label, date, value)""")
+
+def _migrate_v2_compact_schema(conn):
+    """
+    v2：正規化的精簡結構，stock_data 改為相容 view
+    - tickers / labels：字典表，gex_levels 只存整數 id
+    - gex_levels.day：1970-01-01 起算的日數；value 只放數值
+    - tv_codes：TV Code 原文，以內容雜湊為鍵，gex_levels.code_hash 指向它
+    - 原本的 id 全部保留；日期格式不一致而撞鍵時以 id 較大者為準
+    """
+    conn.execute("""CREATE TABLE tickers (
+                        id INTEGER PRIMARY KEY,
+                        symbol TEXT NOT NULL UNIQUE)""")
+    conn.execute("""CREATE TABLE labels (
+                        id INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL UNIQUE)""")
+    conn.execute("""CREATE TABLE tv_codes (
+                        hash INTEGER PRIMARY KEY,
+                        code TEXT NOT NULL)""")
+    conn.execute("""CREATE TABLE gex_levels (
+                        id INTEGER PRIMARY KEY,
+                        ticker_id INTEGER NOT NULL REFERENCES tickers (id),
+                        day INTEGER NOT NULL,
+                        label_id INTEGER NOT NULL REFERENCES labels (id),
+                        value REAL,
+                        code_hash INTEGER REFERENCES tv_codes (hash))""")
+    conn.execute("""CREATE UNIQUE INDEX ux_gex_levels_key
+                    ON gex_levels (ticker_id, day, label_id)""")
+
+    conn.execute("INSERT INTO tickers (symbol) SELECT DISTINCT ticker FROM stock_data ORDER BY ticker")
+    conn.execute("INSERT INTO labels (name) SELECT DISTINCT label FROM stock_data ORDER BY label")
+
+    # 日期轉日數、TV Code 算雜湊都在 Python 端做，結果放暫存表再一次 JOIN
+    conn.execute("CREATE TEMP TABLE migrate_days (date TEXT PRIMARY KEY, day INTEGER)")
+    conn.executemany("INSERT INTO migrate_days VALUES (?, ?)",
+                     [(d, _day_number(d)) for (d,) in
+                      conn.execute("SELECT DISTINCT date FROM stock_data").fetchall()])
+    conn.execute("CREATE TEMP TABLE migrate_codes (id INTEGER PRIMARY KEY, hash INTEGER)")
+    codes = conn.execute("SELECT id, value FROM stock_data WHERE label = ?",
+                         (TV_CODE_LABEL,)).fetchall()
+    hashed = [(row_id, _code_hash(str(code)), str(code)) for row_id, code in codes]
+    conn.executemany("INSERT OR IGNORE INTO tv_codes (hash, code) VALUES (?, ?)",
+                     [(h, code) for _, h, code in hashed])
+    conn.executemany("INSERT INTO migrate_codes VALUES (?, ?)", [(i, h) for i, h, _ in hashed])
+
+    conn.execute("""INSERT INTO gex_levels (id, ticker_id, day, label_id, value, code_hash)
+                    SELECT s.id, t.id, d.day, l.id,
+                           CASE WHEN c.hash IS NULL THEN s.value END, c.hash
+                    FROM stock_data s
+                    JOIN tickers t ON t.symbol = s.ticker
+                    JOIN labels l ON l.name = s.label
+                    JOIN temp.migrate_days d ON d.date = s.date
+                    LEFT JOIN temp.migrate_codes c ON c.id = s.id
+                    WHERE d.day IS NOT NULL
+                    ORDER BY s.id
+                    ON CONFLICT (ticker_id, day, label_id) DO UPDATE
+                    SET value = excluded.value, code_hash = excluded.code_hash""")
+    dropped = conn.execute("SELECT COUNT(*) FROM stock_data").fetchone()[0] \
+        - conn.execute("SELECT COUNT(*) FROM gex_levels").fetchone()[0]
+    if dropped:
+        print(f"⚠️  轉換時略過 {dropped} 筆無法解析日期或重複的資料")
+    # 依 ticker + label（OHLC）與只依日期（未篩選 ticker 的表格）查詢
+    conn.execute("""CREATE INDEX ix_gex_levels_ticker_label
+                    ON gex_levels (ticker_id, label_id, day, value)""")
+    conn.execute("CREATE INDEX ix_gex_levels_day ON gex_levels (day)")
+    conn.execute("DROP TABLE temp.migrate_days")
+    conn.execute("DROP TABLE temp.migrate_codes")
+    conn.execute("DROP TABLE stock_data")
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'stock_data'")
+
+    conn.execute("""CREATE VIEW stock_data (id, ticker, date, label, value) AS
+                    SELECT g.id, t.symbol, date(g.day * 86400, 'unixepoch'), l.name,
+                           COALESCE(c.code, g.value)
+                    FROM gex_levels g
+                    JOIN tickers t ON t.id = g.ticker_id
+                    JOIN labels l ON l.id = g.label_id
+                    LEFT JOIN tv_codes c ON c.hash = g.code_hash""")
+    # 讓既有以 stock_data 刪除資料的 SQL 仍可運作
+    conn.execute("""CREATE TRIGGER stock_data_delete INSTEAD OF DELETE ON stock_data
+                    BEGIN DELETE FROM gex_levels WHERE id = OLD.id; END""")
+
+def _migrate_v3_daily_levels(conn):
+    """
+    v3：daily_levels 寬表，一個 ticker 一天一列、每個已知 level 與 OHLC 各一欄，
+    圖表 / 分析只需一次依 (ticker_id, day) 的範圍查詢；之後由各寫入路徑增量更新
+    """
+    columns = ", ".join(f"{col} REAL" for col in WIDE_COLUMNS.values())
+    conn.execute(f"""CREATE TABLE daily_levels (
+                         ticker_id INTEGER NOT NULL REFERENCES tickers (id),
+                         day INTEGER NOT NULL,
+                         {columns},
+                         PRIMARY KEY (ticker_id, day)) WITHOUT ROWID""")
+    _refresh_daily_levels(conn)
+
+def _migrate_v4_import_manifest(conn):
+    """
+    v4：匯入紀錄，重新匯入同一批檔案時不必再解析與比對
+    - import_manifest：每個檔案的大小 / 修改時間 / 內容雜湊；TXT 另記已讀到的位置、
+      該位置之前內容的雜湊與當時的日期行，只在尾端附加的檔案從這裡接續
+    - imported_codes：已匯入 TV Code 的 code_key（寫入日期 + 原文），以 (ticker_id, day) 反查
+    - 刪除 GEX level 時一併忘記該 ticker / 日期的 TV Code 與所有檔案紀錄，
+      讓被刪掉的資料可以重新匯入（只刪 OHLC 不影響）
+    """
+    conn.execute("""CREATE TABLE import_manifest (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        content_hash TEXT NOT NULL,
+                        byte_offset INTEGER NOT NULL,
+                        offset_hash TEXT NOT NULL,
+                        last_date TEXT,
+                        imported_at TEXT NOT NULL)""")
+    conn.execute("""CREATE TABLE imported_codes (
+                        hash INTEGER PRIMARY KEY,
+                        ticker_id INTEGER NOT NULL,
+                        day INTEGER NOT NULL)""")
+    conn.execute("CREATE INDEX ix_imported_codes_key ON imported_codes (ticker_id, day)")
+    conn.execute(f"""CREATE TRIGGER gex_levels_forget_import AFTER DELETE ON gex_levels
+                     WHEN OLD.label_id NOT IN (SELECT id FROM labels WHERE name IN {OHLC_LABELS})
+                     BEGIN
+                         DELETE FROM imported_codes WHERE ticker_id = OLD.ticker_id AND day = OLD.day;
+                         DELETE FROM import_manifest;
+                     END""")
+    # 既有的 TV Code 視為已匯入
+    conn.executemany("INSERT OR IGNORE INTO imported_codes (hash, ticker_id, day) VALUES (?, ?, ?)",
+                     [(gex_parser.code_key(day, code), ticker_id, day) for ticker_id, day, code in
+                      conn.execute("""SELECT g.ticker_id, g.day, c.code FROM gex_levels g
+                                      JOIN tv_codes c ON c.hash = g.code_hash""")])
+
+def _migrate_v5_sheet_sync_state(conn):
+    """
+    v5：Google 試算表每張工作表的同步進度（最後一列的列號、標題與該列內容的雜湊、最後日期），
+    自動更新只讀這之後新增的列
+    刪除 GEX level 時同時忘記該 ticker 的工作表進度，下次自動更新會整張重讀
+    """
+    conn.execute("""CREATE TABLE sheet_sync_state (
+                        spreadsheet_id TEXT NOT NULL,
+                        title TEXT NOT NULL,
                         ticker TEXT NOT NULL,
-                        date TEXT NOT NULL,
-                        label TEXT NOT NULL,
-                        value REAL NOT NULL)''')
-    conn.commit()
-    conn.close()
-
-def get_latest_date_for_ticker(ticker: str):
-    """回傳資料庫中指定 ticker 的最新日期 (datetime.date)；若無資料回傳 None"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT MAX(date) FROM stock_data WHERE ticker=?", (ticker,))
-    row = cur.fetchone()
-    conn.close()
-    if row and row[0]:
-        return pd.to_datetime(row[0]).date()
-    return None
-
-
-def insert_data(ticker: str, date_str: str, label: str, value: float):
-    """將一筆資料寫入資料庫，如已存在就覆蓋"""
-    global inserted_count
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""INSERT OR REPLACE INTO stock_data (ticker, date, label, value)
-                   VALUES (?,?,?,?)""",
-                (ticker, date_str, label, value))
-    conn.commit()
-    conn.close()
-    inserted_count += 1
-
-# 自訂彈出視窗讓使用者選擇如何處理重複資料
-def ask_conflict_resolution(ticker, date, label):
-    result = {"choice": None, "apply_all": False}
+                        last_row INTEGER NOT NULL,
+                        header_hash INTEGER NOT NULL,
+                        row_hash INTEGER NOT NULL,
+                        last_date TEXT,
+                        synced_at TEXT NOT NULL,
+                        PRIMARY KEY (spreadsheet_id, title)) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX ix_sheet_sync_state_ticker ON sheet_sync_state (ticker)")
+    conn.execute("DROP TRIGGER gex_levels_forget_import")
+    conn.execute(f"""CREATE TRIGGER gex_levels_forget_import AFTER DELETE ON gex_levels
+                     WHEN OLD.label_id NOT IN (SELECT id FROM labels WHERE name IN {OHLC_LABELS})
+                     BEGIN
+                         DELETE FROM imported_codes WHERE ticker_id = OLD.ticker_id AND day = OLD.day;
+                         DELETE FROM import_manifest;
+                         DELETE FROM sheet_sync_state
+                         WHERE ticker = (SELECT symbol FROM tickers WHERE id = OLD.ticker_id);
+                     END""")
+
+def _migrate_v6_symbol_map(conn):
+    """
+    v6：ticker → yfinance 代號的登錄表
+    symbol 為手動指定的代號（NULL 依 yf_symbol 的預設規則）；
+    no_data_at / misses 記錄最後一次下載不到任何資料的時間與連續次數，批次補 OHLC 時在 TTL 內略過
+    """
+    conn.execute("""CREATE TABLE symbol_map (
+                        ticker TEXT PRIMARY KEY,
+                        symbol TEXT,
+                        no_data_at TEXT,
+                        misses INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID""")
+
+def _migrate_v7_delete_journal(conn):
+    """
+    v7：刪除的復原紀錄。每次刪除一批，原始列以整數欄位存進 deleted_levels，
+    只保留最近 UNDO_BATCHES 批；被引用的 TV Code 原文不會被 _prune_tv_codes 清掉
+    """
+    conn.execute("""CREATE TABLE delete_batches (
+                        id INTEGER PRIMARY KEY,
+                        deleted_at TEXT NOT NULL,
+                        description TEXT NOT NULL,
+                        row_count INTEGER NOT NULL)""")
+    conn.execute("""CREATE TABLE deleted_levels (
+                        batch_id INTEGER NOT NULL REFERENCES delete_batches (id),
+                        ticker_id INTEGER NOT NULL,
+                        day INTEGER NOT NULL,
+                        label_id INTEGER NOT NULL,
+                        value REAL,
+                        code_hash INTEGER,
+                        PRIMARY KEY (batch_id, ticker_id, day, label_id)) WITHOUT ROWID""")
+
+def _migrate_v8_scoped_forget_import(conn):
+    """
+    v8：gex_levels_forget_import 改為只忘記被刪除列本身的 (ticker, 日) TV Code 與該 ticker 的工作表進度；
+    檔案匯入紀錄改由刪除的呼叫端每次刪除清一次（_forget_file_imports），不再每刪一列就清整張表
+    stock_data 相容 view 的刪除不經過呼叫端，改由它的觸發器自行清除
+    """
+    conn.execute("DROP TRIGGER gex_levels_forget_import")
+    conn.execute(f"""CREATE TRIGGER gex_levels_forget_import AFTER DELETE ON gex_levels
+                     WHEN OLD.label_id NOT IN (SELECT id FROM labels WHERE name IN {OHLC_LABELS})
+                     BEGIN
+                         DELETE FROM imported_codes WHERE ticker_id = OLD.ticker_id AND day = OLD.day;
+                         DELETE FROM sheet_sync_state
+                         WHERE ticker = (SELECT symbol FROM tickers WHERE id = OLD.ticker_id);
+                     END""")
+    conn.execute("DROP TRIGGER stock_data_delete")
+    conn.execute(f"""CREATE TRIGGER stock_data_delete INSTEAD OF DELETE ON stock_data
+                     BEGIN
+                         DELETE FROM gex_levels WHERE id = OLD.id;
+                         DELETE FROM import_manifest WHERE OLD.label NOT IN {OHLC_LABELS};
+                     END""")
+
+COMPACT_SCHEMA_VERSION = 2
+_MIGRATIONS = [
+    _migrate_v1_unique_key,
+    _migrate_v2_compact_schema,
+    _migrate_v3_daily_levels,
+    _migrate_v4_import_manifest,
+    _migrate_v5_sheet_sync_state,
+    _migrate_v6_symbol_map,
+    _migrate_v7_delete_journal,
+    _migrate_v8_scoped_forget_import,
+]
+
+def _migrate_db(conn):
+    """依序套用 user_version 之後的升級步驟，每一步一個交易；回傳這次套用的版本"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for target in range(version + 1, len(_MIGRATIONS) + 1):
+        with conn:
+            _MIGRATIONS[target - 1](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        applied.append(target)
+        print(f"ℹ️  資料庫結構已升級至 v{target}")
+    return applied
+
+def _refresh_daily_levels(conn, keys_sql=None, params=()):
+    """
+    依 gex_levels 重算 daily_levels 中受影響的列
+    keys_sql：回傳 (ticker_id, day) 的 SELECT；None 代表整張表重建
+    需在呼叫端的交易內執行，且須在 gex_levels 寫入 / 刪除之後呼叫
+    """
+    pivot = ", ".join(f"MAX(CASE WHEN l.name = '{label}' THEN g.value END)"
+                      for label in WIDE_COLUMNS)
+    names = ", ".join(f"'{label}'" for label in WIDE_COLUMNS)
+    where = f"l.name IN ({names})"
+    if keys_sql is None:
+        conn.execute("DELETE FROM daily_levels")
+    else:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS wide_keys (ticker_id INTEGER, day INTEGER, "
+                     "PRIMARY KEY (ticker_id, day)) WITHOUT ROWID")
+        conn.execute("DELETE FROM temp.wide_keys")
+        conn.execute(f"INSERT OR IGNORE INTO temp.wide_keys {keys_sql}", params)
+        conn.execute("""DELETE FROM daily_levels
+                        WHERE (ticker_id, day) IN (SELECT ticker_id, day FROM temp.wide_keys)""")
+        where += " AND (g.ticker_id, g.day) IN (SELECT ticker_id, day FROM temp.wide_keys)"
+    conn.execute(f"""INSERT INTO daily_levels (ticker_id, day, {", ".join(WIDE_COLUMNS.values())})
+                     SELECT g.ticker_id, g.day, {pivot}
+                     FROM gex_levels g JOIN labels l ON l.id = g.label_id
+                     WHERE {where}
+                     GROUP BY g.ticker_id, g.day""")
+
+def _prune_tv_codes(conn):
+    """刪除已沒有任何資料列引用的 TV Code 原文（被覆蓋或刪除後留下的）；需在呼叫端的交易內執行"""
+    conn.execute("""DELETE FROM tv_codes WHERE hash NOT IN (
+                        SELECT code_hash FROM gex_levels WHERE code_hash IS NOT NULL
+                        UNION SELECT code_hash FROM deleted_levels WHERE code_hash IS NOT NULL)""")
+
+def get_latest_dates() -> typing.Dict[str, datetime.date]:
+    """
+    一次查出每個 ticker 的最新日期 {ticker: datetime.date}（沒有資料的 ticker 不在結果中）
+    每個 ticker 各以唯一索引找 MAX(day)，不必掃過整張 gex_levels
+    """
+    with get_db().reader() as conn:
+        return {symbol: _day_to_date(day) for symbol, day in conn.execute(
+            """SELECT t.symbol, (SELECT MAX(day) FROM gex_levels WHERE ticker_id = t.id) AS day
+               FROM tickers t WHERE day IS NOT NULL""")}
+
+# 已存在就覆蓋 value / code_hash
+ON_CONFLICT_OVERWRITE = """ON CONFLICT (ticker_id, day, label_id) DO UPDATE
+                           SET value = excluded.value, code_hash = excluded.code_hash"""
+
+def _write_staged(conn, table, where="1", on_conflict=ON_CONFLICT_OVERWRITE):
+    """
+    把暫存表 table (ticker, day, label, value, code_hash, code) 中符合 where 的資料
+    寫入正規化資料表：先補齊 tickers / labels / tv_codes，再寫入 gex_levels
+    """
+    conn.execute(f"INSERT OR IGNORE INTO tickers (symbol) SELECT DISTINCT ticker FROM {table}")
+    conn.execute(f"INSERT OR IGNORE INTO labels (name) SELECT DISTINCT label FROM {table}")
+    conn.execute(f"""INSERT OR IGNORE INTO tv_codes (hash, code)
+                     SELECT code_hash, code FROM {table} WHERE code_hash IS NOT NULL""")
+    conn.execute(f"""INSERT INTO gex_levels (ticker_id, day, label_id, value, code_hash)
+                     SELECT t.id, s.day, l.id, s.value, s.code_hash
+                     FROM {table} s
+                     JOIN tickers t ON t.symbol = s.ticker
+                     JOIN labels l ON l.name = s.label
+                     WHERE {where}
+                     {on_conflict}""")
+    _refresh_daily_levels(conn, f"""SELECT DISTINCT t.id, s.day FROM {table} s
+                                    JOIN tickers t ON t.symbol = s.ticker""")
+
+def ask_bulk_conflict_resolution(conflicts, partial=False) -> str:
+    """
+    匯入前的重複資料彙總視窗：一次列出各 ticker / 各 label 的重複筆數，
+    回傳 "overwrite"、"skip" 或 "cancel"
+    conflicts: [(ticker, label, 筆數), ...]
+    partial：串流匯入中途的批次，清單只涵蓋目前這一批，選擇會直接套用到之後的批次
+    """
+    by_ticker, by_label = {}, {}
+    for ticker, label, count in conflicts:
+        by_ticker[ticker] = by_ticker.get(ticker, 0) + count
+        by_label[label] = by_label.get(label, 0) + count
+    total = sum(by_ticker.values())
+
+    result = {"choice": "cancel"}
 
     def on_choice(choice):
         result["choice"] = choice
-        result["apply_all"] = apply_var.get()
         dialog.destroy()
 
-    # 使用 ttkbootstrap 的 Toplevel 來承接主視窗的主題
     dialog = tk.Toplevel(root)
     dialog.title("資料衝突")
-    dialog.geometry("600x180")
+    dialog.geometry("600x420")
     dialog.grab_set()
 
-    # 標籤也改用 ttk.Label，確保跟隨 darkly 主題
-    ttk.Label(dialog, text=f"{ticker} - {date} - {label} 已存在。\n是否要覆蓋？",
-              padding=(20, 10)).pack()
-
-    apply_var = tk.BooleanVar()
-    # Checkbutton 改用 ttk.Checkbutton，並加上 bootstyle
-    ttk.Checkbutton(dialog, text="套用至所有後續重複資料",
-                    variable=apply_var,
-                    bootstyle="secondary").pack()
+    if partial:
+        message = (f"目前這一批中有 {total} 筆資料已存在於資料庫（{len(by_ticker)} 個 ticker）。\n"
+                   "檔案尚未讀完：選擇會直接套用到之後各批的重複資料，不會再詢問；\n"
+                   "取消時先前批次已寫入的資料會保留。\n請選擇要全部覆蓋或全部跳過：")
+    else:
+        message = (f"共有 {total} 筆資料已存在於資料庫（{len(by_ticker)} 個 ticker）。\n"
+                   "請選擇要全部覆蓋或全部跳過：")
+    ttk.Label(dialog, text=message, padding=(20, 10)).pack()
+
+    lists = ttk.Frame(dialog, padding=(10, 0))
+    lists.pack(fill=BOTH, expand=True)
+    for col, (title, counts) in enumerate((("Ticker", by_ticker), ("Label", by_label))):
+        view = ttk.Treeview(lists, columns=(title, "count"), show="headings", height=10)
+        view.heading(title, text=title)
+        view.heading("count", text="重複筆數")
+        view.column("count", width=80, anchor=E)
+        for name, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+            view.insert("", "end", values=(name, count))
+        view.grid(row=0, column=col, sticky=NSEW, padx=5)
+        lists.columnconfigure(col, weight=1)
+    lists.rowconfigure(0, weight=1)
 
     button_frame = ttk.Frame(dialog)
     button_frame.pack(pady=10)
-
-    # 三個按鈕都改用 ttk.Button，並指定不同的 bootstyle
-    ttk.Button(button_frame, text="覆蓋", width=10,
+    ttk.Button(button_frame, text="全部覆蓋", width=10,
                bootstyle="success", command=lambda: on_choice("overwrite")
                ).pack(side="left", padx=5)
-    ttk.Button(button_frame, text="跳過", width=10,
+    ttk.Button(button_frame, text="全部跳過", width=10,
                bootstyle="warning", command=lambda: on_choice("skip")
                ).pack(side="left", padx=5)
-    ttk.Button(button_frame, text="取消", width=10,
+    ttk.Button(button_frame, text="取消匯入", width=10,
                bootstyle="danger", command=lambda: on_choice("cancel")
                ).pack(side="left", padx=5)
 
     dialog.wait_window()
-    return result
-
-# 插入數據
-def insert_data(ticker, date, label, value):
-    global user_conflict_choice, apply_to_all, cancel_import, inserted_count
-    if cancel_import:
-        return
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    return result["choice"]
 
-    cursor.execute("SELECT id FROM stock_data WHERE ticker=? AND date=? AND label=?", (ticker, date, label))
-    existing = cursor.fetchone()
-
-    if existing:
-        if not apply_to_all:
-            res = ask_conflict_resolution(ticker, date, label)
-            user_conflict_choice = res["choice"]
-            apply_to_all = res["apply_all"]
-
-        if user_conflict_choice == "cancel":
-            cancel_import = True
-            conn.close()
+# --- 匯入寫入器 ---
+class ImportSession:
+    """
+    匯入共用的寫入器：使用 Database 的寫入連線，每個 session 有自己的暫存表
+    - add() 先暫存在記憶體，flush() 以 executemany 寫進暫存表（每個檔案 / 工作表一次）
+    - 全部解析完才呼叫 finish()：以一次查詢找出所有與資料庫重複的資料，
+      跳出一個彙總視窗決定覆蓋 / 跳過 / 取消，再以單一交易整批寫入
+    - 同一次匯入內的重複資料以最後出現的為準
+    - 指定 batch_size 為串流模式：每累積 batch_size 筆就直接寫入資料庫，
+      記憶體與暫存表都不會隨檔案變大；重複資料只在第一次遇到時詢問，
+      之後的批次沿用同一個選擇（先前批次寫入的資料也視為已存在）
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, db: typing.Optional[Database] = None,
+                 batch_size: typing.Optional[int] = None):
+        self.db = db or get_db()
+        self.batch_size = batch_size
+        self.choice = None
+        self.skipped_conflicts = 0      # 選擇「跳過」而沒有寫入的重複筆數
+        self._known_codes = None
+        self.table = f"temp.import_staging_{next(self._ids)}"
+        with self.db.writer() as conn:
+            conn.execute(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                                 seq INTEGER PRIMARY KEY,
+                                 ticker TEXT NOT NULL,
+                                 day INTEGER NOT NULL,
+                                 label TEXT NOT NULL,
+                                 value REAL,
+                                 code_hash INTEGER,
+                                 code TEXT)""")
+        self.pending = []
+
+    def add(self, ticker, date, label, value):
+        if cancel_import:
             return
-        elif user_conflict_choice == "overwrite":
-            cursor.execute("UPDATE stock_data SET value=? WHERE id=?", (value, existing[0]))
-            inserted_count += 1
-        elif user_conflict_choice == "skip":
-            conn.close()
+        day = _day_number(date)
+        if day is None:
             return
-    else:
-        cursor.execute("INSERT INTO stock_data (ticker, date, label, value) VALUES (?, ?, ?, ?)", (ticker, date, label, value))
-        inserted_count += 1
+        if label == TV_CODE_LABEL:
+            self.pending.append((ticker, day, label, None, _code_hash(value), value))
+        else:
+            self.pending.append((ticker, day, label, value, None, None))
+        if self.batch_size and len(self.pending) >= self.batch_size:
+            self.finish(final=False)
+
+    def known_codes(self) -> typing.Set[int]:
+        """先前已匯入的 TV Code（code_key），第一次用到時才載入"""
+        if self._known_codes is None:
+            with self.db.reader() as conn:
+                self._known_codes = {h for (h,) in conn.execute("SELECT hash FROM imported_codes")}
+        return self._known_codes
+
+    def add_rows(self, rows):
+        """加入多筆 (ticker, date, label, value)"""
+        for row in rows:
+            self.add(*row)
+
+    def add_frame(self, rows: pd.DataFrame):
+        """一次加入 parse_tv_code_frame 產生的長表（ticker / date / label / value）"""
+        if cancel_import or rows.empty:
+            return
+        days = rows["date"].map({d: _day_number(d) for d in rows["date"].unique()})
+        is_code = rows["label"].eq(TV_CODE_LABEL).tolist()
+        values = rows["value"].tolist()
+        self.pending.extend(
+            (ticker, day, label, None, _code_hash(value), value) if code
+            else (ticker, day, label, value, None, None)
+            for ticker, day, label, value, code
+            in zip(rows["ticker"].tolist(), days.tolist(), rows["label"].tolist(), values, is_code)
+            if day is not None and not pd.isna(day))
+        if self.batch_size and len(self.pending) >= self.batch_size:
+            self.finish(final=False)
+
+    def flush(self):
+        """把記憶體中的資料搬進暫存表，尚未寫入資料庫"""
+        rows, self.pending = self.pending, []
+        if not rows or cancel_import:
+            return
+        with self.db.writer() as conn:
+            conn.executemany(
+                f"""INSERT INTO {self.table} (ticker, day, label, value, code_hash, code)
+                    VALUES (?, ?, ?, ?, ?, ?)""", rows)
+
+    def conflict_summary(self):
+        """一次查出暫存資料與資料庫的重複筆數，依 (ticker, label) 分組"""
+        with self.db.writer() as conn:
+            return conn.execute(f"""
+                SELECT s.ticker, s.label, COUNT(*)
+                FROM (SELECT DISTINCT ticker, day, label FROM {self.table}) s
+                JOIN tickers t ON t.symbol = s.ticker
+                JOIN labels l ON l.name = s.label
+                JOIN gex_levels g ON g.ticker_id = t.id AND g.day = s.day AND g.label_id = l.id
+                GROUP BY s.ticker, s.label""").fetchall()
+
+    def finish(self, final=True):
+        """
+        詢問重複資料的處理方式後整批寫入，回傳是否有寫入
+        （取消時不寫入任何資料並設定 cancel_import）
+        final=False：串流模式中途的批次，之後還有資料
+        """
+        global user_conflict_choice, cancel_import, inserted_count
+        self.flush()
+        try:
+            if cancel_import:
+                return False
+            with self.db.writer() as conn:
+                total = conn.execute(
+                    f"SELECT COUNT(*) FROM (SELECT 1 FROM {self.table} GROUP BY ticker, day, label)"
+                ).fetchone()[0]
+            if not total:
+                return False
+
+            conflicts = self.conflict_summary()
+            n_conflicts = sum(c for _, _, c in conflicts)
+            choice = "overwrite"
+            if n_conflicts:
+                choice = self.choice or ask_bulk_conflict_resolution(conflicts, partial=not final)
+                user_conflict_choice = self.choice = choice
+                if choice == "cancel":
+                    cancel_import = True
+                    return False
+
+            with self.db.writer() as conn:
+                _write_staged(
+                    conn, self.table,
+                    where=f"s.seq IN (SELECT MAX(seq) FROM {self.table} GROUP BY ticker, day, label)",
+                    on_conflict=ON_CONFLICT_OVERWRITE if choice == "overwrite"
+                    else "ON CONFLICT (ticker_id, day, label_id) DO NOTHING")
+                self._record_codes(conn)
+            if choice == "overwrite":
+                inserted_count += total
+            else:
+                inserted_count += total - n_conflicts
+                self.skipped_conflicts += n_conflicts
+            return True
+        finally:
+            with self.db.writer() as conn:
+                conn.execute(f"DELETE FROM {self.table}")
+
+    def _record_codes(self, conn):
+        """
+        把這批實際寫入的 TV Code 記進 imported_codes：資料庫中該 (ticker, 日) 的 TV Code 就是這一筆
+        （選擇跳過而沒寫入的不記，之後重新匯入時仍可選擇覆蓋）
+        """
+        keys = [(gex_parser.code_key(day, code), ticker_id, day) for ticker_id, day, code in
+                conn.execute(f"""SELECT DISTINCT t.id, s.day, s.code FROM {self.table} s
+                                 JOIN tickers t ON t.symbol = s.ticker
+                                 JOIN labels l ON l.name = s.label
+                                 JOIN gex_levels g ON g.ticker_id = t.id AND g.day = s.day
+                                                  AND g.label_id = l.id AND g.code_hash = s.code_hash
+                                 WHERE s.code IS NOT NULL""")]
+        conn.executemany("INSERT OR REPLACE INTO imported_codes (hash, ticker_id, day) VALUES (?, ?, ?)",
+                         keys)
+        if self._known_codes is not None:
+            self._known_codes.update(k for k, _, _ in keys)
+
+    def close(self):
+        with self.db.writer() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+
+# --- 匯入紀錄（import_manifest） ---
+def _file_digest(file_path: str, limit: typing.Optional[int] = None) -> str:
+    """檔案內容（或前 limit 個位元組）的雜湊"""
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = limit
+    with open(file_path, "rb") as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+def plan_file_import(file_path: str, resumable: bool = False
+                     ) -> typing.Optional[gex_parser.TxtCursor]:
+    """
+    依匯入紀錄決定檔案要從哪裡開始讀；回傳 None 代表內容沒變，整個檔案略過
+    - 大小與修改時間都相同，或內容雜湊相同 → 略過
+    - resumable（TXT）且上次讀到的位置之前的內容沒變 → 從該位置與當時的日期接續
+    - 其他情況從頭匯入（已匯入過的 TV Code 仍會在解析前略過）
+    """
+    path = os.path.abspath(file_path)
+    with get_db().reader() as conn:
+        entry = conn.execute("""SELECT size, mtime_ns, content_hash, byte_offset, offset_hash,
+                                       last_date
+                                FROM import_manifest WHERE path = ?""", (path,)).fetchone()
+    if entry is None:
+        return gex_parser.TxtCursor.start(file_path)
+    size, mtime_ns, content_hash, offset, offset_hash, last_date = entry
+    stat = os.stat(file_path)
+    if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+        return None
+    if stat.st_size == size and _file_digest(file_path) == content_hash:
+        with get_db().writer() as conn:
+            conn.execute("UPDATE import_manifest SET mtime_ns = ? WHERE path = ?",
+                         (stat.st_mtime_ns, path))
+        return None
+    if resumable and stat.st_size >= offset and _file_digest(file_path, offset) == offset_hash:
+        return gex_parser.TxtCursor(offset, last_date)
+    return gex_parser.TxtCursor.start(file_path)
+
+def record_file_import(file_path: str, cursor: typing.Optional[gex_parser.TxtCursor] = None):
+    """匯入成功後記下檔案狀態；cursor 為 TXT 的讀取進度（None 代表整個檔案都已處理）"""
+    stat = os.stat(file_path)
+    content_hash = _file_digest(file_path)
+    offset = stat.st_size if cursor is None else cursor.offset
+    offset_hash = content_hash if offset == stat.st_size else _file_digest(file_path, offset)
+    with get_db().writer() as conn:
+        conn.execute("""INSERT INTO import_manifest (path, size, mtime_ns, content_hash, byte_offset,
+                                                     offset_hash, last_date, imported_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                        ON CONFLICT (path) DO UPDATE SET
+                            size = excluded.size, mtime_ns = excluded.mtime_ns,
+                            content_hash = excluded.content_hash, byte_offset = excluded.byte_offset,
+                            offset_hash = excluded.offset_hash, last_date = excluded.last_date,
+                            imported_at = excluded.imported_at""",
+                     (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, content_hash,
+                      offset, offset_hash, cursor.current_date if cursor else None))
 
-    conn.commit()
-    conn.close()
 
 # --- 功能函式 ---
-def parse_gex_code(orig_date: str, gex_code: str) -> typing.Optional[str]:
+def parse_gex_code(orig_date: str, gex_code: str,
+                   session: typing.Optional[ImportSession] = None) -> typing.Optional[str]:
     """
     解析 GEX TV Code 並寫入資料庫
     - 若 TV Code 自帶日期，優先使用
     - 解析前就先把 TV Code 原文存進資料庫（label = 'TV Code'）
+    - 傳入 session 時只暫存到 session，由呼叫端決定何時 flush；
+      未傳入則自行開一個 session 並立即寫入
     """
     global cancel_import
     if cancel_import:
         return None
 
-    # 內嵌日期 > Date 欄
-    embedded = _extract_date_from_tv_code(gex_code)
-    date_str = embedded.isoformat() if embedded else orig_date.split(" ")[0]
-
-    # 取 ticker（第一個 XXX:）
-    m = re.search(r"([A-Za-z\.]+):", gex_code)
-    if not m:
+    parsed = gex_parser.parse_code(orig_date, gex_code)
+    if parsed is None:
         messagebox.showwarning("格式錯誤", f"無法解析 GEX TV Code：{gex_code}")
         return None
-    ticker = m.group(1).upper()
+    ticker, rows = parsed
+
+    own_session = session is None
+    if own_session:
+        session = ImportSession()
 
-    # 👉 **先把原文存進去，之後任何匯入方式都不用再管**
-    insert_data(ticker, date_str, "TV Code", gex_code.strip())
+    # 👉 **第一列就是 TV Code 原文，之後任何匯入方式都不用再管**
+    session.add_rows(rows)
 
-    code_body = gex_code[m.end():].strip()
-    elements = re.split(r',\s*', code_body)
-    i = 0
-    while i < len(elements) - 1:
-        labels = elements[i].strip()
+    if own_session:
         try:
-            value = float(elements[i + 1].strip())
-            for label in labels.split('&'):
-                insert_data(ticker, date_str, label.strip(), value)
-                if cancel_import:
-                    return None
-            i += 2
-        except ValueError:
-            i += 1
+            session.finish()
+        finally:
+            session.close()
+        if cancel_import:
+            return None
     return ticker
 
 def single_entry():
-    global user_conflict_choice, apply_to_all, cancel_import, inserted_count
+    global user_conflict_choice, cancel_import, inserted_count
     user_conflict_choice = None
-    apply_to_all = False
     cancel_import = False
     inserted_count = 0
 
@@ -219,202 +881,418 @@ def single_entry():
         messagebox.showinfo("完成", f"成功寫入 {inserted_count} 筆資料。")
 
 
-def bulk_import():
-    global user_conflict_choice, apply_to_all, cancel_import, inserted_count
-    user_conflict_choice = None
-    apply_to_all = False
-    cancel_import = False
-    inserted_count = 0
+# 選取的 TXT 合計超過此大小就改用串流匯入，每批寫入的筆數
+STREAM_IMPORT_BYTES = 20 * 2**20
+STREAM_BATCH_ROWS = 5000
 
-    # 改用 askopenfilenames 支援多選
-    file_paths = filedialog.askopenfilenames(filetypes=[("Text Files", "*.txt"), ("CSV Files", "*.csv")])
-    if not file_paths:
-        return
+class ImportProgress:
+    """
+    匯入進度視窗：進度條 + 目前處理狀況，按「取消」會停止後續匯入
+    指定 cancel 時按「取消」只設定這個 Event，不動匯入共用的 cancel_import
+    """
 
+    def __init__(self, title: str, maximum: float, cancel: typing.Optional[threading.Event] = None):
+        self.cancel_event = cancel
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.geometry("420x130")
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.window.grab_set()                           # 匯入期間不能操作主視窗
+        self.label = ttk.Label(self.window, text="準備中…", padding=(20, 10))
+        self.label.pack(fill=X)
+        self.bar = ttk.Progressbar(self.window, maximum=maximum or 1, length=380)
+        self.bar.pack(padx=20)
+        ttk.Button(self.window, text="取消", bootstyle="danger",
+                   command=self.cancel).pack(pady=10)
+        self._last_update = 0.0
+
+    def cancel(self):
+        global cancel_import
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        else:
+            cancel_import = True
+
+    def update(self, value: float, text: str, force: bool = False):
+        """更新進度；最多每 0.1 秒重繪一次，避免拖慢匯入"""
+        now = time.monotonic()
+        if not force and now - self._last_update < 0.1:
+            return
+        self._last_update = now
+        self.bar["value"] = value
+        self.label["text"] = text
+        self.window.update()
+
+    def close(self):
+        self.window.destroy()
+
+def _until_error(items: typing.Iterator, errors: list) -> typing.Iterator:
+    """逐項產生 items；items 本身拋出例外（讀檔、解碼失敗）時記進 errors 並結束，迴圈本體的例外不受影響"""
+    try:
+        yield from items
+    except Exception as e:
+        errors.append(e)
+
+def import_txt_files(file_paths, session: ImportSession,
+                     progress: typing.Optional[ImportProgress] = None):
+    """
+    依序串流解析 TXT 檔並交給 session；每個檔案結束時 flush 一次
+    - 依匯入紀錄略過沒變的檔案，只在尾端附加的檔案從上次的位置接續
+    - 已匯入過的 TV Code 在解析前就略過
+    回傳 ([(讀完的檔案, 讀取進度)], 略過的檔案數)
+    """
+    done_bytes = 0
+    codes = 0
+    finished, skipped = [], 0
+    known = session.known_codes()
     for file_path in file_paths:
         if cancel_import:
             break
-
-        # 嘗試從檔名解析日期 (例如: 20251212_TV Code.txt)
         filename = os.path.basename(file_path)
-        default_date = None
-        date_match = re.search(r"(\d{8})", filename)
-        if date_match:
-            try:
-                default_date = pd.to_datetime(date_match.group(1), format='%Y%m%d').date().isoformat()
-            except:
-                pass
-        
-        current_date = default_date
+        cursor = plan_file_import(file_path, resumable=True)
+        if cursor is None:
+            skipped += 1
+            done_bytes += os.path.getsize(file_path)
+            continue
+        # 只攔截讀取錯誤；串流模式中途寫入資料庫的錯誤（含重複資料視窗）照常往外拋
+        errors = []
+        for use_date, line, file_bytes in _until_error(gex_parser.iter_txt_codes(file_path, cursor), errors):
+            if cancel_import:
+                break
+            codes += 1
+            if not gex_parser.is_known_code(use_date, line, known):
+                parse_gex_code(use_date, line, session)
+            if progress:
+                progress.update(done_bytes + file_bytes,
+                                f"{filename}\n已讀取 {codes} 筆 TV Code，已寫入 {inserted_count} 筆")
+        else:
+            if errors:
+                print(f"讀取檔案失敗 {file_path}: {errors[0]}")
+            else:
+                finished.append((file_path, cursor))
+        done_bytes += os.path.getsize(file_path)
+        session.flush()                                  # 每個檔案搬進暫存表一次
+    return finished, skipped
 
+class ParallelTxtImport:
+    """
+    多檔 TXT 匯入：每個檔案交給一個子程序以 gex_parser.parse_txt_file 解析，
+    Tk 執行緒以 after 輪詢，依檔案順序把結果交給同一個 ImportSession（單一寫入者），
+    所以重複資料的處理與逐檔匯入完全相同，解析期間 GUI 也不會卡住
+    匯入紀錄的判斷在送出前完成；已匯入過的 TV Code 由子程序在解析前略過
+    子程序只呼叫 gex_parser 的函式；fork 啟動（Linux）時直接沿用主程序已載入的模組，
+    spawn 啟動（Windows / macOS）時會重新載入主程式（略過套件檢查，但 Tk / plotly 仍會 import，
+    不會建立視窗），子程序的啟動因此較慢，檔案少時平行解析不一定划算
+    """
+    POLL_MS = 50
+    APPLY_BUDGET = 0.05                                  # 每次輪詢最多寫入幾秒，讓出 Tk 事件迴圈
+
+    def __init__(self, file_paths, session: ImportSession, progress: ImportProgress,
+                 on_done: typing.Callable[[typing.List[str], list, int], None]):
+        self.session = session
+        self.progress = progress
+        self.on_done = on_done
+        self.invalid = []
+        self.finished = []
+        self.next_index = 0
+        self.file_paths, self.futures = [], []
+        self.skipped = 0
+        plans = [(path, plan_file_import(path, resumable=True)) for path in file_paths]
+        todo = [(path, cursor) for path, cursor in plans if cursor is not None]
+        self.skipped = len(plans) - len(todo)
+        self.executor = None
+        if todo:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(len(todo), os.cpu_count() or 1),
+                initializer=gex_parser.set_known_codes, initargs=(frozenset(session.known_codes()),))
+            self.file_paths = [path for path, _ in todo]
+            self.futures = [self.executor.submit(gex_parser.parse_txt_file, path, cursor)
+                            for path, cursor in todo]
+        self.progress.bar["maximum"] = max(len(self.futures), 1)
+        root.after(self.POLL_MS, self._poll)
+
+    def _apply(self, index: int):
+        path = self.file_paths[index]
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                lines = [line.strip() for line in f.readlines() if line.strip()]
+            rows, invalid, error, cursor = self.futures[index].result()
+        except Exception as e:                           # 子程序異常終止等
+            rows, invalid, error, cursor = [], [], str(e), None
+        if error:
+            print(f"讀取檔案失敗 {path}: {error}")
+        else:
+            self.finished.append((path, cursor))
+        self.invalid.extend(invalid)
+        self.session.add_rows(rows)
+        self.session.flush()
 
-            for line in lines:
-                if cancel_import:
-                    break
-                
-                # 判斷是否為 GEX Code 行 (包含 ":")
-                if ":" in line:
-                    # 若無 current_date，使用當日作為備案 (parse_gex_code 會優先嘗試內嵌日期)
-                    use_date = current_date if current_date else datetime.date.today().isoformat()
-                    parse_gex_code(use_date, line)
-                else:
-                    # 嘗試解析為日期行 (舊格式相容)
-                    try:
-                        potential_date = line.split("_")[0]
-                        pd.to_datetime(potential_date)
-                        current_date = potential_date
-                    except:
-                        pass
-        except Exception as e:
-            print(f"讀取檔案失敗 {file_path}: {e}")
+    def _poll(self):
+        global cancel_import
+        try:
+            deadline = time.monotonic() + self.APPLY_BUDGET
+            while (self.next_index < len(self.futures) and not cancel_import
+                   and self.futures[self.next_index].done() and time.monotonic() < deadline):
+                self._apply(self.next_index)
+                self.next_index += 1
+            self.progress.update(self.next_index,
+                                 f"已解析 {self.next_index}/{len(self.futures)} 個檔案，"
+                                 f"已寫入 {inserted_count} 筆")
+        except Exception:
+            traceback.print_exc()
+            cancel_import = True
+
+        if cancel_import or self.next_index == len(self.futures):
+            if self.executor:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            self.on_done(self.invalid, self.finished, self.skipped)
+        else:
+            root.after(self.POLL_MS, self._poll)
 
+def _finish_txt_import(session: ImportSession, progress: ImportProgress, invalid=(),
+                       finished=(), skipped=0):
+    """
+    TXT 匯入收尾：處理重複並寫入剩餘資料、記錄匯入紀錄、關閉進度視窗、回報結果
+    有重複資料被跳過時不記錄匯入紀錄，之後重新匯入同一檔案仍可選擇覆蓋
+    """
+    try:
+        progress.update(progress.bar["maximum"], f"寫入資料庫中…（{inserted_count} 筆）", force=True)
+        session.finish()                                 # 全部解析完才處理重複並寫入
+        if not cancel_import and not session.skipped_conflicts:
+            for file_path, cursor in finished:
+                record_file_import(file_path, cursor)
+    finally:
+        session.close()
+        progress.close()
+
+    if invalid:
+        preview = "\n".join(invalid[:5])
+        messagebox.showwarning("格式錯誤", f"{len(invalid)} 筆 GEX TV Code 無法解析，例如：\n{preview}")
+    note = f"\n略過 {skipped} 個自上次匯入後沒有變更的檔案。" if skipped else ""
     if cancel_import:
         messagebox.showinfo("已取消", f"成功寫入 {inserted_count} 筆資料。")
     else:
         populate_ticker_dropdown()
         refresh_table()
-        messagebox.showinfo("匯入完成", f"成功寫入 {inserted_count} 筆資料。")
+        messagebox.showinfo("匯入完成", f"成功寫入 {inserted_count} 筆資料。{note}")
 
-# 共用的小工具
-def _parse_date(val) -> typing.Optional[datetime.date]:
-    """將任何輸入轉成 datetime.date；轉換失敗回傳 None"""
-    ts = pd.to_datetime(val, errors="coerce")
-    return ts.date() if pd.notna(ts) else None
+def bulk_import():
+    global user_conflict_choice, cancel_import, inserted_count
+    user_conflict_choice = None
+    cancel_import = False
+    inserted_count = 0
 
-# --- 工具函式 ------------------------------------------------------------
-def _extract_date_from_tv_code(tv_code: str) -> typing.Optional[datetime.date]:
-    """
-    若 TV Code 為「TICKER YYYYMMDD hhmmss TICKER: …」格式，
-    取出中間的 YYYYMMDD 為日期；否則回傳 None
-    """
-    m = re.match(r'^[A-Za-z\.]+\s+(\d{8})\b', tv_code)
-    if m:
-        return pd.to_datetime(m.group(1), format='%Y%m%d').date()
-    return None
+    # 改用 askopenfilenames 支援多選
+    file_paths = filedialog.askopenfilenames(filetypes=[("Text Files", "*.txt"), ("CSV Files", "*.csv")])
+    if not file_paths:
+        return
+
+    # 大檔改用串流模式：邊讀邊以固定批次寫入，記憶體不隨檔案大小增加
+    total_bytes = sum(os.path.getsize(p) for p in file_paths)
+    streaming = total_bytes > STREAM_IMPORT_BYTES
+    session = ImportSession(batch_size=STREAM_BATCH_ROWS if streaming else None)
+
+    # 多檔：子程序平行解析，完成後由 ParallelTxtImport 呼叫收尾
+    if len(file_paths) > 1:
+        progress = ImportProgress("匯入 TXT", len(file_paths))
+        ParallelTxtImport(file_paths, session, progress,
+                          on_done=lambda invalid, finished, skipped: _finish_txt_import(
+                              session, progress, invalid, finished, skipped))
+        return
+
+    progress = ImportProgress("匯入 TXT", total_bytes)
+    try:
+        finished, skipped = import_txt_files(file_paths, session, progress)
+    except Exception:
+        session.close()
+        progress.close()
+        raise
+    _finish_txt_import(session, progress, finished=finished, skipped=skipped)
 
 # 先集中定義允許匯入的欄位
 # ALLOWED_COLS = ['Open', 'High', 'Low', 'Close', 'TV Code']
 ALLOWED_COLS = ['TV Code']
 
-def _import_rows(ticker: str, df: pd.DataFrame, latest_date=None):
+def _import_rows(ticker: str, df: pd.DataFrame, latest_date=None,
+                 session: typing.Optional[ImportSession] = None):
     """
-    1. 每一列只看 TV Code 欄  
-    2. 日期優先順序：TV Code 內嵌 > Date 欄  
-    3. latest_date 仍用來過濾（以最終決定的日期比較）
+    1. 只看 TV Code 欄，整張工作表一次以 parse_tv_code_frame 向量化解析
+    2. 日期優先順序：TV Code 內嵌 > Date 欄
+    3. latest_date 仍用來過濾（以最終決定的日期比較），已匯入過的 TV Code 也在解析前略過
+    4. 整張工作表解析完才 flush 到 session 的暫存表，由呼叫端 finish() 寫入
     """
-    if 'TV Code' not in df.columns:
+    if 'TV Code' not in df.columns or cancel_import:
         return
 
-    for _, row in df.iterrows():
-        tv_code = str(row['TV Code']).strip()
-        if not tv_code or tv_code.lower() == 'nan':
-            continue
+    own_session = session is None
+    if own_session:
+        session = ImportSession()
+    rows, invalid = parse_tv_code_frame(df, latest_date, session.known_codes())
+    if invalid:
+        preview = "\n".join(invalid[:5])
+        messagebox.showwarning("格式錯誤",
+                               f"{ticker}：{len(invalid)} 筆 GEX TV Code 無法解析，例如：\n{preview}")
+    session.add_frame(rows)
+    session.flush()
+    if own_session:
+        try:
+            session.finish()
+        finally:
+            session.close()
 
-        # 先判斷日期
-        date_obj = _extract_date_from_tv_code(tv_code)
-        if date_obj is None:                       # 沒嵌日期 → 用 Date 欄
-            date_obj = _parse_date(row.get('Date'))
-        if date_obj is None:
-            continue
-        if latest_date and date_obj < latest_date:
-            continue
+# --- 處理 Excel 匯入邏輯 ---
+# 一個子程序至少負責幾張工作表（太少時開程序的成本比讀取還高）
+EXCEL_SHEETS_PER_WORKER = 8
 
-        parse_gex_code(date_obj.isoformat(), tv_code)
+def load_excel_sheets(file_path: str, max_workers: typing.Optional[int] = None
+                      ) -> typing.Iterator[typing.Tuple[str, pd.DataFrame]]:
+    """
+    依活頁簿順序產生 (工作表名稱, 只含 Date / TV Code 的 DataFrame)
+    工作表多時切成連續的幾段交給子程序同時讀取；只用一個程序時逐張讀取、逐張產生
+    """
+    sheet_names = gex_parser.excel_sheet_names(file_path)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    workers = max(1, min(max_workers, len(sheet_names) // EXCEL_SHEETS_PER_WORKER))
+    if workers == 1:
+        yield from gex_parser.iter_excel_sheets(file_path, sheet_names)
+        return
+
+    size = -(-len(sheet_names) // workers)
+    chunks = [sheet_names[i:i + size] for i in range(0, len(sheet_names), size)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for sheets in executor.map(gex_parser.read_excel_sheets,
+                                   itertools.repeat(file_path), chunks):
+            yield from sheets
 
-# --- 處理 Excel 匯入邏輯 ---
 def process_excel(file_path):
-    global user_conflict_choice, apply_to_all, cancel_import, inserted_count
+    global user_conflict_choice, cancel_import, inserted_count
     user_conflict_choice = None
-    apply_to_all = False
     cancel_import = False
     inserted_count = 0
+    session = ImportSession()
     try:
-        xls = pd.ExcelFile(file_path)
-        for sheet_name in xls.sheet_names:
-            df = pd.read_excel(xls, sheet_name=sheet_name)
-            _import_rows(sheet_name.strip(), df)          # ⬅️ 共用
+        for sheet_name, df in load_excel_sheets(file_path):
+            if cancel_import:
+                break
+            _import_rows(sheet_name.strip(), df, session=session)   # ⬅️ 共用
+        session.finish()
+        if not cancel_import and not session.skipped_conflicts:     # 有跳過的重複資料時下次仍要讀
+            record_file_import(file_path)
         return True
     except Exception as e:
         messagebox.showerror("匯入錯誤", str(e))
         return False
+    finally:
+        session.close()
     
 def import_from_excel():
     file_path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx *.xls")])
     if not file_path:
         return
+    if plan_file_import(file_path) is None:
+        messagebox.showinfo("略過匯入", "此檔案自上次匯入後沒有變更。")
+        return
     if process_excel(file_path):
         populate_ticker_dropdown()
         refresh_table()
         messagebox.showinfo("匯入完成", f"成功寫入 {inserted_count} 筆資料。")
 
-def auto_import_from_google():
+def _sheet_frame(sheet: sheet_fetch.SheetValues) -> typing.Optional[pd.DataFrame]:
+    """下載結果轉成 DataFrame（第一列為標題）；讀取失敗或缺少必要欄位時印出原因並回傳 None"""
+    ticker = sheet.title.strip()
+    if sheet.error is not None:
+        print(f"⚠️  工作表 '{ticker}' 讀取失敗 (ID: {sheet.spreadsheet_id})，跳過：{sheet.error}")
+        return None
+    if not sheet.values:
+        print(f"⚠️  工作表 '{ticker}' 為空，跳過")
+        return None
+
+    # 第一行作為標題
+    headers = sheet.values[0]
+    if not headers or all(not h.strip() for h in headers):
+        print(f"⚠️  工作表 '{ticker}' 標題行為空，跳過")
+        return None
+    df = pd.DataFrame(sheet.values[1:], columns=headers)
+
+    # 檢查是否有必要的欄位
+    if 'TV Code' not in df.columns:
+        print(f"⚠️  工作表 '{ticker}' 缺少 'TV Code' 欄位，跳過")
+        return None
+    return df
+
+def load_sync_marks() -> typing.Dict[typing.Tuple[str, str], sheet_fetch.SyncMark]:
+    """{(試算表 ID, 工作表名稱): SyncMark}"""
+    with get_db().reader() as conn:
+        return {(s_id, title): sheet_fetch.SyncMark(last_row, header_hash, row_hash)
+                for s_id, title, last_row, header_hash, row_hash in conn.execute(
+                    """SELECT spreadsheet_id, title, last_row, header_hash, row_hash
+                       FROM sheet_sync_state""")}
+
+def save_sync_marks(synced: typing.Sequence[typing.Tuple[sheet_fetch.SheetValues, typing.Optional[str]]]):
+    """匯入完成後記下 (工作表, 最後日期) 的同步進度"""
+    with get_db().writer() as conn:
+        conn.executemany("""INSERT INTO sheet_sync_state (spreadsheet_id, title, ticker, last_row,
+                                                          header_hash, row_hash, last_date, synced_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                            ON CONFLICT (spreadsheet_id, title) DO UPDATE SET
+                                ticker = excluded.ticker, last_row = excluded.last_row,
+                                header_hash = excluded.header_hash, row_hash = excluded.row_hash,
+                                last_date = COALESCE(excluded.last_date, last_date),
+                                synced_at = excluded.synced_at""",
+                         [(sheet.spreadsheet_id, sheet.title, sheet.title.strip(), sheet.mark.row,
+                           sheet.mark.header_hash, sheet.mark.row_hash, last_date)
+                          for sheet, last_date in synced if sheet.mark])
+
+def auto_import_from_google(client=None):
     """
-    1. 讀取試算表所有工作表
+    1. 讀取試算表所有工作表（sheet_fetch 同時下載多張，邊下載邊解析寫入）
     2. 僅匯入 Open/High/Low/Close/TV Code
     3. 針對各 ticker 只匯入 >= 資料庫最新日期 之後的資料
        （latest_date 透過 _import_rows 的 latest_date 參數過濾）
+    4. 依 sheet_sync_state 只下載上次同步之後新增的列，匯入成功後更新進度
+    client 預設依 data_sources 的模式建立（replay 時不需要 service_account.json），
+    也可直接傳入假的 client
     """
-    global user_conflict_choice, apply_to_all, cancel_import, inserted_count
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+    global user_conflict_choice, cancel_import, inserted_count
+    if client is None and data_sources.needs_credentials() and not os.path.exists(SERVICE_ACCOUNT_FILE):
         print("⚠️  未找到 service_account.json，已跳過自動匯入")
         return
 
     try:
-        # 建立 Google Sheets 連線（程式其餘部分保持原樣）:contentReference[oaicite:1]{index=1}
-        scope = ['https://spreadsheets.google.com/feeds',
-                 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
-            SERVICE_ACCOUNT_FILE, scope)
-        client = gspread.authorize(creds)
+        if client is None:
+            client = data_sources.sheets_client(SERVICE_ACCOUNT_FILE)
 
         # 覆蓋模式、重置計數
         user_conflict_choice = None
-        apply_to_all = False
         cancel_import = False
         inserted_count = 0
 
-        sheet_ids = [SHEET_ID, SHEET_ID_MINOR]
-        for s_id in sheet_ids:
-            try:
-                spreadsheet = client.open_by_key(s_id)
-            except Exception as e:
-                print(f"⚠️  無法開啟試算表 {s_id}: {e}")
-                continue
-
-            for ws in spreadsheet.worksheets():
-                ticker = ws.title.strip()
-                latest_date = get_latest_date_for_ticker(ticker)  # 可能為 None
-                
-                try:
-                    # 使用 get_all_values() 獲取所有數據，然後手動處理標題
-                    all_values = ws.get_all_values()
-                    if not all_values:
-                        print(f"⚠️  工作表 '{ticker}' 為空，跳過")
-                        continue
-                    
-                    # 第一行作為標題
-                    headers = all_values[0]
-                    # 檢查標題是否有效
-                    if not headers or all(not h.strip() for h in headers):
-                        print(f"⚠️  工作表 '{ticker}' 標題行為空，跳過")
+        session = ImportSession()
+        synced = []
+        latest_dates = get_latest_dates()      # 匯入前的快照；整批在最後才寫入，逐張查的結果也相同
+        try:
+            sheets = sheet_fetch.fetch_spreadsheets(client, [SHEET_ID, SHEET_ID_MINOR],
+                                                    load_sync_marks())
+            with contextlib.closing(sheets):
+                for sheet in sheets:
+                    if cancel_import:
+                        break
+                    df = _sheet_frame(sheet)
+                    if df is None:
+                        # 格式不符的工作表也記下進度，之後只讀新增的列；標題改好後雜湊不同會整張重讀
+                        if sheet.error is None:
+                            synced.append((sheet, None))
                         continue
-                    
-                    # 創建DataFrame，處理可能的標題重複
-                    df = pd.DataFrame(all_values[1:], columns=headers)
-                    
-                except Exception as sheet_error:
-                    print(f"⚠️  工作表 '{ticker}' 讀取失敗，跳過：{str(sheet_error)}")
-                    continue
-                
-                # 檢查是否有必要的欄位
-                if 'TV Code' not in df.columns:
-                    print(f"⚠️  工作表 '{ticker}' 缺少 'TV Code' 欄位，跳過")
-                    continue
-                    
-                _import_rows(ticker, df, latest_date)             # ⬅️ 共用
+                    ticker = sheet.title.strip()
+                    latest_date = latest_dates.get(ticker)            # 可能為 None
+                    _import_rows(ticker, df, latest_date, session)    # ⬅️ 共用
+                    header, last_row = sheet.values[0], sheet.values[-1]
+                    synced.append((sheet, last_row[header.index('Date')]
+                                   if 'Date' in header and len(sheet.values) > 1 else None))
+            session.finish()
+            if not cancel_import:
+                save_sync_marks(synced)
+        finally:
+            session.close()
 
         if inserted_count:
             populate_ticker_dropdown()
@@ -429,41 +1307,35 @@ def auto_import_from_google():
         messagebox.showerror("自動匯入錯誤", f"詳細錯誤:\n{err}")
 
 # --- 從 Google 試算表匯入（使用 Service Account 認證） ---
-def import_from_google():
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+def import_from_google(client=None):
+    if client is None and data_sources.needs_credentials() and not os.path.exists(SERVICE_ACCOUNT_FILE):
         print("⚠️  未找到 service_account.json，已取消匯入")
         return
 
     try:
         # 連線 Google Sheets
-        scope = ['https://spreadsheets.google.com/feeds',
-                 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
-            SERVICE_ACCOUNT_FILE, scope)
-        client = gspread.authorize(creds)
-        
+        if client is None:
+            client = data_sources.sheets_client(SERVICE_ACCOUNT_FILE)
+
         # Initialize counters manually
-        global user_conflict_choice, apply_to_all, cancel_import, inserted_count
+        global user_conflict_choice, cancel_import, inserted_count
         user_conflict_choice = None
-        apply_to_all = False
         cancel_import = False
         inserted_count = 0
 
-        sheet_ids = [SHEET_ID, SHEET_ID_MINOR]
-        
-        for s_id in sheet_ids:
-            try:
-                spreadsheet = client.open_by_key(s_id)
-                for ws in spreadsheet.worksheets():
-                    try:
-                        records = ws.get_all_records()
-                        df = pd.DataFrame(records)
-                        _import_rows(ws.title.strip(), df)
-                    except Exception as inner_e:
-                        print(f"⚠️  工作表 '{ws.title}' 讀取失敗 (ID: {s_id})：{inner_e}")
-            except Exception as e:
-                print(f"⚠️  無法開啟試算表 {s_id}: {e}")
-                continue
+        session = ImportSession()
+        try:
+            sheets = sheet_fetch.fetch_spreadsheets(client, [SHEET_ID, SHEET_ID_MINOR])
+            with contextlib.closing(sheets):
+                for sheet in sheets:
+                    if cancel_import:
+                        break
+                    df = _sheet_frame(sheet)                 # 讀取失敗的工作表在這裡略過
+                    if df is not None:
+                        _import_rows(sheet.title.strip(), df, session=session)
+            session.finish()
+        finally:
+            session.close()
 
         populate_ticker_dropdown()
         refresh_table()
@@ -478,61 +1350,421 @@ def import_from_google():
         err = traceback.format_exc()
         messagebox.showerror("匯入錯誤", f"詳細錯誤:\n{err}")
 
-def fetch_data(filter_ticker="", start_date=None, end_date=None):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    query = "SELECT * FROM stock_data WHERE 1=1"
-    params = []
+# 資料表格用：stock_data view 的欄位加上 day，直接查基礎表，篩選 / 排序可走 day 索引；
+# day 與 id 組成 keyset 分頁的排序鍵
+TABLE_ROWS_SQL = """SELECT g.id, t.symbol, date(g.day * 86400, 'unixepoch'), l.name,
+                           COALESCE(c.code, g.value), g.day
+                    FROM gex_levels g
+                    JOIN tickers t ON t.id = g.ticker_id
+                    JOIN labels l ON l.id = g.label_id
+                    LEFT JOIN tv_codes c ON c.hash = g.code_hash"""
+
+def _level_filter(filter_ticker="", start_date=None, end_date=None,
+                  label: typing.Optional[str] = None) -> typing.Tuple[str, list]:
+    """表格篩選條件 → (只用 gex_levels 欄位的 WHERE 子句, 參數)，計數、分頁查詢與依條件刪除共用"""
+    where, params = " WHERE 1=1", []
     if filter_ticker:
-        query += " AND ticker = ?"
+        where += " AND g.ticker_id = (SELECT id FROM tickers WHERE symbol = ?)"
         params.append(filter_ticker)
     if start_date and end_date:
-        query += " AND date BETWEEN ? AND ?"
-        params.extend([start_date, end_date])
-    query += " ORDER BY date DESC"
-    cursor.execute(query, params)
-    data = cursor.fetchall()
-    conn.close()
-    return data
+        where += " AND g.day BETWEEN ? AND ?"
+        params.extend([_day_number(start_date), _day_number(end_date)])
+    if label:
+        where += " AND g.label_id = (SELECT id FROM labels WHERE name = ?)"
+        params.append(label)
+    return where, params
+
+def fetch_data(filter_ticker="", start_date=None, end_date=None,
+               after: typing.Optional[typing.Tuple[int, int]] = None,
+               before: typing.Optional[typing.Tuple[int, int]] = None,
+               limit: typing.Optional[int] = None):
+    """
+    依日期新到舊（同一天依 id）排序的資料列 (id, ticker, date, label, value, day)
+    after / before=(day, id)：keyset 分頁，只取排在這一列之後 / 之前的列（before 依相反順序回傳）
+    """
+    where, params = _level_filter(filter_ticker, start_date, end_date)
+    order = "DESC"
+    if after is not None:
+        where += " AND (g.day, g.id) < (?, ?)"
+        params.extend(after)
+    if before is not None:
+        where += " AND (g.day, g.id) > (?, ?)"
+        params.extend(before)
+        order = "ASC"
+    query = TABLE_ROWS_SQL + where + f" ORDER BY g.day {order}, g.id {order}"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    with get_db().reader() as conn:
+        return conn.execute(query, params).fetchall()
+
+def locate_data(offset: int, filter_ticker="", start_date=None, end_date=None
+                ) -> typing.Optional[typing.Tuple[int, int]]:
+    """排序後第 offset 列的 (day, id)；只走 gex_levels 的索引，不做 JOIN"""
+    where, params = _level_filter(filter_ticker, start_date, end_date)
+    with get_db().reader() as conn:
+        return conn.execute(f"""SELECT g.day, g.id FROM gex_levels g {where}
+                                ORDER BY g.day DESC, g.id DESC LIMIT 1 OFFSET ?""",
+                            params + [offset]).fetchone()
+
+def count_data(filter_ticker="", start_date=None, end_date=None, label=None) -> int:
+    where, params = _level_filter(filter_ticker, start_date, end_date, label)
+    with get_db().reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM gex_levels g" + where, params).fetchone()[0]
+
+class BackgroundQuery:
+    """
+    在背景執行緒執行查詢、結果交回 Tk 執行緒
+    - request() 之後等 DEBOUNCE_MS 才送出，期間連續的請求合併成一次（以最後一次為準）
+    - 有新請求時，仍在執行的舊查詢經由 Database.cancellable 中止，結果丟棄
+    - 以 after 輪詢取回結果，在 Tk 執行緒呼叫 on_result(結果)；沒有查詢在跑時不輪詢
+    """
+    DEBOUNCE_MS = 120
+    POLL_MS = 20
+
+    def __init__(self, widget, on_result: typing.Callable[[typing.Any], None]):
+        self.widget = widget
+        self.on_result = on_result
+        self.generation = 0
+        self.pending = None             # 等待送出的 (fn, args)
+        self.outstanding = 0            # 已送出、還沒取回結果的查詢數
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def request(self, fn: typing.Callable, *args):
+        self.generation += 1            # 執行中的舊查詢在下一次 progress handler 檢查時中止
+        if self.pending is None:
+            self.widget.after(self.DEBOUNCE_MS, self._submit)
+        self.pending = (fn, args)
+
+    def _submit(self):
+        (fn, args), self.pending = self.pending, None
+        self.jobs.put((self.generation, fn, args))
+        self.outstanding += 1
+        if self.outstanding == 1:
+            self.widget.after(self.POLL_MS, self._poll)
+
+    def _work(self):
+        while True:
+            generation, fn, args = self.jobs.get()
+            cancelled = lambda: generation != self.generation
+            result = error = None
+            if not cancelled():
+                try:
+                    with get_db().cancellable(cancelled):
+                        result = fn(*args)
+                except Exception as e:
+                    error = e
+            self.results.put((generation, result, error))
+
+    def _poll(self):
+        while True:
+            try:
+                generation, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.outstanding -= 1
+            if generation != self.generation:
+                continue                # 已被較新的請求取代
+            if error is not None:
+                messagebox.showerror("查詢失敗", str(error))
+            else:
+                self.on_result(result)
+        if self.outstanding:
+            self.widget.after(self.POLL_MS, self._poll)
 
+class VirtualTable:
+    """
+    只放目前看得到的列的資料表格：Treeview 裡永遠只有一個視窗的列，
+    捲動時以 (day, id) keyset 分頁向資料庫取下一段，拖曳捲軸時先在索引上以 OFFSET 找到該位置的鍵；
+    總筆數另以 COUNT 查詢，記憶體與重繪時間與資料庫大小無關；
+    重新篩選（計數 + 第一頁）經 BackgroundQuery 在背景執行
+    """
+    ROW_HEIGHT = 20                     # 取不到主題的 rowheight 時使用
+
+    def __init__(self, tree, scrollbar, frame=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.frame = frame              # 標題顯示總筆數的 LabelFrame
+        self.title = frame.cget("text") if frame is not None else ""
+        self.filters = ("", None, None)
+        self.rows = []                  # 目前顯示的列（fetch_data 的格式）
+        self.offset = 0                 # 第一列在整個結果中的位置
+        self.total = 0
+        self.visible = int(tree.cget("height"))
+        self.pending_seek = None
+        self.query = BackgroundQuery(tree, self._apply)
+        scrollbar.configure(command=self._on_scrollbar)
+        for sequence, delta in (("<Button-4>", -3), ("<Button-5>", 3)):
+            tree.bind(sequence, lambda e, d=delta: self.scroll(d))
+        tree.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        tree.bind("<Next>", lambda e: self.scroll(self.visible))
+        tree.bind("<Prior>", lambda e: self.scroll(-self.visible))
+        tree.bind("<Down>", lambda e: self._step(1))
+        tree.bind("<Up>", lambda e: self._step(-1))
+        tree.bind("<Configure>", self._on_resize)
+
+    def request(self, filter_ticker="", start_date=None, end_date=None, keep_position=False):
+        """
+        在背景套用篩選條件並重新計數；連續呼叫只查最後一次，完成後才更新表格
+        keep_position 時從目前第一列（含）重新讀，用於刪除 / 匯入之後
+        """
+        self.query.request(self._load, (filter_ticker, start_date, end_date), self._top(keep_position),
+                           self.visible)
+
+    def _top(self, keep_position: bool) -> typing.Optional[typing.Tuple[int, int]]:
+        return self._key(self.rows[0]) if keep_position and self.rows else None
+
+    @staticmethod
+    def _load(filters, top, visible):
+        """計數 + 第一頁（背景執行緒也會呼叫，不碰 Tk）"""
+        total = count_data(*filters)
+        after = (top[0], top[1] + 1) if top else None
+        return filters, top, total, fetch_data(*filters, after=after, limit=visible)
+
+    def _apply(self, loaded):
+        self.filters, top, self.total, self.rows = loaded
+        self.offset = min(self.offset, max(0, self.total - len(self.rows))) if top else 0
+        self._render()
+
+    @staticmethod
+    def _key(row) -> typing.Tuple[int, int]:
+        """fetch_data 的列 → 排序鍵 (day, id)"""
+        return row[5], row[0]
+
+    def scroll(self, delta: int):
+        """往後（delta > 0）或往前捲 delta 列"""
+        if self.rows and delta > 0:
+            day, row_id = self._key(self.rows[-1])
+            rows = self.rows + fetch_data(*self.filters, after=(day, row_id), limit=delta)
+            drop = max(0, len(rows) - self.visible)
+            self.rows, self.offset = rows[drop:], self.offset + drop
+        elif self.rows and delta < 0:
+            day, row_id = self._key(self.rows[0])
+            more = fetch_data(*self.filters, before=(day, row_id), limit=-delta)
+            self.rows = (more[::-1] + self.rows)[:self.visible]
+            self.offset = max(0, self.offset - len(more))
+        self._render()
+        return "break"
+
+    def _step(self, delta: int):
+        """方向鍵移到視窗邊緣時捲一列，並把選取移到新出現的那一列"""
+        children = self.tree.get_children()
+        if not children or self.tree.focus() != children[-1 if delta > 0 else 0]:
+            return None                 # 視窗內移動，交給 Treeview 預設行為
+        self.scroll(delta)
+        children = self.tree.get_children()
+        if children:
+            item = children[-1 if delta > 0 else 0]
+            self.tree.focus(item)
+            self.tree.selection_set(item)
+        return "break"
+
+    def seek(self, fraction: float):
+        """跳到整個結果的 fraction 位置（捲軸拖曳）；連續拖曳只在閒置時查詢最後一個位置"""
+        scheduled = self.pending_seek is not None
+        self.pending_seek = fraction
+        if not scheduled:
+            self.tree.after_idle(self._seek)
+
+    def _seek(self):
+        fraction, self.pending_seek = self.pending_seek, None
+        self.offset = max(0, min(int(fraction * self.total), self.total - self.visible))
+        key = locate_data(self.offset, *self.filters)
+        self.rows = fetch_data(*self.filters, after=(key[0], key[1] + 1), limit=self.visible) if key else []
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.seek(float(amount))
+        elif action == "scroll":
+            self.scroll(int(amount) * (self.visible if unit == "pages" else 1))
+
+    def _on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or self.ROW_HEIGHT)
+        visible = max(1, event.height // row_height - 1)          # 扣掉標題列
+        if visible == self.visible:
+            return
+        self.visible = visible
+        if len(self.rows) > visible:
+            self.rows = self.rows[:visible]
+        elif self.rows and len(self.rows) < visible:
+            day, row_id = self._key(self.rows[-1])
+            self.rows += fetch_data(*self.filters, after=(day, row_id), limit=visible - len(self.rows))
+        self._render()
+
+    def _render(self):
+        selected = set(self.tree.selection())
+        focus = self.tree.focus()
+        self.tree.delete(*self.tree.get_children())
+        for row in self.rows:
+            self.tree.insert("", "end", iid=str(row[0]), values=row[1:5])
+        self.tree.selection_set([iid for iid in selected if self.tree.exists(iid)])
+        if focus and self.tree.exists(focus):
+            self.tree.focus(focus)
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, (self.offset + len(self.rows)) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+        if self.frame is not None:
+            self.frame.configure(text=f"{self.title}（共 {self.total:,} 筆）")
+
+def _forget_file_imports(conn, label_ids_sql: str, params=()):
+    """
+    刪除資料後忘記所有檔案的匯入紀錄，讓被刪掉的資料可以重新匯入（TV Code 仍依 imported_codes 略過）
+    label_ids_sql 回傳被刪除列的 label_id；只刪到 OHLC 時不影響
+    """
+    conn.execute(f"""DELETE FROM import_manifest WHERE EXISTS (
+                         SELECT 1 FROM ({label_ids_sql}) d JOIN labels l ON l.id = d.label_id
+                         WHERE l.name NOT IN {OHLC_LABELS})""", params)
+
+# 復原紀錄保留的刪除批數
+UNDO_BATCHES = 20
+
+def delete_levels(where: str, params: typing.Sequence, description: str) -> int:
+    """
+    刪除 gex_levels 中符合 where（gex_levels 別名 g）的列，整批一個交易：
+    先把原始列存進復原紀錄，再以 id 集合一次刪除，最後更新受影響的 daily_levels
+    （已匯入 TV Code / 試算表同步紀錄由 gex_levels_forget_import 觸發器一併忘記，
+    有刪到 GEX level 時檔案匯入紀錄整批清一次）
+    回傳刪除筆數
+    """
+    with get_db().writer() as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS delete_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.delete_ids")
+        count = conn.execute(f"INSERT INTO temp.delete_ids SELECT g.id FROM gex_levels g {where}",
+                             params).rowcount
+        if not count:
+            return 0
+        batch = conn.execute("""INSERT INTO delete_batches (deleted_at, description, row_count)
+                                VALUES (datetime('now', 'localtime'), ?, ?)""",
+                             (description, count)).lastrowid
+        conn.execute("""INSERT INTO deleted_levels
+                        SELECT ?, ticker_id, day, label_id, value, code_hash FROM gex_levels
+                        WHERE id IN (SELECT id FROM temp.delete_ids)""", (batch,))
+        conn.execute("DELETE FROM gex_levels WHERE id IN (SELECT id FROM temp.delete_ids)")
+        _refresh_daily_levels(conn, "SELECT DISTINCT ticker_id, day FROM deleted_levels WHERE batch_id = ?",
+                              (batch,))
+        _forget_file_imports(conn, "SELECT label_id FROM deleted_levels WHERE batch_id = ?", (batch,))
+        # 只保留最近 UNDO_BATCHES 批
+        old = "SELECT id FROM delete_batches ORDER BY id DESC LIMIT -1 OFFSET ?"
+        conn.execute(f"DELETE FROM deleted_levels WHERE batch_id IN ({old})", (UNDO_BATCHES,))
+        conn.execute(f"DELETE FROM delete_batches WHERE id IN ({old})", (UNDO_BATCHES,))
+    return count
+
+def undo_delete() -> typing.Optional[typing.Tuple[str, int, int]]:
+    """
+    還原最近一批刪除；之後又匯入同一 (ticker, 日, label) 的保留現有資料
+    回傳 (該批說明, 還原筆數, 略過筆數)，沒有可復原的刪除時回傳 None
+    """
+    with get_db().writer() as conn:
+        batch = conn.execute("""SELECT id, description, row_count FROM delete_batches
+                                ORDER BY id DESC LIMIT 1""").fetchone()
+        if batch is None:
+            return None
+        batch_id, description, count = batch
+        restored = conn.execute("""INSERT INTO gex_levels (ticker_id, day, label_id, value, code_hash)
+                                   SELECT ticker_id, day, label_id, value, code_hash FROM deleted_levels
+                                   WHERE batch_id = ?
+                                   ON CONFLICT (ticker_id, day, label_id) DO NOTHING""",
+                                (batch_id,)).rowcount
+        _refresh_daily_levels(conn, "SELECT DISTINCT ticker_id, day FROM deleted_levels WHERE batch_id = ?",
+                              (batch_id,))
+        conn.execute("DELETE FROM deleted_levels WHERE batch_id = ?", (batch_id,))
+        conn.execute("DELETE FROM delete_batches WHERE id = ?", (batch_id,))
+    return description, restored, count - restored
 
 def delete_selected():
-    selected = tree.selection()
-    if not selected:
+    # Treeview 的 iid 即資料列 id（見 VirtualTable）
+    ids = [int(item) for item in tree.selection()]
+    if not ids:
         messagebox.showwarning("錯誤", "請選擇要刪除的記錄")
         return
-    for item in selected:
-        values = tree.item(item, "values")
-        ticker, date, label, value = values
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM stock_data WHERE ticker=? AND date=? AND label=? AND value=?", (ticker, date, label, value))
-        conn.commit()
-        conn.close()
-        tree.delete(item)
+    delete_levels(f"WHERE g.id IN ({', '.join('?' * len(ids))})", ids, f"刪除選取的 {len(ids)} 筆")
+    populate_ticker_dropdown()
+    refresh_table(keep_position=True)
+
+def delete_by_filter():
+    """依篩選條件（Ticker、日期區間）加上選擇的 Label 一次刪除，刪除前顯示筆數確認"""
+    ticker = ticker_filter.get().strip()
+    start, end = start_date_filter.entry.get().strip(), end_date_filter.entry.get().strip()
+    if not ticker and not (start and end):
+        messagebox.showwarning("參數不足", "請先設定 Ticker 或起始/結束日期")
+        return
+    with get_db().reader() as conn:
+        labels = [r[0] for r in conn.execute("SELECT name FROM labels ORDER BY name")]
+
+    dialog = tk.Toplevel(root)
+    dialog.title("依條件刪除")
+    dialog.geometry("460x200")
+    dialog.grab_set()
 
+    scope = f"{ticker or '所有 ticker'}" + (f"，{start} ~ {end}" if start and end else "")
+    ttk.Label(dialog, text=f"範圍：{scope}", padding=(20, 10)).pack(anchor=W)
+    form = ttk.Frame(dialog, padding=(20, 0))
+    form.pack(fill=X)
+    ttk.Label(form, text="Label:").pack(side="left")
+    label_var = tk.StringVar(value="（全部）")
+    ttk.Combobox(form, textvariable=label_var, values=["（全部）"] + labels,
+                 state="readonly", width=24).pack(side="left", padx=5)
+    count_label = ttk.Label(dialog, padding=(20, 10))
+    count_label.pack(anchor=W)
+
+    def selected_label():
+        return None if label_var.get() == "（全部）" else label_var.get()
+
+    def update_count(*_):
+        count_label.configure(text=f"將刪除 {count_data(ticker, start, end, selected_label()):,} 筆"
+                                   "（可用「復原刪除」還原）")
+    label_var.trace_add("write", update_count)
+    update_count()
+
+    def on_delete():
+        label = selected_label()
+        where, params = _level_filter(ticker, start, end, label)
+        count = delete_levels(where, params, f"依條件刪除：{scope}" + (f"，{label}" if label else ""))
+        dialog.destroy()
+        populate_ticker_dropdown()
+        refresh_table(keep_position=True)
+        messagebox.showinfo("刪除完成", f"已刪除 {count} 筆資料。")
+
+    buttons = ttk.Frame(dialog)
+    buttons.pack(pady=5)
+    ttk.Button(buttons, text="刪除", width=10, bootstyle="danger", command=on_delete).pack(side="left", padx=5)
+    ttk.Button(buttons, text="取消", width=10, bootstyle="secondary",
+               command=dialog.destroy).pack(side="left", padx=5)
+
+def undo_last_delete():
+    result = undo_delete()
+    if result is None:
+        messagebox.showinfo("復原刪除", "沒有可復原的刪除。")
+        return
+    description, restored, skipped = result
+    populate_ticker_dropdown()
+    refresh_table(keep_position=True)
+    note = f"\n{skipped} 筆之後已重新匯入，保留現有資料。" if skipped else ""
+    messagebox.showinfo("復原刪除", f"已還原「{description}」的 {restored} 筆資料。{note}")
 
-def refresh_table():
-    for row in tree.get_children():
-        tree.delete(row)
-    selected_ticker = ticker_filter.get()
-    start_date = start_date_filter.entry.get()
-    end_date = end_date_filter.entry.get()
-    if start_date and end_date:
-        data = fetch_data(filter_ticker=selected_ticker, start_date=start_date, end_date=end_date)
-    else:
-        data = fetch_data(filter_ticker=selected_ticker)
-    for row in data:
-        tree.insert("", "end", values=row[1:])
+
+def refresh_table(keep_position=False):
+    """
+    依篩選條件重新計數並顯示第一頁（keep_position：停在目前位置）
+    查詢在背景執行，短時間內連續呼叫（匯入完成 → 篩選）只會查一次
+    """
+    table.request(ticker_filter.get(), start_date_filter.entry.get(), end_date_filter.entry.get(),
+                  keep_position)
 
 
+# 仍有資料的 ticker（字典表 + 索引，不必掃描整張表）
+TICKERS_WITH_DATA_SQL = """SELECT symbol FROM tickers t
+                           WHERE EXISTS (SELECT 1 FROM gex_levels g WHERE g.ticker_id = t.id)"""
+
 def populate_ticker_dropdown():
     global all_tickers
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT ticker FROM stock_data")
-    all_tickers = sorted([r[0] for r in cursor.fetchall()])
-    conn.close()
+    with get_db().reader() as conn:
+        all_tickers = sorted([r[0] for r in conn.execute(TICKERS_WITH_DATA_SQL).fetchall()])
+    ticker_index.update(all_tickers)        # 只增刪匯入 / 刪除後有變動的 ticker
     if all_tickers:
         ticker_filter['values'] = all_tickers
         # 如果當前有值且在列表中，保持不變；否則設為第一個
@@ -542,29 +1774,290 @@ def populate_ticker_dropdown():
 
 # 資料庫 helper：取得所有 ticker
 def get_all_tickers():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT ticker FROM stock_data")
-    rows = cur.fetchall()
-    conn.close()
+    with get_db().reader() as conn:
+        rows = conn.execute(TICKERS_WITH_DATA_SQL).fetchall()
     return [r[0] for r in rows]
 
-# 資料庫 helper：刪除既有當日 OHLC
-def delete_ohlc(ticker, date_str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM stock_data WHERE ticker = ? AND date = ? AND label IN ('Open','High','Low','Close')",
-        (ticker, date_str)
-    )
-    conn.commit()
-    conn.close()
+# --- OHLC 補齊 ---
+# 缺少的日期相隔超過這麼多天就分成兩次下載（區間內不缺的日子也會一起下載，這是上限）
+OHLC_WINDOW_GAP_DAYS = 10
+# TV 的指數代號，yfinance 要加 ^
+YF_INDEX_TICKERS = ("SPX", "NDX", "VIX")
+# 下載不到任何資料的 ticker，在這麼多天內的批次補 OHLC 不再下載（指定 ticker 更新時仍會嘗試）
+SYMBOL_NO_DATA_TTL_DAYS = 7
+
+def yf_symbol(ticker: str, overrides: typing.Optional[typing.Mapping[str, str]] = None) -> str:
+    """資料庫的 ticker → yfinance 代號：先查 symbol_map 的手動指定，否則指數加 ^、BRK.B → BRK-B"""
+    if overrides and overrides.get(ticker):
+        return overrides[ticker]
+    if ticker in YF_INDEX_TICKERS:
+        return f"^{ticker}"
+    return ticker.replace(".", "-")
+
+def load_symbol_map() -> typing.Tuple[typing.Dict[str, str], typing.Set[str]]:
+    """({ticker: 手動指定的代號}, TTL 內下載不到資料的 ticker)"""
+    with get_db().reader() as conn:
+        rows = conn.execute("""SELECT ticker, symbol,
+                                      no_data_at > datetime('now', ?) FROM symbol_map""",
+                            (f"-{SYMBOL_NO_DATA_TTL_DAYS} days",)).fetchall()
+    return ({t: symbol for t, symbol, _ in rows if symbol},
+            {t for t, _, dead in rows if dead})
+
+def record_symbol_results(found: typing.Iterable[str], empty: typing.Iterable[str]):
+    """下載到資料的 ticker 清掉無資料紀錄；整段區間都沒有資料的 ticker 記下時間並累加次數"""
+    with get_db().writer() as conn:
+        conn.executemany("""INSERT INTO symbol_map (ticker, no_data_at, misses)
+                            VALUES (?, datetime('now'), 1)
+                            ON CONFLICT (ticker) DO UPDATE SET
+                                no_data_at = excluded.no_data_at, misses = misses + 1""",
+                         [(t,) for t in empty])
+        conn.executemany("UPDATE symbol_map SET no_data_at = NULL, misses = 0 WHERE ticker = ?",
+                         [(t,) for t in found])
+        conn.execute("DELETE FROM symbol_map WHERE symbol IS NULL AND no_data_at IS NULL")
+
+def set_symbol_override(ticker: str, symbol: typing.Optional[str]):
+    """手動指定（symbol 為空則取消指定）ticker 的 yfinance 代號，並清掉無資料紀錄"""
+    with get_db().writer() as conn:
+        conn.execute("""INSERT INTO symbol_map (ticker, symbol) VALUES (?, ?)
+                        ON CONFLICT (ticker) DO UPDATE SET
+                            symbol = excluded.symbol, no_data_at = NULL, misses = 0""",
+                     (ticker, symbol or None))
+        conn.execute("DELETE FROM symbol_map WHERE symbol IS NULL AND no_data_at IS NULL")
+
+def find_ohlc_gaps(tickers=None, start_day=None, end_day=None) -> typing.Dict[str, typing.List[int]]:
+    """
+    有 GEX level、但 OHLC 不完整的 (ticker, 日) → {ticker: [day, ...]}
+    直接以 daily_levels 寬表判斷，一次查詢
+    """
+    levels = " OR ".join(f"{col} IS NOT NULL" for label, col in WIDE_COLUMNS.items()
+                         if label not in OHLC_LABELS)
+    ohlc = " OR ".join(f"{WIDE_COLUMNS[label]} IS NULL" for label in OHLC_LABELS)
+    query = f"""SELECT t.symbol, d.day FROM daily_levels d JOIN tickers t ON t.id = d.ticker_id
+                WHERE ({levels}) AND ({ohlc})"""
+    params = []
+    if tickers is not None:
+        query += f" AND t.symbol IN ({', '.join('?' * len(tickers))})"
+        params.extend(tickers)
+    if start_day is not None:
+        query += " AND d.day >= ?"
+        params.append(start_day)
+    if end_day is not None:
+        query += " AND d.day <= ?"
+        params.append(end_day)
+    gaps = {}
+    with get_db().reader() as conn:
+        for symbol, day in conn.execute(query + " ORDER BY t.symbol, d.day", params):
+            gaps.setdefault(symbol, []).append(day)
+    return gaps
+
+def plan_ohlc_requests(gaps: typing.Mapping[str, typing.Sequence[int]]
+                       ) -> typing.List[typing.Tuple[typing.List[str], int, int]]:
+    """
+    把缺口併成最少的多 ticker 下載：所有缺少的日期依 OHLC_WINDOW_GAP_DAYS 切成幾段區間，
+    每段一次下載該段內有缺口的所有 ticker → [(tickers, 起始 day, 結束 day（含）)]
+    """
+    days = sorted({day for missing in gaps.values() for day in missing})
+    windows = []
+    for day in days:
+        if windows and day - windows[-1][1] <= OHLC_WINDOW_GAP_DAYS:
+            windows[-1][1] = day
+        else:
+            windows.append([day, day])
+    return [(sorted(t for t, missing in gaps.items() if any(first <= d <= last for d in missing)),
+             first, last)
+            for first, last in windows]
+
+def ohlc_frame_rows(ticker: str, data: pd.DataFrame,
+                    days: typing.Optional[typing.Iterable[int]] = None
+                    ) -> typing.List[typing.Tuple[str, int, str, float]]:
+    """
+    一個 ticker 下載到的日線（yf.download 的欄位）→ _write_ohlc 的 (ticker, day, label, value)
+    days 指定時只取這些日；整段以向量運算換算日期，不逐列 iterrows
+    """
+    data = data[list(OHLC_LABELS)].dropna()
+    index = pd.DatetimeIndex(data.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)                  # 交易所當地日期
+    day_numbers = index.values.astype("datetime64[D]").astype("int64")
+    values = data.to_numpy(dtype="float64")
+    if days is not None:
+        keep = pd.Index(day_numbers).isin(list(days))
+        day_numbers, values = day_numbers[keep], values[keep]
+    return [(ticker, day, label, value)
+            for day, row in zip(day_numbers.tolist(), values.tolist())
+            for label, value in zip(OHLC_LABELS, row)]
+
+def _write_ohlc(rows: typing.Iterable[typing.Tuple[str, int, str, float]]) -> int:
+    """
+    一個交易寫入所有 (ticker, day, label, value) 的 OHLC（已存在則覆蓋），並更新受影響的 daily_levels
+    ticker / label 的 id 先一次查好，executemany 只綁定整數；資料庫沒有的 ticker 略過。回傳寫入筆數
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    with get_db().writer() as conn:
+        conn.executemany("INSERT OR IGNORE INTO labels (name) VALUES (?)", [(l,) for l in OHLC_LABELS])
+        label_ids = dict(conn.execute(f"SELECT name, id FROM labels WHERE name IN {OHLC_LABELS}"))
+        symbols = sorted({t for t, _, _, _ in rows})
+        ticker_ids = {}
+        for i in range(0, len(symbols), 500):
+            chunk = symbols[i:i + 500]
+            ticker_ids.update(conn.execute(f"""SELECT symbol, id FROM tickers
+                                               WHERE symbol IN ({', '.join('?' * len(chunk))})""", chunk))
+        values = [(ticker_ids[t], day, label_ids[label], value)
+                  for t, day, label, value in rows if t in ticker_ids]
+        conn.executemany(f"""INSERT INTO gex_levels (ticker_id, day, label_id, value)
+                             VALUES (?, ?, ?, ?)
+                             {ON_CONFLICT_OVERWRITE}""", values)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS ohlc_keys (ticker_id INTEGER, day INTEGER)")
+        conn.execute("DELETE FROM temp.ohlc_keys")
+        conn.executemany("INSERT INTO temp.ohlc_keys VALUES (?, ?)", {(t, d) for t, d, _, _ in values})
+        _refresh_daily_levels(conn, "SELECT ticker_id, day FROM temp.ohlc_keys")
+    return len(values)
+
+def backfill_ohlc(tickers=None, start=None, end=None,
+                  on_progress: typing.Optional[typing.Callable[[int, int, typing.List[str], int], None]] = None,
+                  cancel: typing.Optional[threading.Event] = None):
+    """
+    只下載並寫入缺少的 OHLC：找出缺口 → 併成最少的多 ticker 區間 → price_fetch 分批並行下載
+    → 只寫缺少的 (ticker, 日)；寫入都在呼叫端的執行緒，每完成一批寫一次
+    ticker 依 symbol_map 轉成 yfinance 代號；未指定 tickers（批次補齊）時略過 TTL 內下載不到資料的 ticker，
+    下載結果再回寫 symbol_map（下載失敗的批次不算無資料）
+    每批寫入後呼叫 on_progress(已完成批數, 總批數, 這批的 ticker, 累計寫入天數)；
+    cancel 被設定後不再送出新的請求，重試前的等待也會中斷（已寫入的保留）
+    回傳 (寫入的天數, 下載批數, 沒有資料或下載失敗的 ticker, 因無資料紀錄略過的 ticker)
+    """
+    gaps = find_ohlc_gaps(tickers,
+                          _day_number(start) if start else None,
+                          _day_number(end) if end else None)
+    overrides, dead = load_symbol_map()
+    skipped = sorted(t for t in gaps if t in dead) if tickers is None else []
+    for t in skipped:
+        del gaps[t]
+    by_symbol = {}
+    for t in gaps:
+        by_symbol.setdefault(yf_symbol(t, overrides), []).append(t)
+    requests = [(list(dict.fromkeys(yf_symbol(t, overrides) for t in symbols)),
+                 _day_to_date(first), _day_to_date(last + 1))
+                for symbols, first, last in plan_ohlc_requests(gaps)]
+    total = len(price_fetch.split_requests(requests))
+    written, done, no_data = 0, 0, set()
+    if on_progress:
+        on_progress(0, total, [], 0)
+    cancel = cancel or threading.Event()
+    results = price_fetch.fetch_prices(requests, cancel=cancel)
+    with contextlib.closing(results):
+        for result in results:
+            if cancel.is_set():
+                break
+            first, last = _day_number(result.start), _day_number(result.end) - 1
+            rows, found, empty = [], [], []
+            for symbol in result.symbols:
+                data = result.bars.get(symbol)
+                for t in by_symbol[symbol]:
+                    # 多個 ticker 共用同一代號時，這批只算缺口落在這段區間的 ticker
+                    days = [day for day in gaps[t] if first <= day <= last]
+                    if not days:
+                        continue
+                    if data is None:
+                        no_data.add(t)
+                        # 同一批有其他代號下載到資料，才確定不是休市或下載失敗
+                        if result.error is None and result.bars:
+                            empty.append(t)
+                        continue
+                    found.append(t)
+                    bars = ohlc_frame_rows(t, data, days)
+                    if not bars:
+                        no_data.add(t)
+                    rows.extend(bars)
+                    written += len(bars) // len(OHLC_LABELS)
+            _write_ohlc(rows)
+            record_symbol_results(found, empty)
+            done += 1
+            if on_progress:
+                on_progress(done, total, [t for s in result.symbols for t in by_symbol[s]], written)
+    return written, total, sorted(no_data), skipped
+
+def _report_backfill(what, written, requests, no_data, skipped=(), cancelled=False):
+    refresh_table()
+    note = f"\n以下 ticker 沒有取得資料：{', '.join(no_data[:20])}" if no_data else ""
+    if skipped:
+        note += (f"\n以下 ticker 近 {SYMBOL_NO_DATA_TTL_DAYS} 天內下載不到資料，已略過"
+                 f"（可在「設定 yfinance 代號」修正）：{', '.join(skipped[:20])}")
+    if cancelled:
+        messagebox.showinfo("已取消", f"{what}已補齊 {written} 天的 OHLC。")
+    elif not written and not requests:
+        messagebox.showinfo("更新完成", f"{what}的 OHLC 已完整，無需下載。{note}")
+    else:
+        messagebox.showinfo("更新完成", f"{what}補齊 {written} 天的 OHLC（下載 {requests} 次）。{note}")
+
+def _report_range_backfill(ticker, start, end, written, requests, no_data, skipped=(), cancelled=False):
+    """
+    update_ohlc_range 的結果：一天都沒寫入且下載不到資料才顯示「無任何日線資料」，
+    其餘（含部分區間沒有資料）照 _report_backfill 回報
+    """
+    if no_data and not written and not cancelled:
+        refresh_table()
+        messagebox.showinfo("無資料", f"{ticker} 在 {start} 到 {end} 期間無任何日線資料")
+    else:
+        _report_backfill(f"{ticker} {start} ~ {end} ", written, requests, no_data, skipped, cancelled)
+
+class OhlcRefresh:
+    """
+    在背景執行緒執行 backfill_ohlc，下載期間 GUI 不會卡住
+    - 進度（第幾次下載、這次的 ticker、已補齊天數）經 queue 交回 Tk 執行緒，以 after 輪詢更新進度視窗
+    - 按「取消」會在目前這次下載結束後停止（退避等待中的批次立即結束），已寫入的資料保留；
+      取消用自己的 Event，不會動到 TXT / Excel / Google Sheets 匯入共用的 cancel_import
+    - 全部結束後才呼叫 on_done(*結果, cancelled=是否取消)（預設 _report_backfill：refresh_table 一次並回報結果）
+    """
+    POLL_MS = 100
+
+    def __init__(self, what: str, tickers=None, start=None, end=None,
+                 on_done: typing.Optional[typing.Callable[[int, int, typing.List[str], typing.List[str]], None]] = None):
+        self.what = what
+        self.on_done = on_done or (lambda *result, **state: _report_backfill(what, *result, **state))
+        self.cancel = threading.Event()
+        self.events = queue.Queue()
+        self.progress = ImportProgress("更新 OHLC", 1, cancel=self.cancel)
+        self.thread = threading.Thread(target=self._run, args=(tickers, start, end), daemon=True)
+        self.thread.start()
+        root.after(self.POLL_MS, self._poll)
+
+    def _run(self, tickers, start, end):
+        try:
+            result = backfill_ohlc(tickers, start, end,
+                                   on_progress=lambda *state: self.events.put(("progress", state)),
+                                   cancel=self.cancel)
+            self.events.put(("done", result))
+        except Exception as e:
+            self.events.put(("error", e))
+
+    def _poll(self):
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                done, total, symbols, written = payload
+                preview = ", ".join(symbols[:8]) + (f" …（共 {len(symbols)} 支）" if len(symbols) > 8 else "")
+                self.progress.bar["maximum"] = total
+                self.progress.update(done, f"{self.what}已下載 {done}/{total} 批：{preview}\n"
+                                           f"已補齊 {written} 天", force=True)
+                continue
+            self.progress.close()
+            if kind == "error":
+                messagebox.showerror("更新失敗", str(payload))
+            else:
+                self.on_done(*payload, cancelled=self.cancel.is_set())
+            return
+        root.after(self.POLL_MS, self._poll)
 
 # 更新 OHLC 按鈕的 callback
 def update_ohlc(selected_date_input):
     """
-    根據 calendar 選擇的日期，批次迴圈所有 ticker，
-    從 yfinance 批次下載該日的 OHLC 資料，並寫入資料庫。
+    根據 calendar 選擇的日期，補齊所有 ticker 在該日缺少的 OHLC
+    （已有 OHLC 的 ticker 不重新下載）。
     支援傳入 DateEntry 物件、widget、字串或日期。
     """
     try:
@@ -585,86 +2078,105 @@ def update_ohlc(selected_date_input):
 
         # 轉為 datetime.date
         date = pd.to_datetime(raw).date()
-        next_day = date + pd.Timedelta(days=1)
-
-        tickers = get_all_tickers()
-        # 根據 TV market 指數欄位前綴，並處理 BRK.B -> BRK-B
-        ticker_map = {}
-        ticker_names = []
-        for t in tickers:
-            if t in ["SPX", "NDX", "VIX"]:
-                yf_name = f"^{t}"
-            else:
-                yf_name = t.replace(".", "-")
-            ticker_names.append(yf_name)
-            ticker_map[t] = yf_name
-
-        # 批次下載所有 ticker 的單日資料
-        df = yf.download(
-            tickers=ticker_names,
-            start=date,
-            end=next_day,
-            interval="1d",
-            group_by="ticker",
-            progress=False,
-            auto_adjust=False
-        )
-
-        count = 0
-        for t in tickers:
-            name = ticker_map[t]
-            # 若為多層索引，取該 ticker 區段，否則為單一 DataFrame
-            # 注意：若只下載一支股票，yfinance 可能不會回傳 MultiIndex，
-            # 但若 ticker_names 只有一個元素，df 就是那支股票的資料
-            if len(ticker_names) > 1 and isinstance(df.columns, pd.MultiIndex):
-                try:
-                    data = df[name]
-                except KeyError:
-                    continue
-            else:
-                data = df
-            
-            if data.empty:
-                continue
-            try:
-                row = data.iloc[0]
-                ohlc = {
-                    'Open': float(row['Open']),
-                    'High': float(row['High']),
-                    'Low': float(row['Low']),
-                    'Close': float(row['Close'])
-                }
-            except (IndexError, ValueError, KeyError):
-                continue
+        OhlcRefresh(f"{date} ", start=date, end=date)
+    except Exception as e:
+        messagebox.showerror("更新失敗", str(e))
 
-            # 刪除舊資料後插入
-            delete_ohlc(t, str(date))
-            for label, value in ohlc.items():
-                insert_data(t, str(date), label, value)
-            count += 1
+def backfill_all_ohlc():
+    """補齊所有 ticker 到昨天為止缺少的 OHLC（當天的日線尚未收盤，不補）"""
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    OhlcRefresh("所有 ticker ", end=yesterday)
 
-        refresh_table()
+def edit_symbol_map():
+    """
+    檢視 / 修改 ticker 對應的 yfinance 代號
+    列出所有 ticker 實際使用的代號與無資料紀錄；儲存或取消指定都會清掉無資料紀錄，下次批次補齊會重新下載
+    """
+    dialog = tk.Toplevel(root)
+    dialog.title("設定 yfinance 代號")
+    dialog.geometry("600x460")
+    dialog.grab_set()
 
-        messagebox.showinfo("更新完成", f"已成功為 {count} 支 ticker 更新 {date} 的 OHLC 資料。")
-    except Exception as e:
-        messagebox.showerror("更新失敗", str(e))
+    columns = ("ticker", "symbol", "no_data_at", "misses")
+    view = ttk.Treeview(dialog, columns=columns, show="headings", height=14)
+    for col, text, width in zip(columns, ("Ticker", "yfinance 代號", "最後無資料時間", "次數"),
+                                (100, 140, 180, 60)):
+        view.heading(col, text=text)
+        view.column(col, width=width)
+    view.pack(fill=BOTH, expand=True, padx=10, pady=(10, 0))
+
+    def reload():
+        view.delete(*view.get_children())
+        with get_db().reader() as conn:
+            rows = {t: (symbol, at, misses) for t, symbol, at, misses
+                    in conn.execute("SELECT ticker, symbol, no_data_at, misses FROM symbol_map")}
+        overrides = {t: symbol for t, (symbol, _, _) in rows.items() if symbol}
+        for t in sorted(set(get_all_tickers()) | set(rows)):
+            _, at, misses = rows.get(t, (None, None, 0))
+            symbol = yf_symbol(t, overrides) + (" *" if t in overrides else "")
+            view.insert("", "end", iid=t, values=(t, symbol, at or "", misses or ""))
+
+    form = ttk.Frame(dialog, padding=10)
+    form.pack(fill=X)
+    ttk.Label(form, text="Ticker:").grid(row=0, column=0, sticky=E)
+    ticker_entry = ttk.Entry(form, width=12)
+    ticker_entry.grid(row=0, column=1, padx=5)
+    ttk.Label(form, text="yfinance 代號:").grid(row=0, column=2, sticky=E)
+    symbol_entry = ttk.Entry(form, width=16)
+    symbol_entry.grid(row=0, column=3, padx=5)
+
+    def on_select(_event):
+        selected = view.selection()
+        if selected:
+            ticker_entry.delete(0, tk.END)
+            ticker_entry.insert(0, selected[0])
+            symbol_entry.delete(0, tk.END)
+            symbol_entry.insert(0, view.set(selected[0], "symbol").rstrip(" *"))
+    view.bind("<<TreeviewSelect>>", on_select)
+
+    def save(symbol):
+        ticker = ticker_entry.get().strip().upper()
+        if not ticker:
+            messagebox.showwarning("參數不足", "請輸入 Ticker", parent=dialog)
+            return
+        set_symbol_override(ticker, symbol.strip() if symbol else None)
+        reload()
+
+    buttons = ttk.Frame(dialog)
+    buttons.pack(pady=(0, 10))
+    ttk.Button(buttons, text="儲存", width=10, bootstyle="success",
+               command=lambda: save(symbol_entry.get())).pack(side="left", padx=5)
+    ttk.Button(buttons, text="使用預設規則", width=12, bootstyle="warning",
+               command=lambda: save(None)).pack(side="left", padx=5)
+    ttk.Button(buttons, text="關閉", width=10, bootstyle="secondary",
+               command=dialog.destroy).pack(side="left", padx=5)
+    ttk.Label(dialog, text="* 為手動指定；依預設規則時指數加 ^、BRK.B → BRK-B",
+              padding=(10, 0, 10, 10)).pack(anchor=W)
+    reload()
                 
 # 資料庫 helper：從資料庫抓取指定 ticker 的所有 OHLC 歷史資料
-def fetch_historical_ohlc_from_db(ticker):
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query(
-        "SELECT date, label, value FROM stock_data WHERE ticker = ? AND label IN ('Open','High','Low','Close')",
-        conn,
-        params=(ticker,)
-    )
-    conn.close()
-    if df.empty:
-        return pd.DataFrame()
-    df['date'] = pd.to_datetime(df['date'])
-    pivot = df.pivot(index='date', columns='label', values='value')
-    return pivot.sort_index()
-
-# --- 新增函式：依篩選條件的 ticker & 日期區間，批次更新每天的 OHLC ---
+# 圖表用：單一 ticker 每日一列的 level 與 OHLC（migrate_db 也以它量測圖表查詢）
+DAILY_LEVELS_SQL = f"""SELECT day, {", ".join(WIDE_COLUMNS.values())} FROM daily_levels
+                       WHERE ticker_id = (SELECT id FROM tickers WHERE symbol = ?)"""
+
+def fetch_daily_levels(ticker, start_date=None, end_date=None) -> pd.DataFrame:
+    """
+    從 daily_levels 寬表一次讀出指定 ticker 的每日 level 與 OHLC
+    回傳以日期為 index、欄位為 label 名稱（'Call Wall'…、'Open'…）的 DataFrame
+    """
+    query = DAILY_LEVELS_SQL
+    params = [ticker]
+    if start_date and end_date:
+        query += " AND day BETWEEN ? AND ?"
+        params.extend([_day_number(start_date), _day_number(end_date)])
+    query += " ORDER BY day"
+    with get_db().reader() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    df.index = pd.to_datetime(df.pop("day"), unit="D").rename("date")
+    df.columns = list(WIDE_COLUMNS)
+    return df.astype("float64")
+
+# --- 新增函式：依篩選條件的 ticker & 日期區間，補齊缺少的 OHLC ---
 def update_ohlc_range():
     try:
         t = ticker_filter.get().strip()
@@ -674,46 +2186,8 @@ def update_ohlc_range():
             messagebox.showwarning("參數不足", "請先選擇 Ticker 及起始/結束日期")
             return
 
-        # 下載期間內的日線資料
-        if t in ["SPX", "NDX", "VIX"]:
-            yf_ticker = f"^{t}"
-        else:
-            yf_ticker = t.replace(".", "-")
-
-        df = yf.download(
-            tickers=yf_ticker,
-            start=start,
-            end=pd.to_datetime(end) + pd.Timedelta(days=1),
-            interval="1d",
-            group_by="ticker",
-            progress=False,
-            auto_adjust=False
-        )
-
-        if df.empty:
-            messagebox.showinfo("無資料", f"{t} 在 {start} 到 {end} 期間無任何日線資料")
-            return
-
-        # 單 ticker 可能回傳單層 DataFrame
-        data = df if not isinstance(df.columns, pd.MultiIndex) else df[yf_ticker]
-
-        updated = 0
-        for idx, row in data.iterrows():
-            date_str = idx.date().isoformat()
-            ohlc = {
-                'Open': float(row['Open']),
-                'High': float(row['High']),
-                'Low':  float(row['Low']),
-                'Close':float(row['Close'])
-            }
-            # 刪除舊資料、寫入新資料
-            delete_ohlc(t, date_str)
-            for lbl, val in ohlc.items():
-                insert_data(t, date_str, lbl, val)
-            updated += 1
-
-        refresh_table()
-        messagebox.showinfo("更新完成", f"{t} 共更新 {updated} 天的 OHLC 資料 ({start} ~ {end})")
+        OhlcRefresh(f"{t} ", [t], start, end,
+                    on_done=lambda *result, **state: _report_range_backfill(t, start, end, *result, **state))
     except Exception as e:
         messagebox.showerror("更新失敗", str(e))
 
@@ -722,52 +2196,29 @@ def plot_graph():
     if not selected_ticker:
         messagebox.showwarning("錯誤", "請選擇 Ticker")
         return
-    data = fetch_data(filter_ticker=selected_ticker)
-    if not data:
+    # daily_levels 寬表：一次查詢取得所有 level 與 OHLC
+    wide = fetch_daily_levels(selected_ticker)
+    if wide.empty:
         messagebox.showwarning("錯誤", "無數據")
         return
-    df = pd.DataFrame(data, columns=["id", "ticker", "date", "label", "value"])
-    df.drop(columns=["id"], inplace=True)
-    df["date"] = pd.to_datetime(df["date"])
-    df.sort_values("date", inplace=True)
 
     fig = go.Figure()
 
-    color_map = {
-        'Call Dominate':  '#FFD700',
-        'Call Wall':      '#FFA500',
-        'Call Wall CE':   '#FF7F50',
-        'Gamma Field':    "#D75BF6",
-        'Gamma Field CE': "#EAA1F8",
-        'Key Delta':      '#ADFF2F',
-        'Gamma Flip':     "#CBCBCB",
-        'Gamma Flip CE':  "#FFFFFF",
-        'Put Wall CE':    '#FF1493',
-        'Put Wall':       '#DC143C',
-        'Put Dominate':   '#8B0000',
-    }
-
-    labels = list(color_map.keys())   # ❷ 用 color_map 的 key 當繪圖順序
-
-    # 繪製 GEX 折線圖（排除指定 labels）
-    for label in labels:
-        # if label in exclude_labels:
-        #     continue
-        if label in df["label"].unique():
-            subset = df[df["label"] == label]
+    # 繪製 GEX 折線圖（LEVEL_COLORS 的 key 即繪圖順序）
+    for label, color in LEVEL_COLORS.items():
+        subset = wide[label].dropna()
+        if not subset.empty:
             fig.add_trace(go.Scatter(
-                x=subset["date"],
-                y=subset["value"],
+                x=subset.index,
+                y=subset.values,
                 mode="lines+markers",
                 name=label,
-                line=dict(color=color_map[label]),   # ← 指定線色
+                line=dict(color=color),   # ← 指定線色
             ))
 
-    # 從資料庫取得資料
     # 讀取 OHLC；若缺資料僅警告，不中斷
-    ohlc_df = fetch_historical_ohlc_from_db(selected_ticker)
-    has_ohlc = (not ohlc_df.empty) and all(col in ohlc_df.columns
-                                           for col in ['Open', 'High', 'Low', 'Close'])
+    ohlc_df = wide[list(OHLC_LABELS)].dropna(how="all")
+    has_ohlc = not ohlc_df.empty
     if not has_ohlc:
         messagebox.showwarning("缺少 OHLC",
                                f"{selected_ticker} 無 OHLC 資料，圖表將僅顯示其他指標")
@@ -795,6 +2246,14 @@ def plot_graph():
 
 # --- 自定義 Combobox 類別 ---
 class SearchCombobox(ttk.Combobox):
+    """
+    輸入時在 ticker_index 搜尋（前綴在前、子字串在後），停止輸入 SEARCH_DELAY_MS 後才搜尋，
+    最多列出 MAX_RESULTS 筆；下拉清單只建立一次，更新時只改動與上次不同的列
+    """
+    SEARCH_DELAY_MS = 150
+    MAX_RESULTS = 50
+    ROW_HEIGHT = 20
+
     def __init__(self, master=None, **kwargs):
         super().__init__(master, **kwargs)
         self.bind('<KeyRelease>', self.on_keyrelease)
@@ -802,22 +2261,26 @@ class SearchCombobox(ttk.Combobox):
         self.bind('<Return>', self.on_return)
         self._listbox_window = None
         self._listbox = None
+        self._shown = []                # 清單目前的內容
+        self._geometry = None
+        self._search_job = None
 
     def on_keyrelease(self, event):
         # 忽略導航鍵與功能鍵
         if event.keysym in ['Up', 'Down', 'Left', 'Right', 'Return', 'Escape', 'Tab', 
                             'Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R']:
             return
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(self.SEARCH_DELAY_MS, self.search)
+
+    def search(self):
+        self._search_job = None
+        filtered = ticker_index.search(self.get(), self.MAX_RESULTS)
 
-        value = self.get()
-        if not value:
-            filtered = all_tickers
-        else:
-            filtered = [t for t in all_tickers if value.lower() in t.lower()]
-        
         # 更新原生 values 但不自動 Post (避免游標跳動)
         self['values'] = filtered
-        
+
         if filtered:
             self.show_listbox(filtered)
         else:
@@ -847,25 +2310,39 @@ class SearchCombobox(ttk.Combobox):
                                        relief="flat", borderwidth=1)
             self._listbox.pack(fill='both', expand=True)
             self._listbox.bind("<<ListboxSelect>>", self.on_select)
-        
-        self._listbox.delete(0, 'end')
-        for item in values:
-            self._listbox.insert('end', item)
-            
-        # 計算位置與大小
+
+        # 只重寫第一個不同的位置之後的列（繼續輸入時前面的結果通常不變）
+        same = 0
+        for old, new in zip(self._shown, values):
+            if old != new:
+                break
+            same += 1
+        if same < len(self._shown):
+            self._listbox.delete(same, 'end')
+        if same < len(values):
+            self._listbox.insert('end', *values[same:])
+        self._shown = list(values)
+
+        # 計算位置與大小，有變動才重設
         x = self.winfo_rootx()
         y = self.winfo_rooty() + self.winfo_height()
         w = self.winfo_width()
-        h = min(len(values), 10) * 20 # 估算高度
-        self._listbox_window.geometry(f"{w}x{h}+{x}+{y}")
-        self._listbox_window.deiconify()
-        self._listbox_window.lift()
+        h = min(len(values), 10) * self.ROW_HEIGHT # 估算高度
+        geometry = f"{w}x{h}+{x}+{y}"
+        if geometry != self._geometry:
+            self._listbox_window.geometry(geometry)
+            self._geometry = geometry
+        if self._listbox_window.state() != "normal":
+            self._listbox_window.deiconify()
+            self._listbox_window.lift()
 
     def hide_listbox(self):
+        # 只隱藏不銷毀，下次顯示時沿用
         if self._listbox_window:
-            self._listbox_window.destroy()
-            self._listbox_window = None
-            self._listbox = None
+            self._listbox_window.withdraw()
+
+    def _listbox_visible(self):
+        return bool(self._listbox_window) and self._listbox_window.state() == "normal"
 
     def on_select(self, event):
         if self._listbox and self._listbox.curselection():
@@ -881,14 +2358,17 @@ class SearchCombobox(ttk.Combobox):
         self.after(150, self.hide_listbox)
 
     def on_return(self, event):
-        if self._listbox_window and self._listbox and self._listbox.size() > 0:
+        if self._search_job is not None:           # 還沒搜尋就按 Enter：先搜尋
+            self.after_cancel(self._search_job)
+            self.search()
+        if self._listbox_visible() and self._listbox.size() > 0:
              self.set(self._listbox.get(0))
              self.hide_listbox()
              self.icursor(tk.END)
 
 # --- GUI 建構 ---
 def build_gui():
-    global root, calendar_date, gex_entry, ticker_filter, start_date_filter, end_date_filter, tree
+    global root, calendar_date, gex_entry, ticker_filter, start_date_filter, end_date_filter, tree, table
 
     root = ttk.Window(themename="darkly")
     root.title("股票 GEX 管理系統")
@@ -904,6 +2384,9 @@ def build_gui():
     menu.add_command(label="從 TXT 匯入", command=bulk_import)
     menu.add_command(label="從 Excel 匯入", command=import_from_excel)
     menu.add_command(label="從 Google 試算表匯入", command=import_from_google)
+    menu.add_separator()
+    menu.add_command(label="補齊所有缺少的 OHLC", command=backfill_all_ohlc)
+    menu.add_command(label="設定 yfinance 代號", command=edit_symbol_map)
     ttk.Button(main, text="從 Google sheet 更新最新 data", bootstyle=SUCCESS, command=auto_import_from_google).grid(row=0, column=1, sticky=W, pady=5)
 
     entry_frame = ttk.LabelFrame(main, text="單筆輸入", padding=10)
@@ -974,14 +2457,17 @@ def build_gui():
     root.bind_all('<Control-c>', copy_selected_values)
     root.bind_all('<Control-C>', copy_selected_values)
 
-    scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
+    # 捲軸代表整個查詢結果的位置，由 VirtualTable 依需要向資料庫分頁讀取
+    scrollbar = ttk.Scrollbar(table_frame, orient="vertical")
     scrollbar.pack(side=RIGHT, fill=Y)
+    table = VirtualTable(tree, scrollbar, table_frame)
 
     btn_frame = ttk.Frame(main)
     btn_frame.grid(row=4, column=0, columnspan=2, pady=10)
     ttk.Button(btn_frame, text="📈 繪製圖表", bootstyle=PRIMARY, command=plot_graph).grid(row=0, column=0, padx=5)
     ttk.Button(btn_frame, text="🗑️ 刪除選定", bootstyle=DANGER, command=delete_selected).grid(row=0, column=1, padx=5)
+    ttk.Button(btn_frame, text="🧹 依條件刪除", bootstyle=DANGER, command=delete_by_filter).grid(row=0, column=2, padx=5)
+    ttk.Button(btn_frame, text="↩️ 復原刪除", bootstyle=SECONDARY, command=undo_last_delete).grid(row=0, column=3, padx=5)
 
     root.rowconfigure(0, weight=1)
     root.columnconfigure(0, weight=1)
@@ -992,6 +2478,7 @@ def build_gui():
     refresh_table()
 
     root.mainloop()
+    get_db().close()
 
 if __name__ == "__main__":
     init_db()
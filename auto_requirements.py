@@ -10,6 +10,7 @@ REQUIRED = {
     "ttkbootstrap":"1.13.9",
     "tkcalendar":  "1.6.1",
     "XlsxWriter":  "3.2.5",
+    "openpyxl":    "3.1.2",
     "gspread":     "6.2.1",
     "oauth2client":"4.1.3"
 }
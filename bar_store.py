@@ -0,0 +1,140 @@
+"""
+本機日線倉庫（不依賴 Tk 與資料庫）
+
+向資料來源下載過的日線存在本機，同一段區間之後直接讀檔，不再連線：
+    <root>/<代號>/<年>.parquet   有 pyarrow 時（讀取以 memory_map 開啟）
+    <root>/<代號>/<年>.csv       沒有 pyarrow 時（pandas 一般讀檔，不做 memory map）
+    <root>/<代號>/coverage.json  已向資料來源要過的區間（含休市、沒有資料的日子）
+只有最近 SETTLE_DAYS 天以前的區間會記為已取得；較新的 K 線照樣存檔，但下次仍會重新下載覆蓋
+（當天尚未收盤、資料來源還沒更新）。
+"""
+import datetime
+import json
+import os
+import threading
+import typing
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:                     # pyarrow 為選用套件，沒有時改存 CSV
+    pa = pq = None
+
+SETTLE_DAYS = 3
+PARQUET, CSV = "parquet", "csv"
+
+
+def _merge(intervals: typing.Iterable[typing.Sequence[datetime.date]]
+           ) -> typing.List[typing.Tuple[datetime.date, datetime.date]]:
+    """[start, end) 區間排序後合併相鄰 / 重疊的"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        elif start < end:
+            merged.append((start, end))
+    return merged
+
+
+def _subtract(start: datetime.date, end: datetime.date,
+              covered: typing.Sequence[typing.Tuple[datetime.date, datetime.date]]
+              ) -> typing.List[typing.Tuple[datetime.date, datetime.date]]:
+    """[start, end) 中不在 covered 內的部分"""
+    missing = []
+    for first, last in covered:
+        if last <= start or first >= end:
+            continue
+        if first > start:
+            missing.append((start, first))
+        start = max(start, last)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+class BarStore:
+    """
+    依代號、年份分檔的日線倉庫；寫入以 threading.Lock 序列化（多個下載執行緒共用），讀取不需加鎖
+    只有 parquet 以 memory_map 讀取，CSV 備援格式每次整檔讀入記憶體
+    """
+
+    def __init__(self, root: str, fmt: typing.Optional[str] = None):
+        self.root = root
+        self.fmt = fmt or (PARQUET if pq is not None else CSV)
+        if self.fmt == PARQUET and pq is None:
+            raise ImportError("Parquet 格式需要 pyarrow")
+        self.lock = threading.Lock()
+
+    def _dir(self, symbol: str) -> str:
+        return os.path.join(self.root, symbol.replace("/", "_"))
+
+    def _part_path(self, symbol: str, year: int) -> str:
+        return os.path.join(self._dir(symbol), f"{year}.{self.fmt}")
+
+    def _read_part(self, symbol: str, year: int) -> pd.DataFrame:
+        path = self._part_path(symbol, year)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        if self.fmt == PARQUET:
+            return pq.read_table(path, memory_map=True).to_pandas()
+        return pd.read_csv(path, index_col="Date", parse_dates=["Date"], float_precision="round_trip")
+
+    def _write_part(self, symbol: str, year: int, bars: pd.DataFrame):
+        path = self._part_path(symbol, year)
+        tmp = path + ".tmp"
+        if self.fmt == PARQUET:
+            pq.write_table(pa.Table.from_pandas(bars), tmp)
+        else:
+            bars.to_csv(tmp)
+        os.replace(tmp, path)               # 讀取端不會看到寫到一半的檔案
+
+    def coverage(self, symbol: str) -> typing.List[typing.Tuple[datetime.date, datetime.date]]:
+        path = os.path.join(self._dir(symbol), "coverage.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [(datetime.date.fromisoformat(a), datetime.date.fromisoformat(b)) for a, b in json.load(f)]
+
+    def missing(self, symbol: str, start: datetime.date, end: datetime.date
+                ) -> typing.List[typing.Tuple[datetime.date, datetime.date]]:
+        """[start, end) 中還沒向資料來源要過的區間"""
+        return _subtract(start, end, self.coverage(symbol))
+
+    def read(self, symbol: str, start: datetime.date, end: datetime.date) -> pd.DataFrame:
+        """[start, end) 的日線（Date 為 index）；沒有資料回傳空的 DataFrame"""
+        years = range(start.year, (end - datetime.timedelta(days=1)).year + 1)
+        if self.fmt == PARQUET:
+            # 各年份先以 Arrow 表格串接，只轉換一次 DataFrame
+            paths = [p for p in (self._part_path(symbol, year) for year in years) if os.path.exists(p)]
+            if not paths:
+                return pd.DataFrame()
+            bars = pa.concat_tables([pq.read_table(p, memory_map=True) for p in paths]).to_pandas()
+        else:
+            parts = [p for p in (self._read_part(symbol, year) for year in years) if not p.empty]
+            if not parts:
+                return pd.DataFrame()
+            bars = pd.concat(parts) if len(parts) > 1 else parts[0]
+        return bars[(bars.index >= pd.Timestamp(start)) & (bars.index < pd.Timestamp(end))]
+
+    def write(self, symbol: str, bars: pd.DataFrame, start: datetime.date, end: datetime.date):
+        """併入 [start, end) 下載到的日線（同一天以新資料為準），並記下已取得的區間"""
+        bars = bars.dropna(how="all")
+        index = pd.DatetimeIndex(bars.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        bars = bars.set_axis(index.rename("Date"))
+        settled = min(end, datetime.date.today() - datetime.timedelta(days=SETTLE_DAYS))
+        with self.lock:
+            os.makedirs(self._dir(symbol), exist_ok=True)
+            for year, part in bars.groupby(bars.index.year):
+                merged = pd.concat([self._read_part(symbol, year), part])
+                merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+                self._write_part(symbol, year, merged)
+            if start < settled:
+                covered = _merge(self.coverage(symbol) + [(start, settled)])
+                path = os.path.join(self._dir(symbol), "coverage.json")
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump([(a.isoformat(), b.isoformat()) for a, b in covered], f)
+                os.replace(path + ".tmp", path)
@@ -0,0 +1,846 @@
+"""
+GEX 工具效能基準測試
+
+用法：
+    python benchmark.py              # 執行全部
+    python benchmark.py import_write # 只執行指定項目
+
+所有測試都在暫存資料夾中的全新 stocks.db 上進行，不會動到正式資料庫。
+"""
+import contextlib
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+import pandas as pd
+
+import GEX_chart_new as gex
+import bar_store
+import data_sources
+import gex_parser
+import price_fetch
+import sheet_fetch
+from ticker_index import TickerIndex
+from gspread.exceptions import APIError
+
+LEVEL_LABELS = ['Call Dominate', 'Call Wall', 'Call Wall CE', 'Gamma Field',
+                'Gamma Field CE', 'Key Delta', 'Gamma Flip', 'Gamma Flip CE',
+                'Put Wall CE', 'Put Wall', 'Put Dominate']
+
+
+def ticker_name(i):
+    """0 -> AAA, 1 -> AAB ...（parse_gex_code 的 ticker 只接受英文字母）"""
+    letters = ""
+    for _ in range(3):
+        i, r = divmod(i, 26)
+        letters = chr(ord("A") + r) + letters
+    return letters
+
+
+def make_tv_codes(n_tickers=20, n_days=50, seed=0):
+    """產生 (date_str, tv_code) 測試資料，每個 TV Code 約 12 個 level"""
+    rnd = random.Random(seed)
+    start = datetime.date(2020, 1, 1)
+    codes = []
+    for d in range(n_days):
+        day = start + datetime.timedelta(days=d)
+        for t in range(n_tickers):
+            ticker = ticker_name(t)
+            parts = [f"{label}, {rnd.uniform(50, 500):.2f}" for label in LEVEL_LABELS]
+            codes.append((day.isoformat(), f"{ticker}: " + ", ".join(parts)))
+    return codes
+
+
+class RowCollector:
+    """代替 ImportSession 收集 parse_gex_code 解析出的 (ticker, date, label, value)"""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, *row):
+        self.rows.append(row)
+
+    def add_rows(self, rows):
+        self.rows.extend(rows)
+
+
+def parse_rows(codes):
+    collector = RowCollector()
+    for date_str, code in codes:
+        gex.parse_gex_code(date_str, code, collector)
+    return collector.rows
+
+
+def fresh_db(tmpdir, name="stocks.db"):
+    gex.get_db().close()                       # 連線管理器可能還開著同名的舊檔
+    gex.DB_PATH = os.path.join(tmpdir, name)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(gex.DB_PATH + suffix):
+            os.remove(gex.DB_PATH + suffix)
+    gex.init_db()
+    gex.user_conflict_choice = None
+    gex.cancel_import = False
+    gex.inserted_count = 0
+
+
+@contextlib.contextmanager
+def quiet_ui():
+    """匯入 / OHLC 流程結束時的訊息視窗與表格更新改為不做事，離開區塊後還原"""
+    silent = lambda *args, **kwargs: None
+    with mock.patch.multiple(gex.messagebox, showinfo=silent, showwarning=silent), \
+            mock.patch.multiple(gex, populate_ticker_dropdown=silent, refresh_table=silent):
+        yield
+
+
+class AfterLoop:
+    """代替 Tk 的 root.after：依排定時間依序執行 callback，直到沒有待執行的為止"""
+
+    def __init__(self):
+        self.jobs = []
+        self.seq = 0
+
+    def after(self, ms, callback, *args):
+        self.seq += 1
+        self.jobs.append((time.monotonic() + ms / 1000, self.seq, callback, args))
+
+    def run(self):
+        while self.jobs:
+            self.jobs.sort()
+            at, _, callback, args = self.jobs.pop(0)
+            time.sleep(max(0.0, at - time.monotonic()))
+            callback(*args)
+
+
+class SilentProgress:
+    """ImportProgress 的替身：只保留 bar["maximum"]，不開視窗"""
+
+    def __init__(self):
+        self.bar = {"maximum": 1}
+
+    def update(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+def parallel_txt_import(paths, session):
+    """不開視窗執行 ParallelTxtImport，回傳 on_done 收到的 (invalid, finished, skipped)"""
+    loop, done = AfterLoop(), []
+    with mock.patch.object(gex, "root", loop):
+        gex.ParallelTxtImport(paths, session, SilentProgress(), on_done=lambda *result: done.append(result))
+        loop.run()
+    return done[0]
+
+
+def legacy_insert_data(ticker, date, label, value):
+    """
+    改用 ImportSession 之前的逐筆寫入，只作為量測基準：先查是否已存在，再以一個交易寫入一筆
+    （重複資料一律覆蓋、不跳詢問視窗；日期無法解析的略過）
+    """
+    day = gex._day_number(date)
+    if day is None:
+        return
+    with gex.get_db().reader() as conn:
+        conn.execute("""SELECT 1 FROM gex_levels g
+                        JOIN tickers t ON t.id = g.ticker_id
+                        JOIN labels l ON l.id = g.label_id
+                        WHERE t.symbol=? AND g.day=? AND l.name=?""", (ticker, day, label)).fetchone()
+    with gex.get_db().writer() as conn:
+        code_hash = None
+        if label == gex.TV_CODE_LABEL:
+            code_hash = gex._code_hash(value)
+            conn.execute("INSERT OR IGNORE INTO tv_codes (hash, code) VALUES (?, ?)", (code_hash, value))
+            value = None
+        conn.execute("INSERT OR IGNORE INTO tickers (symbol) VALUES (?)", (ticker,))
+        conn.execute("INSERT OR IGNORE INTO labels (name) VALUES (?)", (label,))
+        conn.execute(f"""INSERT INTO gex_levels (ticker_id, day, label_id, value, code_hash)
+                         VALUES ((SELECT id FROM tickers WHERE symbol = ?), ?,
+                                 (SELECT id FROM labels WHERE name = ?), ?, ?)
+                         {gex.ON_CONFLICT_OVERWRITE}""",
+                     (ticker, day, label, value, code_hash))
+        if label in gex.WIDE_COLUMNS:
+            gex._refresh_daily_levels(conn, "SELECT id, ? FROM tickers WHERE symbol = ?", (day, ticker))
+
+
+def report(name, rows, seconds):
+    print(f"  {name:<28} {rows:>8} rows  {seconds:8.3f}s  {rows / seconds:>10.0f} rows/s")
+
+
+def bench_import_write(tmpdir):
+    """逐筆 legacy_insert_data（每筆一個交易） vs ImportSession 批次寫入"""
+    codes = make_tv_codes()
+
+    # 先解析出所有列，兩種寫入方式用同一份資料
+    rows = parse_rows(codes)
+
+    fresh_db(tmpdir, "before.db")
+    t0 = time.perf_counter()
+    for row in rows:
+        legacy_insert_data(*row)
+    report("before: legacy_insert_data", len(rows), time.perf_counter() - t0)
+
+    fresh_db(tmpdir, "after.db")
+    t0 = time.perf_counter()
+    session = gex.ImportSession()
+    for date_str, code in codes:
+        gex.parse_gex_code(date_str, code, session)
+    session.finish()
+    session.close()
+    report("after: ImportSession", gex.inserted_count, time.perf_counter() - t0)
+
+
+def bench_conflict_scan(tmpdir):
+    """重新匯入與資料庫完全重疊的資料：一次彙總查詢 + 整批覆蓋"""
+    codes = make_tv_codes()
+    fresh_db(tmpdir)
+    session = gex.ImportSession()
+    for date_str, code in codes:
+        gex.parse_gex_code(date_str, code, session)
+    session.finish()
+
+    asked = []
+    gex.inserted_count = 0
+    with mock.patch.object(gex, "ask_bulk_conflict_resolution",
+                           lambda conflicts, partial=False: asked.append(conflicts) or "overwrite"):
+        t0 = time.perf_counter()
+        for date_str, code in codes:
+            gex.parse_gex_code(date_str, code, session)
+        session.finish()
+        session.close()
+    report("overwrite overlap", gex.inserted_count, time.perf_counter() - t0)
+    print(f"  彙總視窗次數：{len(asked)}，重複筆數：{sum(c for _, _, c in asked[0])}")
+
+
+def bench_chart_read(tmpdir):
+    """繪圖讀取：長表 fetch_data + 逐 label 篩選 vs daily_levels 寬表單次範圍查詢"""
+    codes = make_tv_codes(n_tickers=20, n_days=500)
+    fresh_db(tmpdir)
+    session = gex.ImportSession()
+    for date_str, code in codes:
+        gex.parse_gex_code(date_str, code, session)
+    session.finish()
+    session.close()
+    ticker = ticker_name(0)
+    repeat = 20
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        df = pd.DataFrame([row[:5] for row in gex.fetch_data(filter_ticker=ticker)],
+                          columns=["id", "ticker", "date", "label", "value"])
+        df["date"] = pd.to_datetime(df["date"])
+        df.sort_values("date", inplace=True)
+        series = [df[df["label"] == label] for label in gex.LEVEL_COLORS
+                  if label in df["label"].unique()]
+    report("before: long + filter", sum(map(len, series)) * repeat, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        wide = gex.fetch_daily_levels(ticker)
+        series = [wide[label].dropna() for label in gex.LEVEL_COLORS]
+    report("after: daily_levels", sum(map(len, series)) * repeat, time.perf_counter() - t0)
+
+
+def make_sheet(n_rows=100_000, seed=0):
+    """產生 Date / TV Code 兩欄的工作表，約一半的 TV Code 內嵌日期"""
+    rnd = random.Random(seed)
+    start = datetime.date(2000, 1, 1)
+    dates, codes = [], []
+    for i in range(n_rows):
+        day = start + datetime.timedelta(days=i // 20)
+        ticker = ticker_name(i % 20)
+        parts = [f"{label}, {rnd.uniform(50, 500):.2f}" for label in LEVEL_LABELS]
+        prefix = f"{ticker} {day:%Y%m%d} 093000 " if i % 2 else ""
+        dates.append(day.isoformat())
+        codes.append(f"{prefix}{ticker}: " + ", ".join(parts))
+    return pd.DataFrame({"Date": dates, "TV Code": codes})
+
+
+def legacy_sheet_rows(df):
+    """向量化之前 _import_rows 的逐列 iterrows 解析"""
+    collector = RowCollector()
+    for _, row in df.iterrows():
+        tv_code = str(row['TV Code']).strip()
+        if not tv_code or tv_code.lower() == 'nan':
+            continue
+        date_obj = gex_parser.extract_date_from_tv_code(tv_code)
+        if date_obj is None:
+            date_obj = gex_parser.parse_date(row.get('Date'))
+        if date_obj is None:
+            continue
+        gex.parse_gex_code(date_obj.isoformat(), tv_code, collector)
+    return collector.rows
+
+
+def bench_parse_sheet(tmpdir):
+    """100k 列工作表解析：逐列 iterrows vs parse_tv_code_frame 整欄運算"""
+    df = make_sheet()
+
+    t0 = time.perf_counter()
+    before = legacy_sheet_rows(df)
+    report("before: iterrows", len(before), time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    after, invalid = gex.parse_tv_code_frame(df)
+    report("after: parse_tv_code_frame", len(after), time.perf_counter() - t0)
+
+    same = before == list(after.itertuples(index=False, name=None)) and not invalid
+    print(f"  結果與逐列解析{'相同' if same else '不同！'}")
+
+
+def write_txt(path, n_days):
+    """依 bulk_import 的 TXT 格式寫檔：日期行後接當天各 ticker 的 TV Code"""
+    with open(path, "w", encoding="utf-8") as f:
+        last_date = None
+        for date_str, code in make_tv_codes(n_tickers=20, n_days=n_days):
+            if date_str != last_date:
+                f.write(f"\n{date_str}_TV Code\n")
+                last_date = date_str
+            f.write(code + "\n")
+
+
+def bench_txt_stream(tmpdir):
+    """TXT 匯入：整檔暫存後寫入 vs 串流分批寫入（比較 Python 端記憶體峰值）"""
+    for n_days in (100, 800):
+        path = os.path.join(tmpdir, "20240101_TV Code.txt")
+        write_txt(path, n_days)
+        size_mb = os.path.getsize(path) / 2**20
+        for name, batch_size in (("buffered", None), ("streaming", gex.STREAM_BATCH_ROWS)):
+            fresh_db(tmpdir)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            session = gex.ImportSession(batch_size=batch_size)
+            gex.import_txt_files([path], session)
+            session.finish()
+            session.close()
+            elapsed = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report(f"{name} ({size_mb:.1f} MB)", gex.inserted_count, elapsed)
+            print(f"  {'':<28} 記憶體峰值 {peak / 2**20:.1f} MB")
+
+
+def bench_parallel_txt(tmpdir):
+    """500 個每日 TXT：主執行緒逐檔解析 vs 子程序平行解析 + 單一寫入者"""
+    folder = os.path.join(tmpdir, "daily")
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    start = datetime.date(2022, 1, 3)
+    for i in range(500):
+        day = start + datetime.timedelta(days=i)
+        path = os.path.join(folder, f"{day:%Y%m%d}_TV Code.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for _, code in make_tv_codes(n_tickers=20, n_days=1, seed=i):
+                f.write(code + "\n")
+        paths.append(path)
+
+    fresh_db(tmpdir)
+    t0 = time.perf_counter()
+    session = gex.ImportSession()
+    gex.import_txt_files(paths, session)
+    session.finish()
+    session.close()
+    report("before: sequential", gex.inserted_count, time.perf_counter() - t0)
+
+    fresh_db(tmpdir)
+    t0 = time.perf_counter()
+    session = gex.ImportSession()
+    parallel_txt_import(paths, session)                 # 實際的 ParallelTxtImport（輪詢與寫入）
+    session.finish()
+    session.close()
+    report("after: ParallelTxtImport", gex.inserted_count, time.perf_counter() - t0)
+    print(f"  {'':<28} {os.cpu_count()} 個 CPU")
+
+
+def make_workbook(path, n_sheets=200, n_rows=250, seed=0):
+    """每個 ticker 一張工作表，除了 Date / TV Code 外還有 OHLC 與備註等用不到的欄位"""
+    rnd = random.Random(seed)
+    start = datetime.date(2020, 1, 1)
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+        for t in range(n_sheets):
+            ticker = ticker_name(t)
+            rows = []
+            for d in range(n_rows):
+                day = start + datetime.timedelta(days=d)
+                parts = [f"{label}, {rnd.uniform(50, 500):.2f}" for label in LEVEL_LABELS]
+                close = rnd.uniform(50, 500)
+                rows.append({"Date": day, "Open": close - 1, "High": close + 2, "Low": close - 2,
+                             "Close": close, "Volume": rnd.randint(10**5, 10**7),
+                             "TV Code": f"{ticker}: " + ", ".join(parts),
+                             "Note": "x" * rnd.randint(20, 200)})
+            pd.DataFrame(rows).to_excel(writer, sheet_name=ticker, index=False)
+
+
+def _measure(load):
+    """回傳 (工作表內容, 秒數, Python 端記憶體峰值 MB)；tracemalloc 會拖慢速度，所以分兩次跑"""
+    t0 = time.perf_counter()
+    sheets = load()
+    elapsed = time.perf_counter() - t0
+    del sheets
+    tracemalloc.start()
+    sheets = load()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return sheets, elapsed, peak
+
+
+def bench_excel_load(tmpdir):
+    """200 張工作表的活頁簿：pd.read_excel 全欄位 vs 只取 Date / TV Code 逐張讀取（讀一張解析一張）"""
+    path = os.path.join(tmpdir, "gex.xlsx")
+    make_workbook(path)
+    print(f"  活頁簿大小 {os.path.getsize(path) / 2**20:.1f} MB")
+
+    def before():
+        xls = pd.ExcelFile(path)
+        return [(name, pd.read_excel(xls, sheet_name=name)) for name in xls.sheet_names]
+
+    def consume(sheets):
+        # 每張工作表解析後只留下摘要，記憶體峰值反映讀取方式本身
+        return [(name, len(rows), int(pd.util.hash_pandas_object(rows).sum()))
+                for name, rows in ((name, gex_parser.parse_tv_code_frame(df)[0]) for name, df in sheets)]
+
+    runs = [("before: read_excel", lambda: consume(before())),
+            ("after: streaming, 1 process", lambda: consume(gex.load_excel_sheets(path, max_workers=1))),
+            (f"after: {os.cpu_count()} processes", lambda: consume(gex.load_excel_sheets(path)))]
+    digests = []
+    for name, load in runs:
+        digest, elapsed, peak = _measure(load)
+        report(name, sum(n for _, n, _ in digest), elapsed)
+        print(f"  {'':<28} 記憶體峰值 {peak:.1f} MB（不含子程序）")
+        digests.append(digest)
+    print(f"  解析結果{'相同' if all(d == digests[0] for d in digests[1:]) else '不同！'}")
+
+
+class _FakeResponse:
+    """APIError 需要的 requests.Response 介面"""
+
+    def __init__(self, code, message):
+        self.status_code = code
+        self.text = message
+        self.headers = {}
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": self.text, "status": "RESOURCE_EXHAUSTED"}}
+
+
+class FakeSheetsClient(data_sources.ReplaySheetsClient):
+    """離線的 gspread client：每次 API 呼叫等待 latency 秒，每 fail_every 次回一次 429"""
+
+    def __init__(self, books, latency=0.05, fail_every=0):
+        super().__init__(data_sources.SheetsFixture.from_values(books), latency)
+        self.fail_every = fail_every
+
+    def request(self):
+        super().request()
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise APIError(_FakeResponse(429, "Quota exceeded"))
+
+
+def make_google_books(n_sheets=300, n_days=60, seed=0):
+    """兩本試算表（SHEET_ID / SHEET_ID_MINOR），每張工作表一個 ticker"""
+    codes = {}
+    for date_str, code in make_tv_codes(n_tickers=n_sheets, n_days=n_days, seed=seed):
+        codes.setdefault(code.split(":")[0], []).append([date_str, code])
+    tickers = list(codes)
+    half = len(tickers) * 2 // 3
+    return {s_id: {t: [["Date", "TV Code"]] + codes[t] for t in part}
+            for s_id, part in ((gex.SHEET_ID, tickers[:half]), (gex.SHEET_ID_MINOR, tickers[half:]))}
+
+
+def bench_google_fetch(tmpdir):
+    """300 張工作表、每次 API 呼叫 50 ms：逐張 get_all_values vs 合併請求 + 執行緒池（含 429 重試）"""
+    books = make_google_books()
+
+    def before():
+        client = FakeSheetsClient(books)
+        return [(ws.title, ws.get_all_values())
+                for s_id in (gex.SHEET_ID, gex.SHEET_ID_MINOR)
+                for ws in client.open_by_key(s_id).worksheets()]
+
+    def after(fail_every=0):
+        client = FakeSheetsClient(books, fail_every=fail_every)
+        return [(sheet.title, sheet.values) for sheet in
+                sheet_fetch.fetch_spreadsheets(client, [gex.SHEET_ID, gex.SHEET_ID_MINOR])]
+
+    backoff = sheet_fetch.BACKOFF_BASE
+    sheet_fetch.BACKOFF_BASE = 0.05                 # 讓 429 重試在基準測試中不用等太久
+    try:
+        results = []
+        for name, load in [("before: one sheet per call", before),
+                           ("after: batched + threads", after),
+                           ("after: with 429 every 3rd call", lambda: after(fail_every=3))]:
+            t0 = time.perf_counter()
+            sheets = load()
+            report(name, len(sheets), time.perf_counter() - t0)
+            results.append(sheets)
+    finally:
+        sheet_fetch.BACKOFF_BASE = backoff
+    print(f"  下載結果{'相同' if all(r == results[0] for r in results[1:]) else '不同！'}")
+
+
+def bench_google_sync(tmpdir):
+    """300 張工作表各新增 1 天：整張重讀 vs 依 sheet_sync_state 只讀新增的列"""
+    today = make_google_books(n_days=250)
+    yesterday = {s_id: {t: values[:-1] for t, values in sheets.items()} for s_id, sheets in today.items()}
+    with quiet_ui():
+        for name, keep_state in [("before: full re-read", False), ("after: new rows only", True)]:
+            fresh_db(tmpdir)
+            gex.auto_import_from_google(client=FakeSheetsClient(yesterday, latency=0))
+            if not keep_state:
+                with gex.get_db().writer() as conn:
+                    conn.execute("DELETE FROM sheet_sync_state")
+            client = FakeSheetsClient(today)
+            t0 = time.perf_counter()
+            gex.auto_import_from_google(client=client)
+            report(name, gex.inserted_count, time.perf_counter() - t0)
+            print(f"  {'':<28} 下載 {client.cells} 格")
+
+
+def make_price_fixture(directory, symbols, start="2020-01-01", n_days=250, seed=0, freq="B"):
+    """在 fixture 資料夾寫入每個代號的隨機日線（欄位同 yf.download auto_adjust=False）"""
+    rnd = random.Random(seed)
+    index = pd.date_range(start, periods=n_days, freq=freq, name="Date")
+    for symbol in symbols:
+        close = [rnd.uniform(50, 500) for _ in index]
+        data_sources.store_prices(directory, symbol, pd.DataFrame(
+            {"Open": close, "High": [c * 1.01 for c in close], "Low": [c * 0.99 for c in close],
+             "Close": close, "Adj Close": close, "Volume": [rnd.randint(10**5, 10**7) for _ in index]},
+            index=index))
+
+
+def bench_replay(tmpdir):
+    """以 fixture 離線重播：Google 試算表自動匯入、單日 OHLC 更新、區間 OHLC 更新（每次呼叫 50 ms）"""
+    fixture_dir = os.path.join(tmpdir, "fixture")
+    books = make_google_books(n_sheets=100, n_days=250)
+    fixture = data_sources.SheetsFixture.from_values(books)
+    for s_id in books:
+        fixture.save(fixture_dir, s_id)
+    make_price_fixture(fixture_dir, [ticker_name(i) for i in range(100)])
+
+    data_sources.configure(data_sources.REPLAY, fixture_dir, latency=0.05)
+    try:
+        with quiet_ui():
+            fresh_db(tmpdir)
+            # update_ohlc / update_ohlc_range 在背景執行緒跑的就是 backfill_ohlc
+            for name, run in [("auto_import_from_google", gex.auto_import_from_google),
+                              ("update_ohlc (100 tickers)",
+                               lambda: gex.backfill_ohlc(start="2020-06-01", end="2020-06-01")),
+                              ("update_ohlc_range (1 year)",
+                               lambda: gex.backfill_ohlc(["AAA"], "2020-01-01", "2020-12-31"))]:
+                with gex.get_db().reader() as conn:
+                    before = conn.execute("SELECT COUNT(*) FROM gex_levels").fetchone()[0]
+                t0 = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - t0
+                with gex.get_db().reader() as conn:
+                    rows = conn.execute("SELECT COUNT(*) FROM gex_levels").fetchone()[0] - before
+                report(name, rows, elapsed)
+    finally:
+        data_sources.configure(data_sources.LIVE)
+
+
+def bench_ohlc_backfill(tmpdir):
+    """100 ticker 缺最後 3 天 + 零星缺口：逐 ticker 區間重下載 vs 依缺口合併下載（每次呼叫 50 ms）"""
+    fixture_dir = os.path.join(tmpdir, "prices_fixture")
+    tickers = [ticker_name(i) for i in range(100)]
+    make_price_fixture(fixture_dir, [gex.yf_symbol(t) for t in tickers], n_days=250, freq="D")
+    data_sources.configure(data_sources.REPLAY, fixture_dir, latency=0.05)
+    calls = []
+    download = data_sources.download_prices
+
+    def counted(*args, **kwargs):
+        calls.append(kwargs.get("tickers"))
+        return download(*args, **kwargs)
+
+    def setup():
+        fresh_db(tmpdir)
+        session = gex.ImportSession()
+        session.add_rows(parse_rows(make_tv_codes(n_tickers=100, n_days=250)))
+        session.finish()
+        session.close()
+        last = gex._day_number("2020-01-01") + 249
+        data_sources.configure(latency=0)
+        gex.backfill_ohlc(end=gex._day_to_date(last - 3))
+        data_sources.configure(latency=0.05)
+        rnd = random.Random(1)
+        with gex.get_db().writer() as conn:         # 零星缺口
+            for _ in range(5):
+                conn.execute(f"""DELETE FROM gex_levels WHERE ticker_id = ? AND day = ?
+                                 AND label_id IN (SELECT id FROM labels WHERE name IN {gex.OHLC_LABELS})""",
+                             (rnd.randint(1, 100), last - rnd.randint(10, 200)))
+            gex._refresh_daily_levels(conn)
+        return last
+
+    def before(last):
+        # 舊的 update_ohlc_range：每個 ticker 下載整段區間，每天都刪掉重寫
+        first = min(day for days in gex.find_ohlc_gaps().values() for day in days)
+        for t in tickers:
+            df = gex.data_sources.download_prices(
+                tickers=gex.yf_symbol(t), start=gex._day_to_date(first), end=gex._day_to_date(last + 1),
+                interval="1d", group_by="ticker", progress=False, auto_adjust=False)
+            data = data_sources.split_download(df, [gex.yf_symbol(t)])[gex.yf_symbol(t)]
+            gex._write_ohlc([(t, gex._day_number(idx), label, float(row[label]))
+                             for idx, row in data.iterrows() for label in gex.OHLC_LABELS])
+
+    try:
+        with mock.patch.object(gex.data_sources, "download_prices", counted):
+            for name, run in [("before: range per ticker", before),
+                              ("after: gap-aware backfill", lambda last: gex.backfill_ohlc())]:
+                last = setup()
+                calls.clear()
+                t0 = time.perf_counter()
+                run(last)
+                elapsed = time.perf_counter() - t0
+                report(name, len(calls), elapsed)
+                print(f"  {'':<28} 下載 {len(calls)} 次，剩餘缺口 {sum(map(len, gex.find_ohlc_gaps().values()))}")
+    finally:
+        data_sources.configure(data_sources.LIVE)
+
+
+def bench_ohlc_bulk(tmpdir):
+    """100 ticker × 10 年日線寫入：舊的 delete_ohlc + 4 次 legacy_insert_data / 根 vs 一個交易的 executemany"""
+    fixture_dir = os.path.join(tmpdir, "bulk_fixture")
+    tickers = [ticker_name(i) for i in range(100)]
+    make_price_fixture(fixture_dir, tickers, start="2010-01-01", n_days=2520)
+    df = data_sources.replay_download(fixture_dir, tickers, start=datetime.date(2010, 1, 1),
+                                      end=datetime.date(2020, 1, 1), group_by="ticker")
+    frames = data_sources.split_download(df, tickers)
+
+    def setup():
+        fresh_db(tmpdir)
+        with gex.get_db().writer() as conn:
+            conn.executemany("INSERT INTO tickers (symbol) VALUES (?)", [(t,) for t in tickers])
+
+    def before(sample):
+        # 舊的 update_ohlc_range：每根 K 線刪一次、寫 4 次，各自一個交易（只跑 sample 支，依速率推算全部）
+        for t in tickers[:sample]:
+            for idx, row in frames[t].iterrows():
+                date_str = idx.date().isoformat()
+                with gex.get_db().writer() as conn:
+                    conn.execute(f"""DELETE FROM gex_levels
+                                     WHERE ticker_id = (SELECT id FROM tickers WHERE symbol = ?) AND day = ?
+                                     AND label_id IN (SELECT id FROM labels WHERE name IN {gex.OHLC_LABELS})""",
+                                 (t, gex._day_number(date_str)))
+                    gex._refresh_daily_levels(conn, "SELECT id, ? FROM tickers WHERE symbol = ?",
+                                              (gex._day_number(date_str), t))
+                for label in gex.OHLC_LABELS:
+                    legacy_insert_data(t, date_str, label, float(row[label]))
+        return sample * len(frames[tickers[0]])
+
+    def after():
+        rows = [row for t in tickers for row in gex.ohlc_frame_rows(t, frames[t])]
+        return gex._write_ohlc(rows) // len(gex.OHLC_LABELS)
+
+    sample = 2
+    setup()
+    t0 = time.perf_counter()
+    bars = before(sample)
+    elapsed = time.perf_counter() - t0
+    report(f"before: per bar ({sample} tickers)", bars, elapsed)
+    print(f"  {'':<28} 推算 100 ticker：{elapsed * len(tickers) / sample:.0f}s，"
+          f"{bars * 5 * len(tickers) // sample} 個交易")
+    for name, run in [("after: executemany (empty)", after), ("after: executemany (upsert)", after)]:
+        if "empty" in name:
+            setup()
+        t0 = time.perf_counter()
+        bars = run()
+        report(name, bars, time.perf_counter() - t0)
+    with gex.get_db().reader() as conn:
+        close = conn.execute("""SELECT close FROM daily_levels WHERE ticker_id = 1 ORDER BY day LIMIT 1""").fetchone()[0]
+    assert close == frames[tickers[0]]["Close"].iloc[0]
+
+
+def bench_bar_store(tmpdir):
+    """100 ticker × 10 年日線：經本機倉庫第一次下載（每次呼叫 50 ms）、再次下載、單一 ticker 讀取"""
+    fixture_dir = os.path.join(tmpdir, "store_fixture")
+    tickers = [ticker_name(i) for i in range(100)]
+    make_price_fixture(fixture_dir, tickers, start="2010-01-01", n_days=2520)
+    calls = []
+
+    class Remote(data_sources.DirectoryProvider):
+        def download(self, tickers, **kwargs):
+            calls.append(len(tickers))
+            return super().download(tickers, **kwargs)
+
+    start, end = datetime.date(2010, 1, 1), datetime.date(2020, 1, 1)
+    for fmt in ([bar_store.PARQUET] if bar_store.pq is not None else []) + [bar_store.CSV]:
+        store = bar_store.BarStore(os.path.join(tmpdir, "bars_" + fmt), fmt)
+        provider = data_sources.CachedProvider(Remote(os.path.join(fixture_dir, "prices"), latency=0.05), store)
+        for name in ("cold", "warm"):
+            calls.clear()
+            t0 = time.perf_counter()
+            bars = sum(len(r.bars[s]) for r in price_fetch.fetch_prices([(tickers, start, end)],
+                                                                         download=provider.download, rate=0)
+                       for s in r.bars)
+            report(f"{fmt} {name}", bars, time.perf_counter() - t0)
+            print(f"  {'':<28} 向資料來源下載 {len(calls)} 次")
+        t0 = time.perf_counter()
+        for t in tickers:
+            store.read(t, start, end)
+        elapsed = time.perf_counter() - t0
+        report(f"{fmt} read 10y / ticker", 2520 * len(tickers), elapsed)
+        print(f"  {'':<28} 每個 ticker {elapsed / len(tickers) * 1000:.1f} ms")
+
+
+def bench_table(tmpdir):
+    """未篩選的資料表格（300k 列）：整張表讀進來 vs 計數 + 一頁 + keyset 捲動 + 拖曳到 90%"""
+    fresh_db(tmpdir)
+    session = gex.ImportSession()
+    session.add_rows(parse_rows(make_tv_codes(n_tickers=100, n_days=250)))
+    session.finish()
+    session.close()
+    page = 30
+
+    t0 = time.perf_counter()
+    rows = gex.fetch_data()
+    report("before: fetch all", len(rows), time.perf_counter() - t0)
+
+    steps = [("after: count", lambda: [gex.count_data()]),
+             ("after: first page", lambda: gex.fetch_data(limit=page))]
+    last = gex.fetch_data(limit=page)[-1]
+    steps.append(("after: scroll 3 rows", lambda: gex.fetch_data(after=(last[5], last[0]), limit=3)))
+    steps.append(("after: seek to 90%", lambda: gex.fetch_data(
+        after=(lambda key: (key[0], key[1] + 1))(gex.locate_data(int(len(rows) * 0.9))), limit=page)))
+    for name, run in steps:
+        t0 = time.perf_counter()
+        result = run()
+        report(name, len(result), time.perf_counter() - t0)
+
+
+def bench_ticker_search(tmpdir):
+    """約 6500 個 ticker，逐字輸入 5 個查詢：每次掃描整個清單 vs TickerIndex（上限 50 筆）"""
+    rnd = random.Random(0)
+    tickers = sorted({"".join(rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rnd.randint(1, 5)))
+                      for _ in range(10000)})[:8000]
+    typed = [query[:i] for query in ("AAPL", "NVDA", "BRK", "QQ", "XYZW") for i in range(1, len(query) + 1)]
+    repeat = 200
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        matches = sum(len([t for t in tickers if value.lower() in t.lower()]) for value in typed)
+    report("before: substring scan", len(typed) * repeat, time.perf_counter() - t0)
+    print(f"  {'':<28} 每輪共 {matches} 筆相符")
+
+    t0 = time.perf_counter()
+    index = TickerIndex(tickers)
+    report("after: build index", len(tickers), time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        matches = sum(len(index.search(value, 50)) for value in typed)
+    report("after: TickerIndex.search", len(typed) * repeat, time.perf_counter() - t0)
+    print(f"  {'':<28} 每輪共 {matches} 筆（每次最多 50 筆）")
+
+
+def bench_bulk_delete(tmpdir):
+    """300k 列中刪除 5000 筆選取列：逐列一個交易 vs 一個交易的集合刪除（含復原紀錄），再復原"""
+    fresh_db(tmpdir)
+    session = gex.ImportSession()
+    session.add_rows(parse_rows(make_tv_codes(n_tickers=100, n_days=250)))
+    session.finish()
+    session.close()
+    with gex.get_db().reader() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM gex_levels ORDER BY id LIMIT 10000")]
+    before, after = ids[:5000], ids[5000:]
+
+    t0 = time.perf_counter()
+    for item in before:
+        with gex.get_db().writer() as conn:
+            key = conn.execute("SELECT ticker_id, day FROM gex_levels WHERE id=?", (item,)).fetchone()
+            conn.execute("DELETE FROM gex_levels WHERE id=?", (item,))
+            if key:
+                gex._refresh_daily_levels(conn, "SELECT ?, ?", key)
+    report("before: per-row delete", len(before), time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    count = gex.delete_levels(f"WHERE g.id IN ({', '.join('?' * len(after))})", after, "benchmark")
+    report("after: set-based delete", count, time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    _, restored, _ = gex.undo_delete()
+    report("after: undo", restored, time.perf_counter() - t0)
+
+
+def bench_ohlc_chunks(tmpdir):
+    """500 ticker × 1 年日線：單次 yf.download vs 分批並行 + 速率限制（每次請求 25% 機率被限流）"""
+    fixture_dir = os.path.join(tmpdir, "chunks_fixture")
+    symbols = [ticker_name(i) for i in range(500)]
+    make_price_fixture(fixture_dir, symbols, n_days=250)
+    start, end = datetime.date(2020, 1, 1), datetime.date(2021, 1, 1)
+    calls = []
+    rnd = random.Random(0)
+
+    def flaky(tickers, **kwargs):
+        # 模擬網路延遲（固定 + 依代號數）與限流；第一次請求一定失敗，讓兩邊條件相同
+        calls.append(len(tickers))
+        time.sleep(0.05 + 0.002 * len(tickers))
+        if len(calls) == 1 or rnd.random() < 0.25:
+            raise RuntimeError("Too Many Requests")
+        return data_sources.replay_download(fixture_dir, tickers, **kwargs)
+
+    def before():
+        try:
+            df = flaky(symbols, start=start, end=end, interval="1d", group_by="ticker")
+            return data_sources.split_download(df, symbols)
+        except RuntimeError:
+            return {}                                # 整批失敗，全部 ticker 都沒有資料
+
+    def after():
+        bars = {}
+        for result in price_fetch.fetch_prices([(symbols, start, end)], download=flaky):
+            bars.update(result.bars)
+        return bars
+
+    backoff = price_fetch.BACKOFF_BASE
+    price_fetch.BACKOFF_BASE = 0.05
+    try:
+        for name, run in [("before: one download", before), ("after: chunked + retries", after)]:
+            calls.clear()
+            rnd.seed(0)
+            t0 = time.perf_counter()
+            bars = run()
+            report(name, sum(len(b) for b in bars.values()), time.perf_counter() - t0)
+            print(f"  {'':<28} 請求 {len(calls)} 次，取得 {len(bars)}/{len(symbols)} 支")
+    finally:
+        price_fetch.BACKOFF_BASE = backoff
+
+
+BENCHMARKS = {
+    "import_write": bench_import_write,
+    "conflict_scan": bench_conflict_scan,
+    "chart_read": bench_chart_read,
+    "parse_sheet": bench_parse_sheet,
+    "txt_stream": bench_txt_stream,
+    "parallel_txt": bench_parallel_txt,
+    "excel_load": bench_excel_load,
+    "google_fetch": bench_google_fetch,
+    "google_sync": bench_google_sync,
+    "replay": bench_replay,
+    "ohlc_backfill": bench_ohlc_backfill,
+    "ohlc_chunks": bench_ohlc_chunks,
+    "ohlc_bulk": bench_ohlc_bulk,
+    "bar_store": bench_bar_store,
+    "table": bench_table,
+    "ticker_search": bench_ticker_search,
+    "bulk_delete": bench_bulk_delete,
+}
+
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"未知的測試項目：{name}（可用：{', '.join(BENCHMARKS)}）")
+            return 1
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in names:
+            print(f"[{name}] {BENCHMARKS[name].__doc__.strip()}")
+            BENCHMARKS[name](tmpdir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
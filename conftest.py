@@ -0,0 +1,29 @@
+"""pytest 共用 fixture"""
+import pytest
+
+import GEX_chart_new as gex
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """暫存資料夾中全新的 stocks.db（已套用所有升級步驟），匯入相關的全域狀態也一併重設"""
+    gex.get_db().close()
+    monkeypatch.setattr(gex, "DB_PATH", str(tmp_path / "stocks.db"))
+    monkeypatch.setattr(gex, "user_conflict_choice", None)
+    monkeypatch.setattr(gex, "cancel_import", False)
+    monkeypatch.setattr(gex, "inserted_count", 0)
+    gex.init_db()
+    yield gex.get_db()
+    gex.get_db().close()
+
+
+@pytest.fixture
+def quiet_ui(monkeypatch):
+    """匯入 / OHLC 流程結束時的訊息視窗與表格更新改為不做事；錯誤視窗改為讓測試失敗"""
+    def fail(title, message, *args, **kwargs):
+        raise AssertionError(f"{title}: {message}")
+    monkeypatch.setattr(gex.messagebox, "showinfo", lambda *args, **kwargs: None)
+    monkeypatch.setattr(gex.messagebox, "showwarning", lambda *args, **kwargs: None)
+    monkeypatch.setattr(gex.messagebox, "showerror", fail)
+    monkeypatch.setattr(gex, "populate_ticker_dropdown", lambda: None)
+    monkeypatch.setattr(gex, "refresh_table", lambda *args, **kwargs: None)
@@ -0,0 +1,491 @@
+"""
+外部資料來源（Google 試算表、yfinance）的切換層
+
+- live：直接連線（預設）
+- record：照常連線，並把回應存進 fixture 資料夾
+- replay：只讀 fixture，不需要網路與 service_account.json，每次呼叫可加上固定延遲，
+  用來在離線環境重現匯入 / OHLC 更新並量測耗時
+
+模式由 configure() 或環境變數 GEX_DATA_SOURCE（live / record / replay）、
+GEX_FIXTURE_DIR、GEX_REPLAY_LATENCY（秒）決定。
+
+日線另可由 GEX_PRICE_DIR 指定本機資料夾（例如廠商提供的歷史資料）取代 yfinance；
+設定 GEX_BAR_STORE（本機資料夾，預設不啟用）時，連線模式下載到的日線會存進這個倉庫，
+同一段區間之後直接讀檔（見 bar_store.py），換電腦或重建資料庫後補 OHLC 不必重新下載。
+圖表的 OHLC 一律讀資料庫的 daily_levels，不經過日線來源。
+
+fixture 資料夾結構：
+    sheets/<試算表 ID>.json   工作表順序、格線列數與各列內容（依列號存放，可只有部分列）
+    prices/<yfinance 代號>.csv 日線（Date 為 index，欄位同 yf.download）
+"""
+import abc
+import json
+import os
+import re
+import threading
+import time
+import typing
+
+import pandas as pd
+import yfinance as yf
+import gspread
+from gspread.exceptions import SpreadsheetNotFound
+from gspread.utils import fill_gaps
+from oauth2client.service_account import ServiceAccountCredentials
+
+from bar_store import BarStore
+
+LIVE, RECORD, REPLAY = "live", "record", "replay"
+
+_mode = os.environ.get("GEX_DATA_SOURCE", LIVE)
+_fixture_dir = os.environ.get("GEX_FIXTURE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              "fixtures"))
+_latency = float(os.environ.get("GEX_REPLAY_LATENCY", "0"))
+_price_dir = os.environ.get("GEX_PRICE_DIR", "")
+_bar_store_dir = os.environ.get("GEX_BAR_STORE", "")
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def configure(mode: typing.Optional[str] = None, fixture_dir: typing.Optional[str] = None,
+              latency: typing.Optional[float] = None, price_dir: typing.Optional[str] = None,
+              bar_store: typing.Optional[str] = None):
+    """切換資料來源；未指定的參數維持原值（price_dir / bar_store 給空字串代表停用）"""
+    global _mode, _fixture_dir, _latency, _price_dir, _bar_store_dir, _provider
+    if mode is not None:
+        if mode not in (LIVE, RECORD, REPLAY):
+            raise ValueError(f"未知的資料來源模式：{mode}")
+        _mode = mode
+    if fixture_dir is not None:
+        _fixture_dir = fixture_dir
+    if latency is not None:
+        _latency = latency
+    if price_dir is not None:
+        _price_dir = price_dir
+    if bar_store is not None:
+        _bar_store_dir = bar_store
+    with _provider_lock:
+        _provider = None
+
+
+def needs_credentials() -> bool:
+    """replay 以外的模式都要連線 Google，需要 service_account.json"""
+    return _mode != REPLAY
+
+
+# --- Google 試算表 ---
+_A1_RANGE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!]+))(?:!(\d+):(\d+))?$")
+
+
+def parse_a1(a1: str) -> typing.Tuple[str, int, typing.Optional[int]]:
+    """sheet_fetch 用到的兩種範圍：'名稱'（整張）與 '名稱'!first:last（整列）→ (名稱, first, last)"""
+    m = _A1_RANGE.match(a1)
+    if not m:
+        raise ValueError(f"不支援的範圍：{a1}")
+    title = m.group(1).replace("''", "'") if m.group(1) is not None else m.group(2)
+    if m.group(3) is None:
+        return title, 1, None
+    return title, int(m.group(3)), int(m.group(4))
+
+
+class SheetsFixture:
+    """
+    試算表內容：{試算表 ID: {工作表名稱: {"row_count": 格線列數, "rows": {列號: 列}}}}
+    工作表依加入順序保存（即 worksheets() 的順序）
+    """
+
+    def __init__(self, books=None):
+        self.books = books or {}
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_values(cls, books: typing.Mapping[str, typing.Mapping[str, typing.List[list]]]
+                    ) -> "SheetsFixture":
+        """由 {試算表 ID: {工作表名稱: 整張工作表的值}} 建立（格線至少 1000 列，同新試算表）"""
+        return cls({s_id: {title: {"row_count": max(1000, len(values)),
+                                   "rows": {i: list(row) for i, row in enumerate(values, 1)}}
+                           for title, values in sheets.items()}
+                    for s_id, sheets in books.items()})
+
+    @classmethod
+    def load(cls, directory: str) -> "SheetsFixture":
+        books = {}
+        sheets_dir = os.path.join(directory, "sheets")
+        if os.path.isdir(sheets_dir):
+            for name in sorted(os.listdir(sheets_dir)):
+                if name.endswith(".json"):
+                    with open(os.path.join(sheets_dir, name), encoding="utf-8") as f:
+                        data = json.load(f)
+                    books[name[:-len(".json")]] = {
+                        ws["title"]: {"row_count": ws["row_count"],
+                                      "rows": {int(i): row for i, row in ws["rows"].items()}}
+                        for ws in data["worksheets"]}
+        return cls(books)
+
+    def save(self, directory: str, s_id: str):
+        sheets_dir = os.path.join(directory, "sheets")
+        os.makedirs(sheets_dir, exist_ok=True)
+        path = os.path.join(sheets_dir, f"{s_id}.json")
+        with self.lock:                  # 錄製時多個執行緒會同時寫同一個檔案
+            data = {"worksheets": [{"title": title, "row_count": ws["row_count"],
+                                    "rows": {str(i): ws["rows"][i] for i in sorted(ws["rows"])}}
+                                   for title, ws in self.books.get(s_id, {}).items()]}
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+
+    def set_worksheets(self, s_id: str, worksheets: typing.Sequence[typing.Tuple[str, int]]):
+        """記下工作表順序與格線列數，已刪除的工作表一併移除"""
+        with self.lock:
+            old = self.books.get(s_id, {})
+            self.books[s_id] = {title: {"row_count": row_count,
+                                        "rows": old.get(title, {}).get("rows", {})}
+                                for title, row_count in worksheets}
+
+    def values(self, s_id: str, title: str, first: int = 1, last: typing.Optional[int] = None
+               ) -> typing.List[list]:
+        """同 API：範圍內的列（中間的空白列為 []），尾端空白列省略"""
+        with self.lock:
+            rows = self.books[s_id][title]["rows"]
+            present = [i for i in rows if i >= first and (last is None or i <= last) and rows[i]]
+            if not present:
+                return []
+            return [list(rows.get(i, [])) for i in range(first, max(present) + 1)]
+
+    def store(self, s_id: str, title: str, first: int, last: typing.Optional[int],
+              values: typing.Sequence[list]):
+        """寫入 API 回傳的範圍內容；範圍內未回傳的列代表已是空白"""
+        with self.lock:
+            sheet = self.books.setdefault(s_id, {}).setdefault(title, {"row_count": 0, "rows": {}})
+            rows = sheet["rows"]
+            for i in [i for i in rows if i >= first and (last is None or i <= last)]:
+                del rows[i]
+            for i, row in enumerate(values, first):
+                if row:
+                    rows[i] = list(row)
+
+
+class ReplayWorksheet:
+    def __init__(self, spreadsheet: "ReplaySpreadsheet", title: str, row_count: int):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.row_count = row_count
+
+    def get_all_values(self):
+        self.spreadsheet.client.request()
+        values = self.spreadsheet.client.fixture.values(self.spreadsheet.id, self.title)
+        return fill_gaps(values) if values else []
+
+
+class ReplaySpreadsheet:
+    def __init__(self, client: "ReplaySheetsClient", s_id: str):
+        self.client = client
+        self.id = s_id
+
+    def worksheets(self):
+        self.client.request()
+        return [ReplayWorksheet(self, title, ws["row_count"])
+                for title, ws in self.client.fixture.books[self.id].items()]
+
+    def values_batch_get(self, ranges, params=None):
+        self.client.request()
+        value_ranges = []
+        for a1 in ranges:
+            title, first, last = parse_a1(a1)
+            values = self.client.fixture.values(self.id, title, first, last)
+            self.client.cells += sum(len(row) for row in values)
+            # 同 API：沒有資料的範圍不含 values
+            value_ranges.append({"range": a1, "values": values} if values else {"range": a1})
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+
+class ReplaySheetsClient:
+    """
+    以 SheetsFixture 回應的 gspread client（只實作 sheet_fetch 用到的部分）
+    每次 API 呼叫等待 latency 秒；calls / cells 累計呼叫次數與回傳的儲存格數
+    """
+
+    def __init__(self, fixture: SheetsFixture, latency: float = 0.0):
+        self.fixture = fixture
+        self.latency = latency
+        self.calls = 0
+        self.cells = 0
+
+    def request(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_by_key(self, s_id: str) -> ReplaySpreadsheet:
+        self.request()
+        if s_id not in self.fixture.books:
+            raise SpreadsheetNotFound(s_id)
+        return ReplaySpreadsheet(self, s_id)
+
+
+class RecordingSpreadsheet:
+    """轉呼叫真正的 Spreadsheet，並把工作表清單與讀到的內容寫進 fixture"""
+
+    def __init__(self, spreadsheet, fixture: SheetsFixture, directory: str):
+        self.spreadsheet = spreadsheet
+        self.fixture = fixture
+        self.directory = directory
+        self.id = spreadsheet.id
+
+    def worksheets(self):
+        worksheets = self.spreadsheet.worksheets()
+        self.fixture.set_worksheets(self.id, [(ws.title, ws.row_count) for ws in worksheets])
+        self.fixture.save(self.directory, self.id)
+        return worksheets
+
+    def values_batch_get(self, ranges, params=None):
+        response = self.spreadsheet.values_batch_get(ranges, params)
+        for a1, value_range in zip(ranges, response.get("valueRanges", [])):
+            title, first, last = parse_a1(a1)
+            self.fixture.store(self.id, title, first, last, value_range.get("values", []))
+        self.fixture.save(self.directory, self.id)
+        return response
+
+
+class RecordingSheetsClient:
+    def __init__(self, client, directory: str):
+        self.client = client
+        self.directory = directory
+        self.fixture = SheetsFixture.load(directory)
+
+    def open_by_key(self, s_id: str) -> RecordingSpreadsheet:
+        return RecordingSpreadsheet(self.client.open_by_key(s_id), self.fixture, self.directory)
+
+
+def _live_sheets_client(service_account_file: str):
+    scope = ['https://spreadsheets.google.com/feeds',
+             'https://www.googleapis.com/auth/drive']
+    creds = ServiceAccountCredentials.from_json_keyfile_name(service_account_file, scope)
+    return gspread.authorize(creds)
+
+
+def sheets_client(service_account_file: str):
+    """依目前模式建立 Google Sheets client"""
+    if _mode == REPLAY:
+        return ReplaySheetsClient(SheetsFixture.load(_fixture_dir), _latency)
+    client = _live_sheets_client(service_account_file)
+    if _mode == RECORD:
+        return RecordingSheetsClient(client, _fixture_dir)
+    return client
+
+
+# --- yfinance 日線 ---
+def _price_path(directory: str, symbol: str) -> str:
+    return os.path.join(directory, "prices", f"{symbol}.csv")
+
+
+def load_prices(directory: str, symbol: str) -> pd.DataFrame:
+    path = _price_path(directory, symbol)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    # round_trip：讀回與寫入時完全相同的浮點數，重播結果才會與錄製時一致
+    return pd.read_csv(path, index_col="Date", parse_dates=["Date"], float_precision="round_trip")
+
+
+def store_prices(directory: str, symbol: str, bars: pd.DataFrame):
+    """併入既有的日線，同一天以新資料為準"""
+    bars = bars.dropna(how="all")
+    if bars.empty:
+        return
+    index = pd.DatetimeIndex(bars.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    bars = bars.set_axis(index.rename("Date"))
+    merged = pd.concat([load_prices(directory, symbol), bars])
+    merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+    os.makedirs(os.path.dirname(_price_path(directory, symbol)), exist_ok=True)
+    merged.to_csv(_price_path(directory, symbol))
+
+
+def split_download(df: pd.DataFrame, symbols: typing.Sequence[str]
+                    ) -> typing.Dict[str, pd.DataFrame]:
+    """yf.download 的結果拆成 {代號: 日線}（多層欄位時依代號分組）"""
+    if not isinstance(df.columns, pd.MultiIndex):
+        return {symbols[0]: df} if len(symbols) == 1 else {}
+    level = 0 if set(df.columns.get_level_values(0)) & set(symbols) else 1
+    return {symbol: df.xs(symbol, axis=1, level=level)
+            for symbol in symbols if symbol in df.columns.get_level_values(level)}
+
+
+def _window(bars: pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+    if bars.empty:
+        return bars
+    if start is not None:
+        bars = bars[bars.index >= pd.Timestamp(start)]
+    if end is not None:
+        bars = bars[bars.index < pd.Timestamp(end)]
+    return bars
+
+
+def _combine(frames: typing.Mapping[str, pd.DataFrame], group_by: str = "ticker") -> pd.DataFrame:
+    """{代號: 日線} → yf.download 的多層欄位；沒有任何資料時回傳空的 DataFrame"""
+    frames = {symbol: bars for symbol, bars in frames.items() if not bars.empty}
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, axis=1)
+    if group_by != "ticker":
+        df = df.swaplevel(axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+    return df
+
+
+def _symbols(tickers) -> typing.List[str]:
+    return [tickers] if isinstance(tickers, str) else list(tickers)
+
+
+class PriceProvider(abc.ABC):
+    """
+    日線來源：download() 的參數與回傳格式同 yf.download
+    （[start, end) 區間、group_by="ticker" 時欄位為 (代號, 欄位)；沒有資料的代號不出現在結果中）
+    """
+
+    @abc.abstractmethod
+    def download(self, tickers, start=None, end=None, interval="1d", group_by="ticker",
+                 **kwargs) -> pd.DataFrame:
+        ...
+
+
+class YFinanceProvider(PriceProvider):
+    def download(self, tickers, start=None, end=None, interval="1d", group_by="ticker", **kwargs):
+        return yf.download(tickers=tickers, start=start, end=end, interval=interval,
+                           group_by=group_by, **kwargs)
+
+
+class FrameProvider(PriceProvider):
+    """記憶體中的 {代號: 日線}（Date 為 index），供測試與量測使用"""
+
+    def __init__(self, frames: typing.Mapping[str, pd.DataFrame], latency: float = 0.0):
+        self.frames = dict(frames)
+        self.latency = latency
+
+    def load(self, symbol: str) -> pd.DataFrame:
+        return self.frames.get(symbol, pd.DataFrame())
+
+    def download(self, tickers, start=None, end=None, interval="1d", group_by="ticker", **kwargs):
+        if interval != "1d":
+            raise ValueError(f"{type(self).__name__} 只有日線資料")
+        if self.latency:
+            time.sleep(self.latency)
+        return _combine({symbol: _window(self.load(symbol), start, end) for symbol in _symbols(tickers)},
+                        group_by)
+
+
+class DirectoryProvider(FrameProvider):
+    """
+    本機日線資料夾：<代號>.parquet 或 <代號>.csv（Date 為 index 或第一欄，欄位同 yf.download），
+    例如廠商提供的歷史資料或 fixture 的 prices/；每次都從檔案讀取
+    """
+
+    def __init__(self, directory: str, latency: float = 0.0):
+        super().__init__({}, latency)
+        self.directory = directory
+
+    def load(self, symbol: str) -> pd.DataFrame:
+        path = os.path.join(self.directory, symbol)
+        if os.path.exists(path + ".parquet"):
+            bars = pd.read_parquet(path + ".parquet")
+            if "Date" in bars.columns:
+                bars = bars.set_index("Date")
+            return bars.set_axis(pd.DatetimeIndex(bars.index, name="Date"))
+        if os.path.exists(path + ".csv"):
+            return pd.read_csv(path + ".csv", index_col=0, parse_dates=[0],
+                               float_precision="round_trip").rename_axis("Date")
+        return pd.DataFrame()
+
+
+class RecordingProvider(PriceProvider):
+    """照常向 upstream 下載，並把結果存進 fixture 的 prices/"""
+
+    def __init__(self, upstream: PriceProvider, fixture_dir: str):
+        self.upstream = upstream
+        self.fixture_dir = fixture_dir
+
+    def download(self, tickers, **kwargs):
+        df = self.upstream.download(tickers, **kwargs)
+        if not df.empty:
+            for symbol, bars in split_download(df, _symbols(tickers)).items():
+                store_prices(self.fixture_dir, symbol, bars)
+        return df
+
+
+class CachedProvider(PriceProvider):
+    """
+    先查本機倉庫，只向 upstream 下載還沒取得過的區間（缺口相同的代號合併成一次下載），
+    寫入倉庫後整段從倉庫讀出
+    - 倉庫只存 auto_adjust=False 的日線：非日線、沒有指定起訖日或其他會改變內容的參數直接交給 upstream
+    - yfinance 個別代號下載失敗時不拋例外，只是結果中沒有那個代號；因此同一次下載有其他代號取得資料，
+      才把沒有資料的代號記為已取得（休市、尚未上市），整批都沒有資料或 upstream 拋出例外時不記錄
+    """
+    PASSTHROUGH_OPTIONS = {"progress", "threads", "timeout"}    # 不影響下載內容的參數
+
+    def __init__(self, upstream: PriceProvider, store: BarStore):
+        self.upstream = upstream
+        self.store = store
+
+    @classmethod
+    def cacheable(cls, interval, start, end, **kwargs) -> bool:
+        options = dict(kwargs)
+        # 沒有指定 auto_adjust 時 yfinance 預設為 True（還原權息），與倉庫內容不同
+        return (interval == "1d" and start is not None and end is not None
+                and options.pop("auto_adjust", True) is False and not set(options) - cls.PASSTHROUGH_OPTIONS)
+
+    def download(self, tickers, start=None, end=None, interval="1d", group_by="ticker", **kwargs):
+        if not self.cacheable(interval, start, end, **kwargs):
+            return self.upstream.download(tickers, start=start, end=end, interval=interval,
+                                          group_by=group_by, **kwargs)
+        start, end = pd.Timestamp(start).date(), pd.Timestamp(end).date()
+        symbols = _symbols(tickers)
+        pending = {}
+        for symbol in symbols:
+            gaps = self.store.missing(symbol, start, end)
+            if gaps:
+                pending.setdefault((gaps[0][0], gaps[-1][1]), []).append(symbol)
+        for (first, last), group in pending.items():
+            df = self.upstream.download(group, start=first, end=last, interval=interval,
+                                        group_by="ticker", **kwargs)
+            found = {symbol: bars.dropna(how="all")
+                     for symbol, bars in (split_download(df, group) if not df.empty else {}).items()}
+            found = {symbol: bars for symbol, bars in found.items() if not bars.empty}
+            if not found:
+                continue
+            for symbol in group:
+                self.store.write(symbol, found.get(symbol, pd.DataFrame()), first, last)
+        return _combine({symbol: self.store.read(symbol, start, end) for symbol in symbols}, group_by)
+
+
+def price_provider() -> PriceProvider:
+    """
+    依目前設定組合日線來源：replay 讀 fixture；其他模式為 yfinance（或 GEX_PRICE_DIR 的本機資料夾），
+    record 另存一份到 fixture；連線到 yfinance 時外層再包本機倉庫
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if _mode == REPLAY:
+                provider = DirectoryProvider(os.path.join(_fixture_dir, "prices"), _latency)
+            elif _price_dir:
+                provider = DirectoryProvider(_price_dir)
+            else:
+                provider = YFinanceProvider()
+                if _bar_store_dir:
+                    provider = CachedProvider(provider, BarStore(_bar_store_dir))
+            if _mode == RECORD:
+                provider = RecordingProvider(provider, _fixture_dir)
+            _provider = provider
+        return _provider
+
+
+def replay_download(directory: str, tickers, start=None, end=None, interval="1d",
+                    group_by="ticker", latency: float = 0.0, **kwargs) -> pd.DataFrame:
+    """以 fixture 的日線模擬 yf.download（與目前 yfinance 的 group_by="ticker" 相同）"""
+    return DirectoryProvider(os.path.join(directory, "prices"), latency).download(
+        tickers, start=start, end=end, interval=interval, group_by=group_by)
+
+
+def download_prices(tickers, **kwargs) -> pd.DataFrame:
+    """依目前設定的日線來源下載（參數同 yf.download）"""
+    return price_provider().download(tickers, **kwargs)
@@ -0,0 +1,404 @@
+"""
+GEX TV Code 解析（純函式，不依賴 Tk 與資料庫）
+
+獨立成模組，多程序匯入的子程序只呼叫這裡的函式（子程序如何載入主程式見 ParallelTxtImport）。
+解析結果一律是 (ticker, date, label, value) 列，寫入由主程式的 ImportSession 負責。
+"""
+import dataclasses
+import datetime
+import functools
+import hashlib
+import os
+import re
+import typing
+
+import openpyxl
+import pandas as pd
+
+TV_CODE_LABEL = "TV Code"
+TV_CODE_DATE_PATTERN = r'^[A-Za-z\.]+\s+(\d{8})\b'
+# 工作表匯入只會用到這兩欄
+SHEET_COLUMNS = ('Date', 'TV Code')
+
+Row = typing.Tuple[str, str, str, typing.Union[float, str]]
+
+# 過濾後剩不到這麼多列時逐列以 parse_code 解析：pandas 每次呼叫的固定成本約 10 ms，
+# 增量同步時每張工作表通常只有一兩列新資料
+SMALL_FRAME_ROWS = 64
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+@functools.lru_cache(maxsize=65536)
+def day_number(date_str) -> typing.Optional[int]:
+    """日期字串 → 1970-01-01 起算的日數（資料表 day 欄位）；無法解析回傳 None"""
+    try:
+        d = datetime.date.fromisoformat(str(date_str)[:10])
+    except ValueError:
+        ts = pd.to_datetime(date_str, errors="coerce")
+        if pd.isna(ts):
+            return None
+        d = ts.date()
+    return d.toordinal() - _EPOCH_ORDINAL
+
+
+def day_to_date(day: int) -> datetime.date:
+    return datetime.date.fromordinal(day + _EPOCH_ORDINAL)
+
+
+def content_hash(text: str) -> int:
+    """內容雜湊（64-bit 有號整數）：tv_codes 的主鍵、已匯入 TV Code 的識別"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(),
+                          "big", signed=True)
+
+
+def code_key(day: int, code: str) -> int:
+    """已匯入 TV Code 的識別：實際寫入的日期 + 原文（imported_codes 的主鍵）"""
+    return content_hash(f"{day}\n{code}")
+
+
+# 多程序匯入時由 ProcessPoolExecutor 的 initializer 設定，子程序據此略過已匯入的 TV Code
+_known_codes: typing.AbstractSet[int] = frozenset()
+
+
+def set_known_codes(keys: typing.AbstractSet[int]):
+    global _known_codes
+    _known_codes = keys
+
+
+def parse_date(val) -> typing.Optional[datetime.date]:
+    """將任何輸入轉成 datetime.date；轉換失敗回傳 None"""
+    ts = pd.to_datetime(val, errors="coerce")
+    return ts.date() if pd.notna(ts) else None
+
+
+def extract_date_from_tv_code(tv_code: str) -> typing.Optional[datetime.date]:
+    """
+    若 TV Code 為「TICKER YYYYMMDD hhmmss TICKER: …」格式，
+    取出中間的 YYYYMMDD 為日期；否則（含不存在的日期，如 20241399）回傳 None，改用 Date 欄
+    """
+    m = re.match(TV_CODE_DATE_PATTERN, tv_code)
+    if m:
+        try:
+            return datetime.datetime.strptime(m.group(1), '%Y%m%d').date()
+        except ValueError:
+            pass
+    return None
+
+
+def stored_date(orig_date: str, gex_code: str) -> str:
+    """TV Code 實際寫入的日期：內嵌日期 > 傳入的日期"""
+    embedded = extract_date_from_tv_code(gex_code)
+    return embedded.isoformat() if embedded else orig_date.split(" ")[0]
+
+
+def parse_code(orig_date: str, gex_code: str
+               ) -> typing.Optional[typing.Tuple[str, typing.List[Row]]]:
+    """
+    解析單一 GEX TV Code，回傳 (ticker, 列)；找不到 ticker 時回傳 None
+    - 若 TV Code 自帶日期，優先使用
+    - 第一列是 TV Code 原文（label = 'TV Code'），其後依序為各 level
+    """
+    # 內嵌日期 > Date 欄
+    date_str = stored_date(orig_date, gex_code)
+
+    # 取 ticker（第一個 XXX:）
+    m = re.search(r"([A-Za-z\.]+):", gex_code)
+    if not m:
+        return None
+    ticker = m.group(1).upper()
+
+    rows = [(ticker, date_str, TV_CODE_LABEL, gex_code.strip())]
+    code_body = gex_code[m.end():].strip()
+    elements = re.split(r',\s*', code_body)
+    i = 0
+    while i < len(elements) - 1:
+        labels = elements[i].strip()
+        try:
+            value = float(elements[i + 1].strip())
+            for label in labels.split('&'):
+                rows.append((ticker, date_str, label.strip(), value))
+            i += 2
+        except ValueError:
+            i += 1
+    return ticker, rows
+
+
+def _first_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """取出欄位；標題重複時只取第一欄"""
+    col = df[name]
+    return col.iloc[:, 0] if isinstance(col, pd.DataFrame) else col
+
+
+def _parse_date_column(col: pd.Series) -> pd.Series:
+    """
+    parse_date 的整欄版本，回傳只到日期的 datetime64 欄（失敗為 NaT）
+    批次轉換失敗（混合時區等）的值再以 parse_date 逐一補救，結果與逐列相同
+    """
+    try:
+        ts = pd.to_datetime(col, errors="coerce", format="mixed")
+        if getattr(ts.dt, "tz", None) is not None:
+            ts = ts.dt.tz_localize(None)
+    except (ValueError, TypeError, AttributeError):
+        ts = pd.Series(pd.NaT, index=col.index, dtype="datetime64[ns]")
+    retry = ts.isna() & col.notna()
+    if retry.any():
+        fixed = {v: parse_date(v) for v in pd.unique(col[retry])}
+        ts = ts.where(~retry, pd.to_datetime(col[retry].map(fixed)))
+    return ts.dt.normalize()
+
+
+def _to_float(token: str) -> typing.Optional[float]:
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def _parse_code_rows(codes: pd.Series, dates: pd.Series
+                     ) -> typing.Tuple[pd.DataFrame, typing.List[str]]:
+    """parse_tv_code_frame 的逐列版本（列數少時較快），結果相同"""
+    rows, invalid = [], []
+    for code, date in zip(codes.tolist(), dates.tolist()):
+        parsed = parse_code(date.date().isoformat(), code)
+        if parsed is None:
+            invalid.append(code)
+        else:
+            rows.extend(parsed[1])
+    return pd.DataFrame(rows, columns=["ticker", "date", "label", "value"]), invalid
+
+
+def parse_tv_code_frame(df: pd.DataFrame, latest_date=None,
+                        known: typing.AbstractSet[int] = frozenset()
+                        ) -> typing.Tuple[pd.DataFrame, typing.List[str]]:
+    """
+    以整欄運算解析工作表的 TV Code / Date 欄，回傳 (長表, 無法解析的 TV Code)
+    - 長表欄位為 ticker / date / label / value，內容與順序都與逐列呼叫
+      parse_code 相同（TV Code 原文在前，同一列內依出現順序）
+    - 日期優先順序：TV Code 內嵌 > Date 欄；早於 latest_date 的列略過
+    - code_key 在 known 內（先前已匯入過）的列在解析前就略過
+    - label / value 配對：某元素的下一個元素能用 float() 轉換時成為 label，
+      並跳過該數值；等同 parse_code 的 while 迴圈
+    """
+    empty = pd.DataFrame(columns=["ticker", "date", "label", "value"])
+    if 'TV Code' not in df.columns or df.empty:
+        return empty, []
+
+    codes = _first_column(df, 'TV Code').map(str).str.strip().reset_index(drop=True)
+    dates = pd.to_datetime(codes.str.extract(TV_CODE_DATE_PATTERN, expand=False),
+                           format='%Y%m%d', errors='coerce')
+    if 'Date' in df.columns:
+        missing = dates.isna()
+        if missing.any():
+            column = _first_column(df, 'Date').reset_index(drop=True)[missing]
+            dates[missing] = _parse_date_column(column)
+
+    keep = codes.ne('') & codes.str.lower().ne('nan') & dates.notna()
+    if latest_date:
+        keep &= dates >= pd.Timestamp(latest_date)
+    codes, dates = codes[keep], dates[keep]
+    if known and not codes.empty:
+        days = dates.to_numpy().astype("datetime64[D]").astype("int64").tolist()
+        seen = [code_key(day, code) in known for day, code in zip(days, codes.tolist())]
+        codes, dates = codes[[not s for s in seen]], dates[[not s for s in seen]]
+    if codes.empty:                      # 全部早於 latest_date 或已匯入過（增量同步的常態）
+        return empty, []
+    if len(codes) < SMALL_FRAME_ROWS:
+        return _parse_code_rows(codes, dates)
+
+    # 取 ticker（第一個 XXX:）與其後的內容
+    parts = codes.str.extract(r'(?s)^.*?([A-Za-z\.]+):(.*)$')
+    invalid = codes[parts[0].isna()].tolist()
+    parts = parts[parts[0].notna()]
+    if parts.empty:
+        return empty, invalid
+    codes, dates = codes[parts.index], dates[parts.index]
+    tickers = parts[0].str.upper()
+    date_strs = dates.map({d: d.date().isoformat() for d in dates.unique()})
+
+    tv_rows = pd.DataFrame({"ticker": tickers, "date": date_strs,
+                            "label": TV_CODE_LABEL, "value": codes, "pos": -1})
+
+    # 每個元素一列，index 仍是原本的列號；以 \s*,\s* 切開即等同逐一 strip()
+    tokens = parts[1].str.strip().str.split(r'\s*,\s*', regex=True).explode()
+    lookup = {t: _to_float(t) for t in pd.unique(tokens)}
+    numeric = tokens.isin([t for t, v in lookup.items() if v is not None])
+    values = tokens.map(lookup)
+    row_ids = pd.Series(tokens.index, index=tokens.index)
+    pos = row_ids.groupby(level=0).cumcount()
+
+    # 下一個元素是數值 → 候選 label；連續候選中只有第 0、2、4… 個會成為 label
+    same_row_next = row_ids.eq(row_ids.shift(-1))
+    candidate = numeric.shift(-1, fill_value=False).astype(bool) & same_row_next
+    prev_candidate = candidate.shift(1, fill_value=False) & row_ids.eq(row_ids.shift(1))
+    run_id = (candidate & ~prev_candidate).cumsum()
+    is_label = candidate & (candidate.groupby(run_id).cumcount() % 2 == 0)
+
+    # 「A & B」拆成多個 label 共用同一個數值
+    label_index = tokens.index[is_label]
+    labels = [[part.strip() for part in label.split('&')] if '&' in label else label
+              for label in tokens[is_label].tolist()]
+    level_rows = pd.DataFrame({"ticker": tickers[label_index].to_numpy(),
+                               "date": date_strs[label_index].to_numpy(),
+                               "label": labels,
+                               "value": values.shift(-1)[is_label].to_numpy(),
+                               "pos": pos[is_label].to_numpy()},
+                              index=label_index).explode("label")
+
+    rows = pd.concat([tv_rows, level_rows])
+    rows["row"] = rows.index
+    rows = rows.sort_values(["row", "pos"], kind="stable")
+    return rows[["ticker", "date", "label", "value"]].reset_index(drop=True), invalid
+
+
+def default_date_from_filename(file_path: str) -> typing.Optional[str]:
+    """嘗試從檔名解析日期 (例如: 20251212_TV Code.txt)"""
+    date_match = re.search(r"(\d{8})", os.path.basename(file_path))
+    if date_match:
+        try:
+            return pd.to_datetime(date_match.group(1), format='%Y%m%d').date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+@dataclasses.dataclass
+class TxtCursor:
+    """
+    TXT 的讀取進度：offset 是已完整讀完（以換行結尾）的位元組位置，
+    current_date 是該位置當下的日期行狀態；檔案尾端附加資料時可從這裡接續
+    """
+    offset: int = 0
+    current_date: typing.Optional[str] = None
+
+    @classmethod
+    def start(cls, file_path: str) -> "TxtCursor":
+        return cls(0, default_date_from_filename(file_path))
+
+
+def iter_txt_codes(file_path: str, cursor: typing.Optional[TxtCursor] = None
+                   ) -> typing.Iterator[typing.Tuple[str, str, int]]:
+    """
+    逐行讀取 TXT（不整檔載入），產生 (日期, GEX Code 行, 目前已讀位元組數)
+    - 含 ":" 的行是 GEX Code，日期用最近一次的日期行，沒有則用檔名日期
+    - 其他行嘗試當作日期行（舊格式相容）
+    - 從 cursor 的位置開始，並隨讀取進度更新 cursor（最後一行沒有換行時不前進）
+    """
+    if cursor is None:
+        cursor = TxtCursor.start(file_path)
+    bytes_read = cursor.offset
+    with open(file_path, "rb") as f:
+        f.seek(cursor.offset)
+        for raw in f:
+            bytes_read += len(raw)
+            complete = raw.endswith(b"\n")
+            line = raw.decode("utf-8").strip()
+            if line:
+                # 判斷是否為 GEX Code 行 (包含 ":")
+                if ":" in line:
+                    # 若無 current_date，使用當日作為備案 (parse_code 會優先嘗試內嵌日期)
+                    yield cursor.current_date or datetime.date.today().isoformat(), line, bytes_read
+                elif complete:
+                    # 嘗試解析為日期行 (舊格式相容)
+                    try:
+                        potential_date = line.split("_")[0]
+                        pd.to_datetime(potential_date)
+                        cursor.current_date = potential_date
+                    except (ValueError, TypeError, OverflowError):
+                        pass
+            if complete:
+                cursor.offset = bytes_read
+
+
+def is_known_code(use_date: str, line: str, known: typing.AbstractSet[int]) -> bool:
+    """TXT 的 GEX Code 行是否已匯入過（不必解析 label / value）"""
+    if not known:
+        return False
+    day = day_number(stored_date(use_date, line))
+    return day is not None and code_key(day, line) in known
+
+
+def parse_txt_file(file_path: str, cursor: typing.Optional[TxtCursor] = None
+                   ) -> typing.Tuple[typing.List[Row], typing.List[str], typing.Optional[str], TxtCursor]:
+    """
+    解析 TXT 檔（多程序匯入時每個子程序處理一個檔案），已匯入過的 TV Code 直接略過，
+    回傳 (列, 無法解析的 TV Code, 讀檔錯誤訊息, 讀取進度)
+    """
+    if cursor is None:
+        cursor = TxtCursor.start(file_path)
+    rows, invalid = [], []
+    try:
+        for use_date, line, _ in iter_txt_codes(file_path, cursor):
+            if is_known_code(use_date, line, _known_codes):
+                continue
+            parsed = parse_code(use_date, line)
+            if parsed is None:
+                invalid.append(line)
+            else:
+                rows.extend(parsed[1])
+    except Exception as e:
+        return rows, invalid, str(e), cursor
+    return rows, invalid, None, cursor
+
+
+def _is_xlsx(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in (".xlsx", ".xlsm")
+
+
+def excel_sheet_names(file_path: str) -> typing.List[str]:
+    if _is_xlsx(file_path):
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            return workbook.sheetnames
+        finally:
+            workbook.close()
+    return pd.ExcelFile(file_path).sheet_names
+
+
+def _xlsx_sheet_frame(sheet, columns: typing.Sequence[str]) -> pd.DataFrame:
+    """
+    read_only 工作表 → 只含 columns 的 DataFrame（標題重複時取第一欄）
+    比照 pd.read_excel：第一列為標題，空白儲存格為 NaN；之後只逐列取出需要的欄位
+    """
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows, ())
+    wanted = {}
+    for index, name in enumerate(header):
+        if name in columns and name not in wanted.values():
+            wanted[index] = name
+    data = {name: [] for name in wanted.values()}
+    if wanted:
+        nan = float("nan")
+        picks = list(wanted.items())
+        for row in rows:
+            for index, name in picks:
+                value = row[index] if index < len(row) else None
+                data[name].append(nan if value is None else value)
+    return pd.DataFrame(data)
+
+
+def iter_excel_sheets(file_path: str, sheet_names: typing.Sequence[str],
+                      columns: typing.Sequence[str] = SHEET_COLUMNS
+                      ) -> typing.Iterator[typing.Tuple[str, pd.DataFrame]]:
+    """
+    逐張產生 (工作表名稱, 只含 columns 的 DataFrame)，一次只有一張工作表在記憶體中
+    - .xlsx 以 openpyxl read_only 模式逐列讀取
+    - 其他格式（.xls）交給 pd.read_excel，並以 usecols 略過其餘欄位
+    """
+    if not _is_xlsx(file_path):
+        for name in sheet_names:
+            yield name, pd.read_excel(file_path, sheet_name=name, usecols=lambda c: c in columns)
+        return
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for name in sheet_names:
+            yield name, _xlsx_sheet_frame(workbook[name], columns)
+    finally:
+        workbook.close()
+
+
+def read_excel_sheets(file_path: str, sheet_names: typing.Sequence[str],
+                      columns: typing.Sequence[str] = SHEET_COLUMNS
+                      ) -> typing.List[typing.Tuple[str, pd.DataFrame]]:
+    """iter_excel_sheets 的清單版本：多程序載入時每個子程序負責一段連續的工作表"""
+    return list(iter_excel_sheets(file_path, sheet_names, columns))
@@ -38,6 +38,12 @@ MAIN_SCRIPT = "GEX_chart_new.py"
 FILES_TO_SYNC = [
     "GEX_chart_new.py",
     "auto_requirements.py",
+    "bar_store.py",
+    "data_sources.py",
+    "gex_parser.py",
+    "price_fetch.py",
+    "sheet_fetch.py",
+    "ticker_index.py",
     "service_account.json" # 注意：通常憑證不建議放公開 Repo，若為私有 Repo 需改用 Token 驗證
 ]
 
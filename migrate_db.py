@@ -0,0 +1,156 @@
+"""
+stocks.db 精簡結構轉換工具
+
+用法：
+    python migrate_db.py [stocks.db 路徑] [--in-place]
+
+先在暫存複本上比較「舊結構（v1 索引）」與「精簡結構（v2）」的檔案大小與常用查詢耗時，
+加上 --in-place 才會轉換原檔（會先備份成 .bak）。主程式啟動時也會自動轉換。
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import GEX_chart_new as gex
+
+# (名稱, 舊結構 SQL, 新結構 SQL)；新結構使用主程式實際執行的查詢
+QUERIES = [
+    ("fetch_data（單一 ticker）",
+     "SELECT * FROM stock_data WHERE ticker = :ticker ORDER BY date DESC",
+     gex.TABLE_ROWS_SQL + " WHERE t.symbol = :ticker ORDER BY g.day DESC"),
+    ("fetch_data（ticker + 日期區間）",
+     "SELECT * FROM stock_data WHERE ticker = :ticker AND date BETWEEN :start AND :end ORDER BY date DESC",
+     gex.TABLE_ROWS_SQL + " WHERE t.symbol = :ticker AND g.day BETWEEN :start_day AND :end_day"
+                          " ORDER BY g.day DESC"),
+    ("最新日期",
+     "SELECT MAX(date) FROM stock_data WHERE ticker = :ticker",
+     """SELECT MAX(g.day) FROM gex_levels g JOIN tickers t ON t.id = g.ticker_id
+        WHERE t.symbol = :ticker"""),
+    ("圖表 level 與 OHLC",
+     "SELECT date, label, value FROM stock_data WHERE ticker = :ticker ORDER BY date",
+     gex.DAILY_LEVELS_SQL.replace("?", ":ticker") + " ORDER BY day"),
+    ("ticker 清單",
+     "SELECT DISTINCT ticker FROM stock_data",
+     gex.TICKERS_WITH_DATA_SQL),
+    ("全表依日期排序",
+     "SELECT * FROM stock_data ORDER BY date DESC",
+     gex.TABLE_ROWS_SQL + " ORDER BY g.day DESC"),
+    ("日期區間筆數（全部 ticker）",
+     "SELECT COUNT(*) FROM stock_data WHERE date BETWEEN :start AND :end",
+     "SELECT COUNT(*) FROM gex_levels WHERE day BETWEEN :start_day AND :end_day"),
+    ("相容 view（單一 ticker）",
+     "SELECT * FROM stock_data WHERE ticker = :ticker",
+     "SELECT * FROM stock_data WHERE ticker = :ticker"),
+]
+
+
+def _schema_version(path):
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
+
+
+def _time_queries(path, legacy, params, repeat):
+    conn = sqlite3.connect(path)
+    timings = []
+    for _, old_sql, new_sql in QUERIES:
+        sql = old_sql if legacy else new_sql
+        conn.execute(sql, params).fetchall()            # 暖身，讓頁面進快取
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - t0) / repeat * 1000)
+    conn.close()
+    return timings
+
+
+def _sample_params(path):
+    """以資料最多的 ticker 與其最後一年作為查詢參數"""
+    conn = sqlite3.connect(path)
+    ticker, last = conn.execute("""SELECT ticker, MAX(date) FROM stock_data
+                                   GROUP BY ticker ORDER BY COUNT(*) DESC LIMIT 1""").fetchone()
+    conn.close()
+    end_day = gex._day_number(last)
+    return {"ticker": ticker, "start": gex._day_to_date(end_day - 365).isoformat(), "end": last,
+            "start_day": end_day - 365, "end_day": end_day}
+
+
+def _vacuum(path):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def report(db_path, repeat=5):
+    """在暫存複本上轉換並印出大小與查詢耗時比較"""
+    if _schema_version(db_path) >= gex.COMPACT_SCHEMA_VERSION:
+        print(f"{db_path} 已是精簡結構（v{_schema_version(db_path)}），無需轉換")
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy = os.path.join(tmpdir, "legacy.db")
+        compact = os.path.join(tmpdir, "compact.db")
+        shutil.copyfile(db_path, legacy)
+
+        # 舊結構先補到 v1（唯一鍵 + 索引），比較基準才公平
+        conn = sqlite3.connect(legacy)
+        while _schema_version(legacy) < gex.COMPACT_SCHEMA_VERSION - 1:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            with conn:
+                gex._MIGRATIONS[version](conn)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+        conn.close()
+        _vacuum(legacy)
+        shutil.copyfile(legacy, compact)
+
+        t0 = time.perf_counter()
+        conn = sqlite3.connect(compact)
+        gex._migrate_db(conn)
+        conn.close()
+        _vacuum(compact)
+        elapsed = time.perf_counter() - t0
+
+        params = _sample_params(legacy)
+        old_size, new_size = os.path.getsize(legacy), os.path.getsize(compact)
+        old_times = _time_queries(legacy, True, params, repeat)
+        new_times = _time_queries(compact, False, params, repeat)
+
+    print(f"轉換耗時：{elapsed:.2f}s（查詢參數：{params['ticker']}，{params['start']} ~ {params['end']}）")
+    print(f"{'項目':<26}{'舊結構':>12}{'精簡結構':>12}{'節省':>9}")
+    print(f"{'檔案大小 (MB)':<26}{old_size / 2**20:>12.2f}{new_size / 2**20:>12.2f}"
+          f"{(1 - new_size / old_size) * 100:>8.1f}%")
+    for (name, _, _), old_ms, new_ms in zip(QUERIES, old_times, new_times):
+        saving = (1 - new_ms / old_ms) * 100 if old_ms else 0.0
+        print(f"{name + ' (ms)':<26}{old_ms:>12.2f}{new_ms:>12.2f}{saving:>8.1f}%")
+
+
+def migrate_in_place(db_path):
+    backup = db_path + ".bak"
+    shutil.copyfile(db_path, backup)
+    print(f"已備份至 {backup}")
+    gex.DB_PATH = db_path
+    gex.init_db()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="stocks.db 精簡結構轉換與效益報告")
+    parser.add_argument("db", nargs="?", default=gex.DB_PATH)
+    parser.add_argument("--in-place", action="store_true", help="報告後直接轉換原檔")
+    parser.add_argument("--repeat", type=int, default=5, help="每個查詢重複次數")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"找不到資料庫：{args.db}")
+        return 1
+    report(args.db, args.repeat)
+    if args.in_place and _schema_version(args.db) < gex.COMPACT_SCHEMA_VERSION:
+        migrate_in_place(args.db)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
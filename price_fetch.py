@@ -0,0 +1,138 @@
+"""
+yfinance 日線的分批並行下載（不依賴 Tk 與資料庫）
+
+- 每段 (代號, 區間) 依天數切成大小適中的批次：區間越長每批代號越少，單次回應約 CHUNK_BARS 根 K 線
+- 批次由有上限的執行緒池同時送出，所有執行緒共用一個速率限制（每秒最多 REQUESTS_PER_SECOND 次）
+- 批次失敗（例外、被限流）以指數退避重試，不會連帶丟掉其他批次；等待（速率限制、退避）都會被取消打斷
+- 每批的耗時、重試次數與 K 線數都會印出，結束時印出總吞吐量
+下載函式預設為 data_sources.download_prices（依模式連線或重播 fixture）。
+"""
+import concurrent.futures
+import dataclasses
+import datetime
+import random
+import threading
+import time
+import typing
+
+import pandas as pd
+
+import data_sources
+
+FETCH_WORKERS = 4
+REQUESTS_PER_SECOND = 2.0
+CHUNK_BARS = 5000                       # 每批的目標 K 線數（代號數 × 天數）
+MAX_CHUNK_SYMBOLS = 100
+MAX_RETRIES = 4
+BACKOFF_BASE = 2.0                      # 秒；第 n 次重試等 BACKOFF_BASE * 2**n（加上隨機抖動）
+BACKOFF_MAX = 60.0
+
+
+@dataclasses.dataclass
+class ChunkResult:
+    """一批的下載結果；bars 只含有資料的代號，error 不為 None 代表重試後仍失敗"""
+    symbols: typing.List[str]
+    start: datetime.date
+    end: datetime.date                  # 不含
+    bars: typing.Dict[str, pd.DataFrame] = dataclasses.field(default_factory=dict)
+    error: typing.Optional[Exception] = None
+    elapsed: float = 0.0
+    attempts: int = 0
+
+    @property
+    def missing(self) -> typing.List[str]:
+        return [s for s in self.symbols if s not in self.bars]
+
+
+class RateLimiter:
+    """多執行緒共用：相鄰兩次請求的開始時間至少相隔 1 / rate 秒"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self, cancel: threading.Event) -> bool:
+        """等到可以送出下一次請求；等待中 cancel 被設定時立即回傳 False"""
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        return not cancel.wait(at - now) if at > now else not cancel.is_set()
+
+
+def chunk_size(days: int) -> int:
+    return max(1, min(MAX_CHUNK_SYMBOLS, CHUNK_BARS // max(days, 1)))
+
+
+def split_requests(requests: typing.Iterable[typing.Tuple[typing.Sequence[str], datetime.date, datetime.date]]
+                   ) -> typing.List[typing.Tuple[typing.List[str], datetime.date, datetime.date]]:
+    """(代號, 起始, 結束（不含）) → 依區間天數切成批次"""
+    chunks = []
+    for symbols, start, end in requests:
+        size = chunk_size((end - start).days)
+        chunks.extend((list(symbols[i:i + size]), start, end) for i in range(0, len(symbols), size))
+    return chunks
+
+
+def _download_chunk(download, limiter: RateLimiter, symbols, start, end,
+                    cancel: threading.Event) -> ChunkResult:
+    result = ChunkResult(symbols, start, end)
+    t0 = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        if not limiter.wait(cancel):
+            break
+        result.attempts = attempt + 1
+        try:
+            df = download(tickers=symbols, start=start, end=end, interval="1d",
+                          group_by="ticker", progress=False, auto_adjust=False)
+            result.bars = {s: bars for s, bars in data_sources.split_download(df, symbols).items()
+                           if not bars.dropna(how="all").empty}
+            result.error = None
+            break
+        except Exception as e:               # 網路錯誤、YFRateLimitError 等
+            result.error = e
+            if attempt < MAX_RETRIES:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"⚠️  OHLC 下載失敗（{len(symbols)} 支，{e}），{delay:.1f} 秒後重試")
+                if cancel.wait(delay):
+                    break
+    result.elapsed = time.perf_counter() - t0
+    return result
+
+
+def fetch_prices(requests, download=None, max_workers: int = FETCH_WORKERS,
+                 rate: float = REQUESTS_PER_SECOND,
+                 cancel: typing.Optional[threading.Event] = None
+                 ) -> typing.Iterator[ChunkResult]:
+    """
+    requests：[(代號, 起始, 結束（不含）)]；依完成順序產生每一批的 ChunkResult
+    cancel 被設定後不再送出新的請求，等待速率限制或退避中的批次也會立即結束；
+    呼叫端中途停止時尚未開始的批次會被取消
+    """
+    download = download or data_sources.download_prices
+    cancel = cancel or threading.Event()
+    chunks = split_requests(requests)
+    limiter = RateLimiter(rate)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    t0 = time.perf_counter()
+    done = bars = 0
+    try:
+        futures = [executor.submit(_download_chunk, download, limiter, symbols, start, end, cancel)
+                   for symbols, start, end in chunks]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            done += 1
+            n_bars = sum(len(b) for b in result.bars.values())
+            bars += n_bars
+            status = f"失敗：{result.error}" if result.error else f"{n_bars} 根 K 線"
+            print(f"📈 OHLC 批次 {done}/{len(chunks)}：{len(result.symbols)} 支 "
+                  f"{result.start} ~ {result.end}，{status}，{result.elapsed:.2f}s"
+                  + (f"（嘗試 {result.attempts} 次）" if result.attempts > 1 else ""))
+            yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        elapsed = time.perf_counter() - t0
+        if done:
+            print(f"📈 OHLC 下載完成：{done} 批、{bars} 根 K 線，{elapsed:.2f}s"
+                  f"（{bars / elapsed if elapsed else 0:.0f} 根/s）")
@@ -0,0 +1,169 @@
+"""
+Google 試算表工作表下載（不依賴 Tk 與資料庫）
+
+每次 API 呼叫合併多張工作表（values_batch_get），由有上限的執行緒池同時送出，
+依工作表順序交給呼叫端，所以前面的工作表在解析寫入時，後面的仍在下載。
+遇到配額 / 暫時性錯誤（APIError 429、5xx）以指數退避重試。
+client 只需提供 open_by_key()，離線測試可換成假的 client。
+
+有同步紀錄（SyncMark）的工作表只讀標題列與上次最後一列之後的範圍；
+標題或上次最後一列的內容對不上（工作表被刪短、改過標題）時才整張重讀。
+"""
+import concurrent.futures
+import dataclasses
+import random
+import time
+import typing
+
+from gspread.exceptions import APIError
+from gspread.utils import fill_gaps
+
+from gex_parser import content_hash
+
+FETCH_WORKERS = 4                       # 同時送出的 API 請求數（試算表讀取配額為每分鐘 60 次 / 使用者）
+SHEETS_PER_REQUEST = 20                 # 一次 values_batch_get 讀幾張工作表
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0                      # 秒；第 n 次重試等 BACKOFF_BASE * 2**n（加上隨機抖動）
+BACKOFF_MAX = 64.0
+RETRYABLE_CODES = (429, 500, 502, 503, 504)
+
+
+@dataclasses.dataclass
+class SyncMark:
+    """工作表上次同步到哪裡：最後一列的列號（1 起算，含標題列）與標題、該列內容的雜湊"""
+    row: int
+    header_hash: int
+    row_hash: int
+
+
+@dataclasses.dataclass
+class SheetValues:
+    """
+    一張工作表的下載結果；error 不為 None 代表重試後仍失敗
+    values 第一列一律是標題，增量讀取時其後只有新增的列
+    mark 為匯入這些列之後的同步紀錄（空白工作表為 None）
+    """
+    spreadsheet_id: str
+    title: str
+    values: typing.List[typing.List[str]] = dataclasses.field(default_factory=list)
+    error: typing.Optional[Exception] = None
+    mark: typing.Optional[SyncMark] = None
+    incremental: bool = False
+
+
+def row_hash(row: typing.Sequence[str]) -> int:
+    """列內容的雜湊（忽略尾端空白格，API 回傳的列長度不一定相同）"""
+    cells = list(row)
+    while cells and cells[-1] == "":
+        cells.pop()
+    return content_hash("\x1f".join(cells))
+
+
+def _retry_after(error: APIError) -> typing.Optional[float]:
+    try:
+        return float(error.response.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def call_with_backoff(fn: typing.Callable, *args, retries: int = MAX_RETRIES,
+                      sleep: typing.Callable[[float], None] = time.sleep, **kwargs):
+    """呼叫 fn；配額或暫時性錯誤時等待後重試（優先採用 Retry-After），其他錯誤直接拋出"""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except APIError as e:
+            if getattr(e, "code", None) not in RETRYABLE_CODES or attempt == retries:
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"⚠️  Google API {e.code}，{delay:.1f} 秒後重試（第 {attempt + 1} 次）")
+            sleep(delay)
+
+
+def quote_title(title: str) -> str:
+    """工作表名稱轉成 A1 範圍（名稱內的單引號需重複）"""
+    return "'" + title.replace("'", "''") + "'"
+
+
+def _full_sheet(spreadsheet, title: str, values) -> SheetValues:
+    # 與 get_all_values() 相同：補齊成矩形（API 會省略尾端的空白格與空白列）
+    values = fill_gaps(values) if values else []
+    mark = SyncMark(len(values), row_hash(values[0]), row_hash(values[-1])) if values else None
+    return SheetValues(spreadsheet.id, title, values, mark=mark)
+
+
+def _tail_sheet(spreadsheet, title: str, mark: SyncMark, header, tail
+                ) -> typing.Optional[SheetValues]:
+    """標題與上次最後一列都沒變時回傳只含新增列的結果，否則回傳 None（需整張重讀）"""
+    header = header[0] if header else []
+    if not tail or row_hash(header) != mark.header_hash or row_hash(tail[0]) != mark.row_hash:
+        return None
+    rows = fill_gaps([header] + tail[1:])
+    new_mark = SyncMark(mark.row + len(tail) - 1, mark.header_hash, row_hash(tail[-1]))
+    return SheetValues(spreadsheet.id, title, rows, mark=new_mark, incremental=True)
+
+
+def _fetch_batch(spreadsheet,
+                 sheets: typing.Sequence[typing.Tuple[str, typing.Optional[SyncMark], int]]
+                 ) -> typing.List[SheetValues]:
+    """
+    一次 values_batch_get 讀一批 (工作表名稱, 同步紀錄, 格線列數)；
+    有同步紀錄的只讀標題列與上次最後一列到格線底部，對不上的工作表再以一次請求整張重讀
+    """
+    ranges = []
+    for title, mark, row_count in sheets:
+        name = quote_title(title)
+        ranges.extend([f"{name}!1:1", f"{name}!{mark.row}:{row_count}"] if mark else [name])
+    try:
+        response = call_with_backoff(spreadsheet.values_batch_get, ranges)
+    except Exception as e:
+        return [SheetValues(spreadsheet.id, title, error=e) for title, _, _ in sheets]
+    values = iter([r.get("values", []) for r in response.get("valueRanges", [])])
+
+    results, full = [], []
+    for title, mark, _ in sheets:
+        result = (_tail_sheet(spreadsheet, title, mark, next(values, []), next(values, []))
+                  if mark else _full_sheet(spreadsheet, title, next(values, [])))
+        if result is None:
+            full.append(len(results))
+        results.append(result)
+    if full:
+        retry = _fetch_batch(spreadsheet, [(sheets[i][0], None, sheets[i][2]) for i in full])
+        for i, result in zip(full, retry):
+            results[i] = result
+    return results
+
+
+def fetch_spreadsheets(client, sheet_ids: typing.Sequence[str],
+                       marks: typing.Optional[typing.Mapping[typing.Tuple[str, str], SyncMark]] = None,
+                       max_workers: int = FETCH_WORKERS,
+                       sheets_per_request: int = SHEETS_PER_REQUEST
+                       ) -> typing.Iterator[SheetValues]:
+    """
+    依試算表、工作表順序產生 SheetValues；無法開啟的試算表只印出警告並略過
+    marks：{(試算表 ID, 工作表名稱): SyncMark}，有紀錄的工作表只讀新增的列
+    呼叫端中途停止（關閉產生器）時，尚未送出的請求會被取消
+    """
+    marks = marks or {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        batches = []
+        for s_id in sheet_ids:
+            try:
+                spreadsheet = call_with_backoff(client.open_by_key, s_id)
+                worksheets = call_with_backoff(spreadsheet.worksheets)
+            except Exception as e:
+                print(f"⚠️  無法開啟試算表 {s_id}: {e}")
+                continue
+            # 格線列數比上次最後一列還少，一定被刪短過，直接整張讀
+            sheets = [(ws.title, mark if mark and mark.row <= ws.row_count else None, ws.row_count)
+                      for ws in worksheets for mark in [marks.get((s_id, ws.title))]]
+            batches.extend(executor.submit(_fetch_batch, spreadsheet,
+                                           sheets[i:i + sheets_per_request])
+                           for i in range(0, len(sheets), sheets_per_request))
+        for future in batches:
+            yield from future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+import benchmark
+import GEX_chart_new as gex
+
+# 不被中止時要跑好幾秒的查詢
+SLOW_SQL = """WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000)
+              SELECT COUNT(*) FROM n"""
+
+
+def _slow_count():
+    with gex.get_db().reader() as conn:
+        return conn.execute(SLOW_SQL).fetchone()[0]
+
+
+def _ticker_count():
+    with gex.get_db().reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM tickers").fetchone()[0]
+
+
+def test_cancellable_interrupts_reader_and_releases_connection(db):
+    with db.cancellable(lambda: True):
+        with pytest.raises(sqlite3.OperationalError):
+            _slow_count()
+    assert _ticker_count() == 0                         # 同一條連線歸還後不再被中止
+
+
+def test_requests_are_debounced_to_the_last_one(db, quiet_ui):
+    loop, results, calls = benchmark.AfterLoop(), [], []
+    query = gex.BackgroundQuery(loop, results.append)
+    for n in range(3):
+        query.request(lambda n=n: calls.append(n) or n)
+    loop.run()
+    assert calls == [2] and results == [2]
+
+
+def test_newer_request_aborts_running_query(db, quiet_ui):
+    loop, results = benchmark.AfterLoop(), []
+    query = gex.BackgroundQuery(loop, results.append)
+    query.request(_slow_count)
+    # 舊查詢送出後才來的新請求：舊查詢被中止、結果（OperationalError）丟棄，不顯示錯誤
+    loop.after(query.DEBOUNCE_MS + 100, query.request, _ticker_count)
+    loop.run()
+    assert results == [0]
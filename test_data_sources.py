@@ -0,0 +1,86 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import bar_store
+import data_sources
+
+START, END = datetime.date(2020, 1, 1), datetime.date(2020, 2, 1)
+OPTIONS = dict(interval="1d", group_by="ticker", progress=False, auto_adjust=False)
+
+
+def _bars(n_days=31, price=100.0):
+    index = pd.date_range(START, periods=n_days, freq="D", name="Date")
+    return pd.DataFrame({"Open": price, "High": price * 1.01, "Low": price * 0.99, "Close": price,
+                         "Adj Close": price, "Volume": 1000.0}, index=index)
+
+
+class Upstream(data_sources.FrameProvider):
+    """記下每次下載的代號；error 不為 None 時拋出例外"""
+
+    def __init__(self, frames, error=None):
+        super().__init__(frames)
+        self.calls = []
+        self.error = error
+
+    def download(self, tickers, **kwargs):
+        self.calls.append(list(tickers))
+        if self.error is not None:
+            raise self.error
+        return super().download(tickers, **kwargs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return bar_store.BarStore(str(tmp_path / "bars"), bar_store.CSV)
+
+
+def test_price_provider_is_abstract():
+    with pytest.raises(TypeError):
+        data_sources.PriceProvider()
+
+
+def test_empty_symbol_is_covered_when_others_succeed(store):
+    upstream = Upstream({"AAA": _bars()})
+    provider = data_sources.CachedProvider(upstream, store)
+    df = provider.download(["AAA", "BBB"], start=START, end=END, **OPTIONS)
+    assert list(data_sources.split_download(df, ["AAA", "BBB"])) == ["AAA"]
+    assert store.missing("BBB", START, END) == []
+    provider.download(["AAA", "BBB"], start=START, end=END, **OPTIONS)
+    assert upstream.calls == [["AAA", "BBB"]]
+
+
+def test_failed_download_is_not_covered(store):
+    # yfinance 整批失敗時不拋例外，回傳空的結果
+    upstream = Upstream({})
+    provider = data_sources.CachedProvider(upstream, store)
+    provider.download(["AAA", "BBB"], start=START, end=END, **OPTIONS)
+    assert store.missing("AAA", START, END) == [(START, END)]
+    provider.download(["AAA", "BBB"], start=START, end=END, **OPTIONS)
+    assert len(upstream.calls) == 2
+
+
+def test_upstream_error_is_not_covered(store):
+    provider = data_sources.CachedProvider(Upstream({"AAA": _bars()}, error=ConnectionError("down")), store)
+    with pytest.raises(ConnectionError):
+        provider.download(["AAA"], start=START, end=END, **OPTIONS)
+    assert store.coverage("AAA") == []
+
+
+def test_adjusted_prices_bypass_store(store):
+    upstream = Upstream({"AAA": _bars()})
+    provider = data_sources.CachedProvider(upstream, store)
+    for _ in range(2):
+        provider.download(["AAA"], start=START, end=END, interval="1d", group_by="ticker", auto_adjust=True)
+        provider.download(["AAA"], start=START, end=END, interval="1d", group_by="ticker")
+    assert len(upstream.calls) == 4
+    assert store.coverage("AAA") == [] and store.read("AAA", START, END).empty
+
+
+def test_csv_store_round_trips_floats(store):
+    bars = _bars(price=123.456789012345678)
+    bars["Close"] = [100 / 3 + i / 7 for i in range(len(bars))]
+    store.write("AAA", bars, START, END)
+    pd.testing.assert_frame_equal(store.read("AAA", START, END), bars,
+                                  check_index_type=False, check_freq=False)
@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+import GEX_chart_new as gex
+
+
+def _count(db):
+    with db.reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM tickers").fetchone()[0]
+
+
+def test_nested_writer_commits_only_at_outermost_block(db):
+    with db.writer() as conn:
+        conn.execute("INSERT INTO tickers (symbol) VALUES ('AAA')")
+        with db.writer() as inner:
+            inner.execute("INSERT INTO tickers (symbol) VALUES ('BBB')")
+        assert _count(db) == 0              # 內層結束時尚未 commit
+    assert _count(db) == 2
+
+
+def test_error_in_nested_writer_rolls_back_outer_transaction(db):
+    with pytest.raises(RuntimeError):
+        with db.writer() as conn:
+            conn.execute("INSERT INTO tickers (symbol) VALUES ('AAA')")
+            with db.writer() as inner:
+                inner.execute("INSERT INTO tickers (symbol) VALUES ('BBB')")
+                raise RuntimeError
+    assert _count(db) == 0
+    with db.writer() as conn:               # 之後的交易不受影響
+        conn.execute("INSERT INTO tickers (symbol) VALUES ('CCC')")
+    assert _count(db) == 1
+
+
+def test_exclusive_rejected_inside_writer(db):
+    with db.writer():
+        with pytest.raises(RuntimeError):
+            with db.exclusive():
+                pass
+
+
+def test_init_db_upgrades_legacy_database(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE stock_data (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT NOT NULL,
+                    date TEXT NOT NULL, label TEXT NOT NULL, value REAL NOT NULL)""")
+    conn.executemany("INSERT INTO stock_data (ticker, date, label, value) VALUES (?, ?, ?, ?)",
+                     [("SPX", "2024-01-02", "Call Wall", 100), ("SPX", "2024-01-02", "Call Wall", 110),
+                      ("SPX", "2024-01-03", "Put Wall", 90)])
+    conn.commit()
+    conn.close()
+    gex.get_db().close()
+    monkeypatch.setattr(gex, "DB_PATH", str(path))
+    gex.init_db()
+    with gex.get_db().reader() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(gex._MIGRATIONS)
+        assert sorted(conn.execute("SELECT ticker, date, label, value FROM stock_data")) == [
+            ("SPX", "2024-01-02", "Call Wall", 110), ("SPX", "2024-01-03", "Put Wall", 90)]
+    gex.get_db().close()
+
+
+def test_reimport_upserts_on_unique_key(db):
+    for value, choice in ((100, None), (100, "overwrite"), (105, "overwrite")):
+        session = gex.ImportSession()
+        session.choice = choice
+        gex.parse_gex_code("2024-01-02", f"SPX: Call Wall, {value}", session)
+        session.finish()
+        session.close()
+    with db.reader() as conn:
+        assert conn.execute("SELECT label, value FROM stock_data WHERE label = 'Call Wall'").fetchall() == [
+            ("Call Wall", 105.0)]
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.writer() as conn:
+            conn.execute("""INSERT INTO gex_levels (ticker_id, day, label_id, value)
+                            SELECT ticker_id, day, label_id, 1 FROM gex_levels LIMIT 1""")
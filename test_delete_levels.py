@@ -0,0 +1,87 @@
+import GEX_chart_new as gex
+
+CODES = [("2024-01-02", "SPX: Call Wall, 100, Put Wall, 90"),
+         ("2024-01-03", "SPX: Call Wall, 101, Put Wall, 91"),
+         ("2024-01-02", "NDX: Call Wall, 200, Put Wall, 190")]
+
+
+def _import(codes, choice=None):
+    session = gex.ImportSession()
+    session.choice = choice
+    for date_str, code in codes:
+        gex.parse_gex_code(date_str, code, session)
+    session.finish()
+    session.close()
+
+
+def _snapshot(db):
+    with db.reader() as conn:
+        return (conn.execute("SELECT ticker, date, label, value FROM stock_data ORDER BY ticker, date, label")
+                .fetchall(),
+                conn.execute("SELECT * FROM daily_levels ORDER BY ticker_id, day").fetchall())
+
+
+def _call_wall(db, ticker, date_str):
+    with db.reader() as conn:
+        return conn.execute(f"""SELECT d.{gex.WIDE_COLUMNS['Call Wall']} FROM daily_levels d
+                                JOIN tickers t ON t.id = d.ticker_id WHERE t.symbol = ? AND d.day = ?""",
+                            (ticker, gex._day_number(date_str))).fetchone()[0]
+
+
+def _one(db, sql, *params):
+    with db.reader() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def test_delete_selected_ids_then_undo_restores_rows(db):
+    _import(CODES)
+    before = _snapshot(db)
+    tv_codes = _one(db, "SELECT COUNT(*) FROM tv_codes")
+    with db.reader() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM gex_levels WHERE day = ?",
+                                          (gex._day_number("2024-01-03"),))]
+    assert gex.delete_levels(f"WHERE g.id IN ({', '.join('?' * len(ids))})", ids, "選取") == 3
+    assert _one(db, "SELECT COUNT(*) FROM stock_data WHERE date = '2024-01-03'") == 0
+    assert _one(db, "SELECT COUNT(*) FROM tv_codes") == tv_codes      # 復原時還原 TV Code 要用到
+
+    assert gex.undo_delete() == ("選取", 3, 0)
+    assert _snapshot(db) == before
+    assert gex.undo_delete() is None
+
+
+def test_delete_by_filter_and_label_updates_daily_levels(db):
+    _import(CODES)
+    where, params = gex._level_filter("SPX", "2024-01-01", "2024-01-31", "Call Wall")
+    assert gex.delete_levels(where, params, "SPX Call Wall") == 2
+    assert _one(db, "SELECT COUNT(*) FROM stock_data WHERE label = 'Call Wall'") == 1
+    assert _one(db, "SELECT COUNT(*) FROM stock_data WHERE ticker = 'SPX'") == 4
+    assert _call_wall(db, "SPX", "2024-01-02") is None
+    assert _call_wall(db, "NDX", "2024-01-02") == 200
+
+    assert gex.delete_levels(where, params, "再刪一次") == 0
+    assert _one(db, "SELECT COUNT(*) FROM delete_batches") == 1
+
+
+def test_undo_keeps_rows_imported_after_delete(db):
+    _import(CODES[:1])
+    where, params = gex._level_filter("SPX", None, None, "Call Wall")
+    gex.delete_levels(where, params, "SPX Call Wall")
+    # TV Code 與原本的不同（衝突，保留原本的）；Call Wall 已刪除，直接寫入新值
+    _import([("2024-01-02", "SPX: Call Wall, 105")], choice="skip")
+
+    assert gex.undo_delete() == ("SPX Call Wall", 0, 1)
+    assert _call_wall(db, "SPX", "2024-01-02") == 105
+    assert _one(db, "SELECT COUNT(*) FROM deleted_levels") == 0
+
+
+def test_only_recent_batches_can_be_undone(db, monkeypatch):
+    monkeypatch.setattr(gex, "UNDO_BATCHES", 2)
+    _import(CODES)
+    for label in ("Call Wall", "Put Wall"):
+        for ticker in ("SPX", "NDX"):
+            if (ticker, label) != ("NDX", "Put Wall"):
+                gex.delete_levels(*gex._level_filter(ticker, None, None, label), f"{ticker} {label}")
+    assert _one(db, "SELECT COUNT(*) FROM delete_batches") == 2
+    assert [gex.undo_delete()[0] for _ in range(2)] == ["SPX Put Wall", "NDX Call Wall"]
+    assert gex.undo_delete() is None
+    assert _one(db, "SELECT COUNT(*) FROM stock_data WHERE ticker = 'SPX' AND label = 'Call Wall'") == 0
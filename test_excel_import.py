@@ -0,0 +1,73 @@
+import datetime
+import math
+
+import openpyxl
+import pandas as pd
+
+import GEX_chart_new as gex
+import gex_parser
+
+
+def _workbook(path):
+    """含日期儲存格、數字、空白、重複標題、多餘欄位與第一列空白（沒有標題）的活頁簿"""
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.title = "SPX"
+    sheet.append(["Open", "Date", "TV Code", "Note", "TV Code"])
+    sheet.append([1.5, datetime.datetime(2024, 1, 2), "SPX: Call Wall, 100, Put Wall, 90", "x", "dup"])
+    sheet.append([2, "2024-01-03", "SPX 20240104 093000 SPX: Call Wall, 101", None, None])
+    sheet.append([None, None, None, "only a note"])
+    sheet.append([3, datetime.datetime(2024, 1, 5), 42])
+    sheet["B5"].number_format = "yyyy-mm-dd"
+    blank = wb.create_sheet("QQQ")
+    blank.append([])
+    blank.append(["TV Code", "Date"])
+    blank.append(["QQQ: Gamma Flip, 400", datetime.date(2024, 2, 1)])
+    wb.create_sheet("EMPTY")
+    wb.save(path)
+    return str(path)
+
+
+def _same(a, b):
+    return a is b or a == b or (isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b))
+
+
+def test_xlsx_sheets_match_openpyxl(tmp_path):
+    path = _workbook(tmp_path / "gex.xlsx")
+    assert gex_parser.excel_sheet_names(path) == ["SPX", "QQQ", "EMPTY"]
+    sheets = dict(gex_parser.read_excel_sheets(path, ["SPX", "QQQ", "EMPTY"]))
+
+    wb = openpyxl.load_workbook(path)
+    for name in ("SPX",):
+        rows = [r for r in wb[name].iter_rows(values_only=True)]
+        header = list(rows[0])
+        for column in gex_parser.SHEET_COLUMNS:
+            index = header.index(column)
+            expected = [r[index] if index < len(r) else None for r in rows[1:]]
+            got = sheets[name][column].tolist()
+            assert len(got) == len(expected)
+            assert all(_same(g, float("nan") if e is None else e) for g, e in zip(got, expected)), column
+    assert list(sheets["SPX"].columns) == ["Date", "TV Code"]
+    assert sheets["QQQ"].empty and sheets["EMPTY"].empty
+
+
+def test_xlsx_parses_like_read_excel(tmp_path):
+    path = _workbook(tmp_path / "gex.xlsx")
+    for name, df in gex_parser.read_excel_sheets(path, ["SPX", "QQQ"]):
+        expected = pd.read_excel(path, sheet_name=name)
+        a, invalid_a = gex_parser.parse_tv_code_frame(df)
+        b, invalid_b = gex_parser.parse_tv_code_frame(expected)
+        pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True))
+        assert invalid_a == invalid_b
+
+
+def test_single_worker_load_streams_sheets(tmp_path, monkeypatch):
+    path = _workbook(tmp_path / "gex.xlsx")
+    read = []
+    original = gex_parser._xlsx_sheet_frame
+    monkeypatch.setattr(gex_parser, "_xlsx_sheet_frame",
+                        lambda sheet, columns: read.append(sheet.title) or original(sheet, columns))
+    sheets = gex.load_excel_sheets(path, max_workers=1)
+    assert next(sheets)[0] == "SPX"
+    assert read == ["SPX"]                              # 第二張還沒讀
+    assert [name for name, _ in sheets] == ["QQQ", "EMPTY"]
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+import gex_parser
+
+CODES = [
+    "SPX: Call Wall, 100, Put Wall, 90",
+    "SPX 20241399 093000 SPX: Call Wall, 100, Put Wall, 90",      # 內嵌日期不存在 → Date 欄
+    "QQQ 20240105 093000 QQQ: Gamma Flip, 400.5, Call Wall & Key Delta, 410",
+    "IWM: Call Wall, abc, Put Wall, 180, Gamma Field, 190, 195",
+    "BRK.B: Call Dominate, 1, Put Dominate, 2",
+    "no ticker here",
+    "nan",
+    "",
+]
+DATES = ["2024-01-02", "2024/01/03", "2024-01-04 10:00", "Jan 5, 2024", "2024-01-06", "2024-01-07",
+         "bad date", "2024-01-09"]
+
+
+def _frame(repeat):
+    return pd.DataFrame({"Date": DATES * repeat, "TV Code": CODES * repeat})
+
+
+def _parse(df, small, **kwargs):
+    limit = gex_parser.SMALL_FRAME_ROWS
+    try:
+        gex_parser.SMALL_FRAME_ROWS = 10 ** 9 if small else 0
+        return gex_parser.parse_tv_code_frame(df, **kwargs)
+    finally:
+        gex_parser.SMALL_FRAME_ROWS = limit
+
+
+@pytest.mark.parametrize("repeat", [1, 9])
+@pytest.mark.parametrize("latest_date", [None, "2024-01-04"])
+def test_small_and_large_frame_paths_agree(repeat, latest_date):
+    df = _frame(repeat)
+    small_rows, small_invalid = _parse(df, small=True, latest_date=latest_date)
+    large_rows, large_invalid = _parse(df, small=False, latest_date=latest_date)
+    pd.testing.assert_frame_equal(small_rows, large_rows, check_dtype=False)
+    assert small_invalid == large_invalid
+
+
+def test_frame_matches_row_by_row_parse_code():
+    rows, invalid = gex_parser.parse_tv_code_frame(_frame(1))
+    expected = []
+    for code, date in zip(CODES[:5], DATES[:5]):
+        expected.extend(gex_parser.parse_code(gex_parser.parse_date(date).isoformat(), code)[1])
+    assert list(rows.itertuples(index=False, name=None)) == expected
+    assert invalid == ["no ticker here"]
+
+
+def test_invalid_embedded_date_falls_back_to_date_column():
+    assert gex_parser.extract_date_from_tv_code("SPX 20241399 093000 SPX: Call Wall, 100") is None
+    ticker, rows = gex_parser.parse_code("2024-01-02", "SPX 20241399 093000 SPX: Call Wall, 100")
+    assert rows[1] == ("SPX", "2024-01-02", "Call Wall", 100.0)
+    small = pd.DataFrame({"Date": ["2024-01-02"], "TV Code": ["SPX 20241399 093000 SPX: Call Wall, 100"]})
+    rows, invalid = gex_parser.parse_tv_code_frame(small)
+    assert rows["date"].tolist() == ["2024-01-02", "2024-01-02"] and invalid == []
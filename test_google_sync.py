@@ -0,0 +1,58 @@
+import copy
+
+import pytest
+
+import benchmark
+import GEX_chart_new as gex
+
+
+@pytest.fixture
+def books():
+    books = benchmark.make_google_books(n_sheets=6, n_days=4)
+    books[gex.SHEET_ID]["NOTES"] = [["Date", "Memo"], ["2024-01-02", "no codes here"]]
+    return books
+
+
+def _sync(books):
+    client = benchmark.FakeSheetsClient(books, latency=0)
+    gex.auto_import_from_google(client=client)
+    return client
+
+
+def _marks(db):
+    with db.reader() as conn:
+        return dict(conn.execute("SELECT title, last_row FROM sheet_sync_state"))
+
+
+def _append_row(books):
+    """每張工作表新增一列：代碼表加下一天的 TV Code，格式不符的表加一列備註"""
+    books = copy.deepcopy(books)
+    for sheets in books.values():
+        for title, values in sheets.items():
+            values.append(["2099-01-01", values[-1][1] if title != "NOTES" else "more notes"])
+    return books
+
+
+def test_second_sync_reads_only_new_rows(db, quiet_ui, books):
+    _sync(books)
+    assert _marks(db) == {title: len(values)
+                          for sheets in books.values() for title, values in sheets.items()}
+
+    today = _append_row(books)
+    client = _sync(today)
+    # 每張工作表只讀標題、上次最後一列與新增的一列
+    assert client.cells == sum(3 * len(values[0]) for sheets in today.values() for values in sheets.values())
+    assert gex.inserted_count > 0
+    assert _marks(db) == {title: len(values)
+                          for sheets in today.values() for title, values in sheets.items()}
+
+
+def test_sync_without_marks_rereads_every_sheet(db, quiet_ui, books):
+    _sync(books)
+    with db.writer() as conn:
+        conn.execute("DELETE FROM sheet_sync_state")
+    client = _sync(books)
+    assert client.cells == sum(len(values) * len(values[0])
+                               for sheets in books.values() for values in sheets.values())
+    assert gex.inserted_count == 0
+
@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+
+import GEX_chart_new as gex
+import benchmark
+
+
+def _import(codes, choice=None):
+    session = gex.ImportSession()
+    session.choice = choice
+    for date_str, code in codes:
+        gex.parse_gex_code(date_str, code, session)
+    session.finish()
+    session.close()
+
+
+def _one(db, sql, *params):
+    with db.reader() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def _manifest_entry(tmp_path):
+    path = tmp_path / "codes.txt"
+    path.write_text("2024-01-02\nSPX: Call Wall, 100\n", encoding="utf-8")
+    gex.record_file_import(str(path))
+    return str(path)
+
+
+def test_deleting_levels_forgets_file_imports_once(db, tmp_path):
+    _import([("2024-01-02", "SPX: Call Wall, 100, Put Wall, 90"), ("2024-01-03", "SPX: Call Wall, 101")])
+    path = _manifest_entry(tmp_path)
+
+    # 直接刪除（不經 delete_levels）不再每列清整張匯入紀錄
+    with db.writer() as conn:
+        conn.execute("""DELETE FROM gex_levels WHERE day = ? AND label_id =
+                        (SELECT id FROM labels WHERE name = 'Put Wall')""", (gex._day_number("2024-01-02"),))
+    assert _one(db, "SELECT COUNT(*) FROM import_manifest") == 1
+    assert gex.plan_file_import(path) is None
+
+    where, params = gex._level_filter("SPX", "2024-01-03", "2024-01-03", "Call Wall")
+    assert gex.delete_levels(where, params, "test") == 1
+    assert _one(db, "SELECT COUNT(*) FROM import_manifest") == 0
+    assert gex.plan_file_import(path) is not None
+
+
+def test_deleting_only_ohlc_keeps_file_imports(db, tmp_path):
+    _import([("2024-01-02", "SPX: Call Wall, 100")])
+    assert gex._write_ohlc([("SPX", gex._day_number("2024-01-02"), "Close", 4700.0)]) == 1
+    _manifest_entry(tmp_path)
+    where, params = gex._level_filter("SPX", None, None, "Close")
+    assert gex.delete_levels(where, params, "ohlc") == 1
+    assert _one(db, "SELECT COUNT(*) FROM import_manifest") == 1
+
+
+def test_legacy_view_delete_still_forgets_file_imports(db, tmp_path):
+    _import([("2024-01-02", "SPX: Call Wall, 100")])
+    _manifest_entry(tmp_path)
+    with db.writer() as conn:
+        conn.execute("DELETE FROM stock_data WHERE label = 'Call Wall'")
+    assert _one(db, "SELECT COUNT(*) FROM import_manifest") == 0
+
+
+def test_skipped_conflicts_are_not_recorded_as_imported(db):
+    _import([("2024-01-02", "SPX: Call Wall, 100")])
+    newer = "SPX 20240102 160000 SPX: Call Wall, 105"
+    _import([("2024-01-02", newer)], choice="skip")
+    day = gex._day_number("2024-01-02")
+    assert _one(db, "SELECT COUNT(*) FROM imported_codes WHERE hash = ?", gex.gex_parser.code_key(day, newer)) == 0
+
+    # 之後再匯入同一筆仍會被當成重複資料，可以選擇覆蓋
+    _import([("2024-01-02", newer)], choice="overwrite")
+    assert _one(db, "SELECT value FROM stock_data WHERE label = 'Call Wall'") == 105
+    assert _one(db, "SELECT COUNT(*) FROM imported_codes WHERE hash = ?", gex.gex_parser.code_key(day, newer)) == 1
+
+
+def _import_txt(path, choice):
+    session = gex.ImportSession()
+    session.choice = choice
+    finished, skipped = gex.import_txt_files([path], session)
+    gex._finish_txt_import(session, benchmark.SilentProgress(), (), finished, skipped)
+
+
+def _import_excel(path, choice, monkeypatch):
+    monkeypatch.setattr(gex, "ask_bulk_conflict_resolution", lambda conflicts, partial=False: choice)
+    assert gex.process_excel(path)
+
+
+@pytest.mark.parametrize("kind", ["txt", "xlsx"])
+def test_file_with_skipped_conflicts_can_be_overwritten_later(db, quiet_ui, tmp_path, monkeypatch, kind):
+    _import([("2024-01-02", "SPX: Call Wall, 100")])
+    if kind == "txt":
+        path = tmp_path / "codes.txt"
+        path.write_text("2024-01-02\nSPX: Call Wall, 105\n", encoding="utf-8")
+        run = lambda choice: _import_txt(str(path), choice)
+    else:
+        path = tmp_path / "codes.xlsx"
+        pd.DataFrame({"Date": ["2024-01-02"], "TV Code": ["SPX: Call Wall, 105"]}).to_excel(
+            path, sheet_name="SPX", index=False)
+        run = lambda choice: _import_excel(str(path), choice, monkeypatch)
+
+    run("skip")
+    assert _one(db, "SELECT value FROM stock_data WHERE label = 'Call Wall'") == 100
+    assert gex.plan_file_import(str(path)) is not None      # 沒有記成已匯入
+
+    run("overwrite")
+    assert _one(db, "SELECT value FROM stock_data WHERE label = 'Call Wall'") == 105
+    assert gex.plan_file_import(str(path)) is None
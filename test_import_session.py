@@ -0,0 +1,68 @@
+import re
+
+import GEX_chart_new as gex
+import benchmark
+
+CODES = benchmark.make_tv_codes(n_tickers=4, n_days=6)
+
+
+def _import(codes, **kwargs):
+    session = gex.ImportSession(**kwargs)
+    for date_str, code in codes:
+        gex.parse_gex_code(date_str, code, session)
+    session.finish()
+    session.close()
+
+
+def _levels(db):
+    with db.reader() as conn:
+        return conn.execute("SELECT ticker, date, label, value FROM stock_data "
+                            "ORDER BY ticker, date, label").fetchall()
+
+
+def test_session_writes_everything_once(db):
+    _import(CODES)
+    rows = _levels(db)
+    assert len(rows) == len(benchmark.parse_rows(CODES)) == gex.inserted_count
+    assert rows == sorted(set(rows))
+
+
+def test_streaming_batches_match_single_batch(db, tmp_path, monkeypatch):
+    _import(CODES)
+    whole = _levels(db)
+    gex.get_db().close()
+    monkeypatch.setattr(gex, "DB_PATH", str(tmp_path / "batched.db"))
+    gex.init_db()
+    _import(CODES, batch_size=7)
+    assert _levels(gex.get_db()) == whole
+
+
+def test_last_duplicate_in_one_import_wins(db):
+    _import([("2024-01-02", "SPX: Call Wall, 100"), ("2024-01-02", "SPX: Call Wall, 105")])
+    with db.reader() as conn:
+        assert conn.execute("SELECT value FROM stock_data WHERE label = 'Call Wall'").fetchall() == [(105.0,)]
+
+
+def test_conflicts_are_asked_once_per_import(db, monkeypatch):
+    _import(CODES)
+    before = _levels(db)
+    asked = []
+
+    def ask(conflicts, partial=False):
+        asked.append(conflicts)
+        return answer
+
+    monkeypatch.setattr(gex, "ask_bulk_conflict_resolution", ask)
+    changed = [(date_str, re.sub(r"\d+\.\d+", lambda m: f"{float(m[0]) + 1:.2f}", code))
+               for date_str, code in CODES]
+    for answer in ("skip", "cancel"):
+        asked.clear()
+        _import(changed)
+        assert len(asked) == 1
+        assert sum(count for _, _, count in asked[0]) == len(before)
+        assert _levels(db) == before
+    monkeypatch.setattr(gex, "cancel_import", False)
+
+    answer = "overwrite"
+    _import(changed)
+    assert _levels(db) != before and len(_levels(db)) == len(before)
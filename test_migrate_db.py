@@ -0,0 +1,51 @@
+import os
+import sqlite3
+
+import pytest
+
+import GEX_chart_new as gex
+import benchmark
+import migrate_db
+
+ROWS = benchmark.parse_rows(benchmark.make_tv_codes(n_tickers=3, n_days=30))
+
+
+@pytest.fixture
+def legacy(tmp_path, monkeypatch):
+    """原始結構（stock_data 單一長表）的小型 stocks.db"""
+    path = str(tmp_path / "stocks.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE stock_data (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT NOT NULL,
+                    date TEXT NOT NULL, label TEXT NOT NULL, value REAL NOT NULL)""")
+    conn.executemany("INSERT INTO stock_data (ticker, date, label, value) VALUES (?, ?, ?, ?)",
+                     ROWS)
+    conn.commit()
+    conn.close()
+    gex.get_db().close()
+    monkeypatch.setattr(gex, "DB_PATH", path)
+    yield path
+    gex.get_db().close()
+
+
+def test_report_leaves_database_untouched(legacy, capsys):
+    with open(legacy, "rb") as f:
+        before = f.read()
+    assert migrate_db.main([legacy, "--repeat", "1"]) == 0
+    out = capsys.readouterr().out
+    assert "檔案大小 (MB)" in out
+    for name, _, _ in migrate_db.QUERIES:
+        assert name in out
+    with open(legacy, "rb") as f:
+        assert f.read() == before
+
+
+def test_in_place_converts_with_backup(legacy, capsys):
+    assert migrate_db.main([legacy, "--in-place", "--repeat", "1"]) == 0
+    assert os.path.exists(legacy + ".bak")
+    assert migrate_db._schema_version(legacy) == len(gex._MIGRATIONS)
+    with gex.get_db().reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM stock_data").fetchone()[0] == len(ROWS)
+
+    capsys.readouterr()
+    assert migrate_db.main([legacy]) == 0
+    assert "已是精簡結構" in capsys.readouterr().out
@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+import GEX_chart_new as gex
+
+TV_CODE = "SPX 20240102 093000: Call Wall, 110, Put Wall, 90"
+LEGACY_ROWS = [
+    ("SPX", "2024-01-02", "Call Wall", 100),
+    ("SPX", "2024-01-02", "Call Wall", 110),            # 重複：保留最後寫入的
+    ("SPX", "2024-01-02", "Put Wall", 90),
+    ("SPX", "2024-01-02", "TV Code", TV_CODE),
+    ("SPX", "2024-01-02", "Close", 4700.5),
+    ("SPX", "2024/01/03", "Call Wall", 111),            # 不同日期格式
+    ("NDX", "2024-01-03", "Gamma Flip", 16000),
+    ("NDX", "n/a", "Gamma Flip", 1),                     # 無法解析的日期
+]
+EXPECTED = [("NDX", "2024-01-03", "Gamma Flip", 16000),
+            ("SPX", "2024-01-02", "Call Wall", 110), ("SPX", "2024-01-02", "Close", 4700.5),
+            ("SPX", "2024-01-02", "Put Wall", 90), ("SPX", "2024-01-02", "TV Code", TV_CODE),
+            ("SPX", "2024-01-03", "Call Wall", 111)]
+
+
+def _legacy_db(path, version=0):
+    """原始版本的 stocks.db（stock_data 單一長表），可再先手動升級到 version"""
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE stock_data (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT NOT NULL,
+                    date TEXT NOT NULL, label TEXT NOT NULL, value REAL NOT NULL)""")
+    conn.executemany("INSERT INTO stock_data (ticker, date, label, value) VALUES (?, ?, ?, ?)", LEGACY_ROWS)
+    conn.commit()
+    for target in range(1, version + 1):
+        with conn:
+            gex._MIGRATIONS[target - 1](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+    conn.close()
+
+
+def _open(path, monkeypatch):
+    gex.get_db().close()
+    monkeypatch.setattr(gex, "DB_PATH", str(path))
+    gex.init_db()
+    return gex.get_db()
+
+
+def _snapshot(db):
+    with db.reader() as conn:
+        return {
+            "version": conn.execute("PRAGMA user_version").fetchone()[0],
+            "schema": conn.execute("SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' "
+                                   "ORDER BY type, name").fetchall(),
+            "levels": conn.execute("SELECT ticker, date, label, value FROM stock_data "
+                                   "ORDER BY ticker, date, label").fetchall(),
+            "daily": conn.execute("SELECT * FROM daily_levels ORDER BY ticker_id, day").fetchall(),
+        }
+
+
+@pytest.fixture(autouse=True)
+def close_db():
+    yield
+    gex.get_db().close()
+
+
+def test_upgrade_from_v0(tmp_path, monkeypatch):
+    _legacy_db(tmp_path / "legacy.db")
+    db = _open(tmp_path / "legacy.db", monkeypatch)
+    snapshot = _snapshot(db)
+    assert snapshot["version"] == len(gex._MIGRATIONS)
+    assert snapshot["levels"] == EXPECTED
+    for name in ("gex_levels", "tickers", "labels", "tv_codes", "daily_levels", "import_manifest",
+                 "imported_codes", "sheet_sync_state", "symbol_map", "delete_batches", "deleted_levels"):
+        assert ("table", name) in snapshot["schema"]
+    assert ("view", "stock_data") in snapshot["schema"]
+
+    wide = gex.fetch_daily_levels("SPX")
+    assert wide["Call Wall"].tolist() == [110, 111] and wide["Close"].iloc[0] == 4700.5
+    with db.reader() as conn:
+        assert conn.execute("SELECT code FROM tv_codes").fetchall() == [(TV_CODE,)]
+
+    # 升級後照常匯入、刪除
+    session = gex.ImportSession()
+    gex.parse_gex_code("2024-01-04", "SPX: Call Wall, 112", session)
+    session.finish()
+    session.close()
+    assert gex.fetch_daily_levels("SPX")["Call Wall"].tolist() == [110, 111, 112]
+    assert gex.delete_levels(*gex._level_filter("NDX"), "NDX") == 1
+
+
+@pytest.mark.parametrize("version", range(1, len(gex._MIGRATIONS)))
+def test_upgrade_from_each_version_matches_fresh_upgrade(tmp_path, monkeypatch, version):
+    _legacy_db(tmp_path / "direct.db")
+    direct = _snapshot(_open(tmp_path / "direct.db", monkeypatch))
+    _legacy_db(tmp_path / "staged.db", version)
+    assert _snapshot(_open(tmp_path / "staged.db", monkeypatch)) == direct
+
+
+def test_init_db_is_idempotent(tmp_path, monkeypatch):
+    _legacy_db(tmp_path / "legacy.db")
+    first = _snapshot(_open(tmp_path / "legacy.db", monkeypatch))
+    assert _snapshot(_open(tmp_path / "legacy.db", monkeypatch)) == first
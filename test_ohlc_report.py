@@ -0,0 +1,63 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import GEX_chart_new as gex
+import data_sources
+
+
+@pytest.fixture
+def shown(monkeypatch):
+    messages = []
+    monkeypatch.setattr(gex.messagebox, "showinfo", lambda title, message: messages.append((title, message)))
+    monkeypatch.setattr(gex, "refresh_table", lambda *args, **kwargs: None)
+    return messages
+
+
+def test_range_with_no_bars_at_all_reports_no_data(shown):
+    gex._report_range_backfill("SPX", "2024-01-01", "2024-01-31", 0, 1, ["SPX"])
+    assert shown[0][0] == "無資料"
+
+
+def test_partial_range_reports_written_days(shown):
+    # 區間內有些日期下載不到資料（例如假日缺口），但已寫入 12 天
+    gex._report_range_backfill("SPX", "2024-01-01", "2024-01-31", 12, 2, ["SPX"])
+    title, message = shown[0]
+    assert title == "更新完成" and "補齊 12 天" in message and "SPX" in message
+
+
+def test_cancelled_range_reports_cancel(shown):
+    gex._report_range_backfill("SPX", "2024-01-01", "2024-01-31", 0, 1, ["SPX"], cancelled=True)
+    assert shown[0][0] == "已取消"
+
+
+def _fake_download(tickers, start, end, **kwargs):
+    index = pd.date_range(start, end, freq="D", inclusive="left", name="Date")
+    return pd.concat({symbol: pd.DataFrame({label: 100.0 for label in gex.OHLC_LABELS}, index=index)
+                      for symbol in tickers}, axis=1)
+
+
+@pytest.fixture
+def spx_levels(db, monkeypatch):
+    session = gex.ImportSession()
+    gex.parse_gex_code("2024-01-02", "SPX: Call Wall, 100", session)
+    session.finish()
+    session.close()
+    monkeypatch.setattr(data_sources, "download_prices", _fake_download)
+    return db
+
+
+def test_backfill_ignores_import_cancel_flag(spx_levels, monkeypatch):
+    # TXT / Excel / Sheets 匯入取消留下的 cancel_import 不影響 OHLC 補齊
+    monkeypatch.setattr(gex, "cancel_import", True)
+    written, requests, no_data, _ = gex.backfill_ohlc(["SPX"])
+    assert (written, requests, no_data) == (1, 1, [])
+
+
+def test_backfill_stops_on_its_own_cancel(spx_levels):
+    cancel = threading.Event()
+    cancel.set()
+    written, requests, _, _ = gex.backfill_ohlc(["SPX"], cancel=cancel)
+    assert (written, requests) == (0, 1)
+    assert gex.cancel_import is False
@@ -0,0 +1,43 @@
+import datetime
+
+import pandas as pd
+
+import GEX_chart_new as gex
+
+DAY = gex._day_number(datetime.date(2024, 1, 2))
+
+
+def _bars(index, tz=None):
+    index = pd.DatetimeIndex(index, name="Date").tz_localize(tz)
+    return pd.DataFrame({"Open": 1.0, "High": 2.0, "Low": 0.5, "Close": 1.5, "Adj Close": 1.4,
+                         "Volume": 100}, index=index)
+
+
+def _add_level(ticker, date_str="2024-01-02"):
+    session = gex.ImportSession()
+    gex.parse_gex_code(date_str, f"{ticker}: Call Wall, 100", session)
+    session.finish()
+    session.close()
+
+
+def test_frame_rows_keeps_requested_days_and_drops_incomplete_bars():
+    data = _bars(["2024-01-02", "2024-01-03", "2024-01-04"], tz="America/New_York")
+    data.loc[data.index[2], "Close"] = float("nan")
+    assert gex.ohlc_frame_rows("SPX", data) == [
+        ("SPX", day, label, value) for day in (DAY, DAY + 1)
+        for label, value in zip(gex.OHLC_LABELS, (1.0, 2.0, 0.5, 1.5))]
+    assert {day for _, day, _, _ in gex.ohlc_frame_rows("SPX", data, [DAY + 1, DAY + 2])} == {DAY + 1}
+
+
+def test_write_ohlc_overwrites_and_updates_daily_levels(db):
+    _add_level("SPX")
+    rows = gex.ohlc_frame_rows("SPX", _bars(["2024-01-02"]))
+    assert gex._write_ohlc(rows + [("NOPE", DAY, "Open", 1.0)]) == 4      # 資料庫沒有的 ticker 略過
+    gex._write_ohlc([("SPX", DAY, "Close", 9.0)])
+
+    df = gex.fetch_daily_levels("SPX")
+    assert df.loc["2024-01-02", list(gex.OHLC_LABELS)].tolist() == [1.0, 2.0, 0.5, 9.0]
+    assert df.loc["2024-01-02", "Call Wall"] == 100.0
+    with db.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM gex_levels").fetchone()[0] == 6   # Call Wall、TV Code、OHLC
+        assert conn.execute("SELECT COUNT(*) FROM tickers WHERE symbol = 'NOPE'").fetchone()[0] == 0
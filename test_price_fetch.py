@@ -0,0 +1,90 @@
+import datetime
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import price_fetch
+
+START, END = datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(price_fetch, "BACKOFF_BASE", 0.0)
+
+
+def _frame(symbols, start, end):
+    if not symbols:
+        return pd.DataFrame()
+    index = pd.date_range(start, end, freq="D", inclusive="left", name="Date")
+    return pd.concat({s: pd.DataFrame({"Open": 1.0, "High": 1.0, "Low": 1.0, "Close": 1.0}, index=index)
+                      for s in symbols}, axis=1)
+
+
+def test_split_requests_sizes_chunks_by_days():
+    symbols = [f"S{i}" for i in range(250)]
+    long_range = (symbols[:30], datetime.date(2020, 1, 1), datetime.date(2024, 1, 1))
+    chunks = price_fetch.split_requests([(symbols, START, END), long_range])
+    short = [c[0] for c in chunks if c[1] == START]
+    assert [len(c) for c in short] == [100, 100, 50]           # 31 天：每批上限 MAX_CHUNK_SYMBOLS
+    assert sum(short, []) == symbols
+    long = [c[0] for c in chunks if c[1] == long_range[1]]
+    assert [len(c) for c in long] == [3] * 10                  # 4 年：每批約 CHUNK_BARS 根 K 線
+    assert sum(long, []) == long_range[0]
+
+
+def test_failed_chunk_is_retried_without_losing_others():
+    failures = {"S1": 2}
+
+    def flaky(tickers, start, end, **kwargs):
+        if failures.get(tickers[0]):
+            failures[tickers[0]] -= 1
+            raise ConnectionError("throttled")
+        return _frame([s for s in tickers if s != "S3"], start, end)
+
+    results = {r.symbols[0]: r for r in price_fetch.fetch_prices(
+        [(["S0"], START, END), (["S1"], START, END), (["S3"], START, END)],
+        download=flaky, rate=0)}
+    assert results["S0"].attempts == 1 and not results["S0"].error
+    assert results["S1"].attempts == 3 and not results["S1"].error and len(results["S1"].bars["S1"]) == 31
+    assert results["S3"].missing == ["S3"] and results["S3"].error is None
+
+
+def test_chunk_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(price_fetch, "MAX_RETRIES", 2)
+
+    def down(**kwargs):
+        raise ConnectionError("down")
+
+    [result] = price_fetch.fetch_prices([(["S0", "S1"], START, END)], download=down, rate=0)
+    assert result.attempts == 3 and isinstance(result.error, ConnectionError)
+    assert result.missing == ["S0", "S1"]
+
+
+def test_cancel_interrupts_backoff(monkeypatch):
+    monkeypatch.setattr(price_fetch, "BACKOFF_BASE", 30.0)
+    calls = []
+
+    def failing(**kwargs):
+        calls.append(kwargs["tickers"])
+        raise ConnectionError("rate limited")
+
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    t0 = time.monotonic()
+    results = list(price_fetch.fetch_prices([(["AAA"], START, END)], download=failing, cancel=cancel))
+    assert time.monotonic() - t0 < 5
+    assert len(calls) == 1 and results[0].attempts == 1
+    assert isinstance(results[0].error, ConnectionError)
+
+
+def test_cancel_interrupts_rate_limit_wait():
+    limiter = price_fetch.RateLimiter(0.01)             # 相鄰請求相隔 100 秒
+    cancel = threading.Event()
+    assert limiter.wait(cancel)
+    threading.Timer(0.2, cancel.set).start()
+    t0 = time.monotonic()
+    assert not limiter.wait(cancel)
+    assert time.monotonic() - t0 < 5
@@ -0,0 +1,76 @@
+"""
+先以 record 模式對假的「連線」來源跑一次自動匯入與 OHLC 補齊（錄下 fixture），
+再以 replay 模式只讀 fixture 重跑，兩次寫進資料庫的內容必須相同
+"""
+import pytest
+
+import GEX_chart_new as gex
+import benchmark
+import data_sources
+
+TICKERS = [benchmark.ticker_name(i) for i in range(12)]
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    """data_sources 的模式與日線來源設定在測試結束後還原"""
+    for name in ("_mode", "_fixture_dir", "_latency", "_price_dir", "_bar_store_dir", "_provider"):
+        monkeypatch.setattr(data_sources, name, getattr(data_sources, name))
+
+
+def _snapshot(db):
+    with db.reader() as conn:
+        return {
+            "levels": conn.execute("SELECT ticker, date, label, value FROM stock_data "
+                                   "ORDER BY ticker, date, label").fetchall(),
+            "daily": conn.execute("SELECT * FROM daily_levels ORDER BY ticker_id, day").fetchall(),
+            "sync": conn.execute("SELECT spreadsheet_id, title, last_row, last_date FROM sheet_sync_state "
+                                 "ORDER BY spreadsheet_id, title").fetchall(),
+        }
+
+
+def _run(db, monkeypatch):
+    """自動匯入 → 批次補 OHLC（update_ohlc）→ 單一 ticker 區間（update_ohlc_range），各步驟後記下資料庫內容"""
+    snapshots = []
+    gex.auto_import_from_google()
+    snapshots.append(_snapshot(db))
+    written, requests, no_data, _ = gex.backfill_ohlc(end="2020-03-31")
+    assert written and not no_data
+    snapshots.append(_snapshot(db))
+    gex.backfill_ohlc([TICKERS[0]], "2020-01-01", "2020-06-30")
+    snapshots.append(_snapshot(db))
+    return snapshots
+
+
+def test_replay_matches_recorded_run(db, quiet_ui, sources, tmp_path, monkeypatch):
+    books = benchmark.make_google_books(n_sheets=len(TICKERS), n_days=120)
+    live_dir, fixture_dir = tmp_path / "live", tmp_path / "fixture"
+    benchmark.make_price_fixture(str(live_dir), TICKERS, n_days=120, freq="D")
+    upstream = data_sources.ReplaySheetsClient(data_sources.SheetsFixture.from_values(books))
+
+    # record：Google 試算表與日線照常「連線」，回應存進 fixture
+    credentials = tmp_path / "service_account.json"
+    credentials.write_text("{}")
+    monkeypatch.setattr(gex, "SERVICE_ACCOUNT_FILE", str(credentials))
+    monkeypatch.setattr(data_sources, "_live_sheets_client", lambda path: upstream)
+    data_sources.configure(data_sources.RECORD, str(fixture_dir), latency=0,
+                           price_dir=str(live_dir / "prices"), bar_store="")
+    recorded = _run(db, monkeypatch)
+    assert upstream.calls
+    assert sorted(p.name for p in (fixture_dir / "prices").iterdir()) == sorted(f"{t}.csv" for t in TICKERS)
+
+    # replay：新的資料庫、不需要憑證，也不能連線
+    gex.get_db().close()
+    monkeypatch.setattr(gex, "DB_PATH", str(tmp_path / "replay.db"))
+    gex.init_db()
+    monkeypatch.setattr(gex, "SERVICE_ACCOUNT_FILE", str(tmp_path / "missing.json"))
+
+    def offline(path):
+        raise AssertionError("replay 模式不應連線")
+    monkeypatch.setattr(data_sources, "_live_sheets_client", offline)
+    data_sources.configure(data_sources.REPLAY, str(fixture_dir), latency=0, price_dir="")
+    replayed = _run(gex.get_db(), monkeypatch)
+
+    for step, (a, b) in enumerate(zip(recorded, replayed)):
+        assert a == b, f"第 {step + 1} 步結果不同"
+    assert recorded[0]["levels"] and recorded[2]["levels"] != recorded[1]["levels"]
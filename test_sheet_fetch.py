@@ -0,0 +1,42 @@
+import pytest
+
+import benchmark
+import GEX_chart_new as gex
+import sheet_fetch
+
+SHEET_IDS = [gex.SHEET_ID, gex.SHEET_ID_MINOR]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(sheet_fetch, "BACKOFF_BASE", 0.0)
+
+
+def _one_by_one(books):
+    client = benchmark.FakeSheetsClient(books, latency=0)
+    return [(ws.title, ws.get_all_values())
+            for s_id in SHEET_IDS for ws in client.open_by_key(s_id).worksheets()]
+
+
+@pytest.mark.parametrize("fail_every", [0, 3])
+def test_batched_fetch_matches_sheet_by_sheet_reads(fail_every):
+    books = benchmark.make_google_books(n_sheets=12, n_days=5)
+    client = benchmark.FakeSheetsClient(books, latency=0, fail_every=fail_every)
+    sheets = list(sheet_fetch.fetch_spreadsheets(client, SHEET_IDS, sheets_per_request=5))
+    assert all(sheet.error is None for sheet in sheets)
+    assert [(sheet.title, sheet.values) for sheet in sheets] == _one_by_one(books)
+
+
+def test_unopenable_spreadsheet_is_skipped(monkeypatch):
+    books = benchmark.make_google_books(n_sheets=6, n_days=3)
+    client = benchmark.FakeSheetsClient(books, latency=0)
+    open_by_key = client.open_by_key
+
+    def open_only_main(s_id):
+        if s_id != gex.SHEET_ID:
+            raise sheet_fetch.APIError(benchmark._FakeResponse(404, "Not found"))
+        return open_by_key(s_id)
+    monkeypatch.setattr(client, "open_by_key", open_only_main)
+    sheets = list(sheet_fetch.fetch_spreadsheets(client, SHEET_IDS))
+    assert {sheet.spreadsheet_id for sheet in sheets} == {gex.SHEET_ID}
+    assert [sheet.title for sheet in sheets] == list(books[gex.SHEET_ID])
@@ -0,0 +1,96 @@
+import pandas as pd
+
+import GEX_chart_new as gex
+import data_sources
+
+
+def _rows(db):
+    with db.reader() as conn:
+        return conn.execute("SELECT ticker, symbol, no_data_at IS NOT NULL, misses FROM symbol_map "
+                            "ORDER BY ticker").fetchall()
+
+
+def test_default_rules_and_overrides():
+    assert [gex.yf_symbol(t) for t in ("SPX", "VIX", "BRK.B", "AAPL")] == ["^SPX", "^VIX", "BRK-B", "AAPL"]
+    assert gex.yf_symbol("SPX", {"SPX": "^GSPC"}) == "^GSPC"
+    assert gex.yf_symbol("BRK.B", {"SPX": "^GSPC"}) == "BRK-B"
+
+
+def test_no_data_cache_and_ttl(db):
+    gex.record_symbol_results([], ["DEAD", "GONE"])
+    gex.record_symbol_results([], ["DEAD"])
+    assert _rows(db) == [("DEAD", None, 1, 2), ("GONE", None, 1, 1)]
+    assert gex.load_symbol_map() == ({}, {"DEAD", "GONE"})
+
+    gex.record_symbol_results(["GONE"], [])
+    assert _rows(db) == [("DEAD", None, 1, 2)]                 # 沒有手動指定又有資料的不留紀錄
+
+    with db.writer() as conn:
+        conn.execute("UPDATE symbol_map SET no_data_at = datetime('now', ?)",
+                     (f"-{gex.SYMBOL_NO_DATA_TTL_DAYS + 1} days",))
+    assert gex.load_symbol_map() == ({}, set())
+
+
+def test_override_clears_no_data_record(db):
+    gex.record_symbol_results([], ["SPX"])
+    gex.set_symbol_override("SPX", "^GSPC")
+    assert _rows(db) == [("SPX", "^GSPC", 0, 0)]
+    assert gex.load_symbol_map() == ({"SPX": "^GSPC"}, set())
+    gex.set_symbol_override("SPX", "")
+    assert _rows(db) == []
+
+
+def test_backfill_uses_overrides_and_skips_dead_tickers(db, monkeypatch):
+    session = gex.ImportSession()
+    for code in ("SPX: Call Wall, 100", "DEAD: Call Wall, 1"):
+        gex.parse_gex_code("2024-01-02", code, session)
+    session.finish()
+    session.close()
+    calls = []
+
+    def download(tickers, start, end, **kwargs):
+        calls.append(list(tickers))
+        if tickers == ["DEAD"]:
+            return pd.DataFrame()
+        index = pd.date_range(start, end, freq="D", inclusive="left", name="Date")
+        return pd.concat({s: pd.DataFrame({label: 1.0 for label in gex.OHLC_LABELS}, index=index)
+                          for s in tickers if s != "DEAD"}, axis=1)
+
+    monkeypatch.setattr(data_sources, "download_prices", download)
+    gex.set_symbol_override("SPX", "^GSPC")
+    gex.record_symbol_results([], ["DEAD"])
+
+    written, _, no_data, skipped = gex.backfill_ohlc()
+    assert calls == [["^GSPC"]] and written == 1 and skipped == ["DEAD"] and no_data == []
+
+    # 指定 ticker 時仍會嘗試；同一批有其他代號下載到資料，才累加無資料次數
+    calls.clear()
+    gex.delete_levels(f"WHERE g.label_id IN (SELECT id FROM labels WHERE name IN {gex.OHLC_LABELS})", (),
+                      "OHLC")
+    written, _, no_data, skipped = gex.backfill_ohlc(["DEAD", "SPX"])
+    assert sorted(calls[0]) == ["DEAD", "^GSPC"] and no_data == ["DEAD"] and skipped == []
+    assert ("DEAD", None, 1, 2) in _rows(db)
+
+
+def test_tickers_sharing_a_symbol_are_attributed_per_window(db, monkeypatch):
+    session = gex.ImportSession()
+    for date_str, code in (("2024-01-02", "SPX: Call Wall, 100"), ("2024-06-03", "SPXW: Call Wall, 100")):
+        gex.parse_gex_code(date_str, code, session)
+    session.finish()
+    session.close()
+    calls = []
+
+    def download(tickers, start, end, **kwargs):
+        calls.append((list(tickers), start))
+        index = pd.date_range(start, end, freq="D", inclusive="left", name="Date")
+        return pd.concat({s: pd.DataFrame({label: 1.0 for label in gex.OHLC_LABELS}, index=index)
+                          for s in tickers}, axis=1)
+
+    monkeypatch.setattr(data_sources, "download_prices", download)
+    gex.set_symbol_override("SPX", "^GSPC")
+    gex.set_symbol_override("SPXW", "^GSPC")
+
+    # 兩段相隔很遠的缺口各下載一次 ^GSPC，另一個 ticker 不因區間外沒有資料被算成無資料
+    written, requests, no_data, _ = gex.backfill_ohlc()
+    assert len(calls) == requests == 2 and written == 2 and no_data == []
+    assert _rows(db) == [("SPX", "^GSPC", 0, 0), ("SPXW", "^GSPC", 0, 0)]
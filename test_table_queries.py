@@ -0,0 +1,56 @@
+import pytest
+
+import GEX_chart_new as gex
+import benchmark
+
+FILTERS = [("", None, None), ("AAB", None, None), ("", "2020-01-05", "2020-01-12"),
+           ("AAC", "2020-01-05", "2020-01-12")]
+
+
+@pytest.fixture
+def levels(db):
+    session = gex.ImportSession()
+    session.add_rows(benchmark.parse_rows(benchmark.make_tv_codes(n_tickers=5, n_days=20)))
+    session.finish()
+    session.close()
+    return db
+
+
+def _key(row):
+    return row[5], row[0]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_count_and_order(levels, filters):
+    rows = gex.fetch_data(*filters)
+    assert rows and gex.count_data(*filters) == len(rows)
+    assert [_key(r) for r in rows] == sorted((_key(r) for r in rows), reverse=True)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_keyset_pages_forward_and_backward(levels, filters):
+    rows = gex.fetch_data(*filters)
+    forward = gex.fetch_data(*filters, limit=7)
+    while len(forward) < len(rows):
+        page = gex.fetch_data(*filters, after=_key(forward[-1]), limit=7)
+        assert page
+        forward += page
+    assert forward == rows
+
+    backward = rows[-7:]
+    while len(backward) < len(rows):
+        page = gex.fetch_data(*filters, before=_key(backward[0]), limit=7)
+        assert page
+        backward = page[::-1] + backward
+    assert backward == rows
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_locate_matches_offset(levels, filters):
+    rows = gex.fetch_data(*filters)
+    for offset in (0, 1, len(rows) // 2, len(rows) - 1):
+        assert gex.locate_data(offset, *filters) == _key(rows[offset])
+        # VirtualTable._seek 從找到的鍵（含）往後讀一頁
+        key = gex.locate_data(offset, *filters)
+        assert gex.fetch_data(*filters, after=(key[0], key[1] + 1), limit=5) == rows[offset:offset + 5]
+    assert gex.locate_data(len(rows), *filters) is None
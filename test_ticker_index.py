@@ -0,0 +1,44 @@
+import random
+import string
+
+import pytest
+
+from ticker_index import TickerIndex
+
+
+def _brute_force(tickers, text, limit):
+    """SearchCombobox 原本的做法：逐一比對整個清單"""
+    query = text.strip().lower()
+    keys = sorted({t.lower(): t for t in tickers}.items())
+    prefix = [t for key, t in keys if key.startswith(query)]
+    rest = [t for key, t in keys if query in key and not key.startswith(query)]
+    return (prefix + rest)[:limit]
+
+
+def _tickers(rnd, n):
+    alphabet = string.ascii_uppercase[:8] + "."
+    return list({"".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 5))) for _ in range(n)})
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_search_matches_brute_force(seed):
+    rnd = random.Random(seed)
+    tickers = _tickers(rnd, 2000)
+    index = TickerIndex(tickers)
+    queries = ["", " ", "a", "A.", ".", "zz"] + [rnd.choice(tickers)[rnd.randint(0, 2):].lower()
+                                                for _ in range(200)]
+    for query in queries:
+        for limit in (5, 50, 5000):
+            assert index.search(query, limit) == _brute_force(tickers, query, limit), (query, limit)
+
+
+def test_incremental_update_matches_fresh_index():
+    rnd = random.Random(42)
+    before, after = _tickers(rnd, 500), _tickers(rnd, 500)
+    index = TickerIndex(before)
+    kept = set(before) & set(after)
+    assert index.update(after) == (len(set(after) - kept), len(set(before) - kept))
+    fresh = TickerIndex(after)
+    assert index.keys == fresh.keys and len(index) == len(set(after))
+    for query in ("", "a", "bc", "h.", "abcde"):
+        assert index.search(query, 100) == fresh.search(query, 100) == _brute_force(after, query, 100)
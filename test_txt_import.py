@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+import GEX_chart_new as gex
+import benchmark
+
+
+def _write_txt(path, n_days, tail=b""):
+    lines = []
+    for d in range(1, n_days + 1):
+        lines.append(f"2024-01-{d:02d}\nSPX: Call Wall, {100 + d}, Put Wall, {90 + d}\n")
+    path.write_bytes("".join(lines).encode("utf-8") + tail)
+    return str(path)
+
+
+def _level_count(db):
+    with db.reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM gex_levels").fetchone()[0]
+
+
+def test_read_error_keeps_rows_before_it_and_does_not_record_file(db, tmp_path):
+    path = _write_txt(tmp_path / "codes.txt", 3, tail=b"\xff\xfe broken\n")
+    session = gex.ImportSession()
+    finished, skipped = gex.import_txt_files([path], session)
+    session.finish()
+    session.close()
+    assert finished == [] and skipped == 0
+    assert _level_count(db) == 9                        # 3 天 × (TV Code + 2 個 level)
+
+
+def test_streaming_write_error_propagates(db, tmp_path, monkeypatch):
+    path = _write_txt(tmp_path / "codes.txt", 20)
+    session = gex.ImportSession(batch_size=5)
+
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(gex, "_write_staged", broken)
+    with pytest.raises(sqlite3.OperationalError):
+        gex.import_txt_files([path], session)
+    session.close()
+
+
+def test_streaming_conflict_dialog_is_marked_partial_mid_file(db, tmp_path, monkeypatch):
+    path = _write_txt(tmp_path / "codes.txt", 20)
+    session = gex.ImportSession()
+    gex.import_txt_files([path], session)
+    session.finish()
+    session.close()
+
+    asked = []
+    monkeypatch.setattr(gex, "ask_bulk_conflict_resolution",
+                        lambda conflicts, partial=False: asked.append(partial) or "skip")
+    monkeypatch.setattr(gex, "plan_file_import", lambda *a, **k: gex.gex_parser.TxtCursor.start(path))
+    session = gex.ImportSession(batch_size=5)
+    session._known_codes = set()                       # 不略過已匯入的 TV Code，讓每一批都重複
+    gex.import_txt_files([path], session)
+    session.finish()
+    session.close()
+    assert asked == [True]                             # 只問一次，且標示為中途的批次
+    assert _level_count(db) == 60
+
+
+def _snapshot(db):
+    with db.reader() as conn:
+        return (conn.execute("SELECT ticker, date, label, value FROM stock_data ORDER BY ticker, date, label")
+                .fetchall(),
+                conn.execute("SELECT * FROM daily_levels ORDER BY ticker_id, day").fetchall())
+
+
+def test_parallel_import_matches_sequential(db, quiet_ui, tmp_path, monkeypatch):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"day{i}.txt"
+        # 相鄰兩個檔案有同一天的資料：以檔案順序中後面的為準
+        path.write_text(f"2024-01-{i + 1:02d}\nSPX: Call Wall, {100 + i}\n"
+                        f"2024-01-{i + 2:02d}\nSPX: Call Wall, {200 + i}, Put Wall, {90 + i}\n"
+                        "2024-01-05\n123: Call Wall, 1\n", encoding="utf-8")
+        paths.append(str(path))
+
+    session = gex.ImportSession()
+    finished, skipped = gex.import_txt_files(paths, session)
+    session.finish()
+    session.close()
+    sequential = _snapshot(db)
+
+    gex.get_db().close()
+    monkeypatch.setattr(gex, "DB_PATH", str(tmp_path / "parallel.db"))
+    gex.init_db()
+    session = gex.ImportSession()
+    invalid, parallel_finished, parallel_skipped = benchmark.parallel_txt_import(paths, session)
+    session.finish()
+    session.close()
+    assert _snapshot(gex.get_db()) == sequential
+    assert [path for path, _ in parallel_finished] == [path for path, _ in finished] == paths
+    assert invalid == ["123: Call Wall, 1"] * 4 and parallel_skipped == skipped == 0
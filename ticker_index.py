@@ -0,0 +1,71 @@
+"""
+ticker 搜尋索引（不依賴 Tk 與資料庫）
+
+- 排序好的小寫代號陣列：前綴搜尋以 bisect 找出範圍
+- 單字元與雙字元（bigram）索引：子字串搜尋只比對包含查詢所有 bigram 的候選
+- update() 只處理新增 / 消失的 ticker，不必每次匯入後整個重建
+"""
+import bisect
+import typing
+
+
+def _grams(key: str) -> typing.Set[str]:
+    return set(key) | {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class TickerIndex:
+    def __init__(self, tickers: typing.Iterable[str] = ()):
+        self.keys: typing.List[str] = []                    # 小寫，已排序
+        self.names: typing.Dict[str, str] = {}              # 小寫 → 原始代號
+        self.grams: typing.Dict[str, typing.Set[str]] = {}  # 字元 / bigram → 小寫代號
+        self.update(tickers)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, ticker: str):
+        key = ticker.lower()
+        if key in self.names:
+            return
+        self.names[key] = ticker
+        bisect.insort(self.keys, key)
+        for gram in _grams(key):
+            self.grams.setdefault(gram, set()).add(key)
+
+    def discard(self, ticker: str):
+        key = ticker.lower()
+        if self.names.pop(key, None) is None:
+            return
+        del self.keys[bisect.bisect_left(self.keys, key)]
+        for gram in _grams(key):
+            self.grams[gram].discard(key)
+
+    def update(self, tickers: typing.Iterable[str]) -> typing.Tuple[int, int]:
+        """改成與 tickers 相同的內容，只增刪有差異的；回傳 (新增數, 刪除數)"""
+        wanted = {t.lower(): t for t in tickers}
+        removed = [self.names[key] for key in self.names if key not in wanted]
+        added = [t for key, t in wanted.items() if key not in self.names]
+        for t in removed:
+            self.discard(t)
+        for t in added:
+            self.add(t)
+        return len(added), len(removed)
+
+    def search(self, text: str, limit: int = 50) -> typing.List[str]:
+        """前綴相符的在前、其餘包含 text 的在後（各自依字母排序），最多 limit 筆；空字串回傳前 limit 個"""
+        query = text.strip().lower()
+        lo = bisect.bisect_left(self.keys, query)
+        hi = bisect.bisect_left(self.keys, query + "\uffff")
+        result = self.keys[lo:min(hi, lo + limit)]
+        if query and len(result) < limit:
+            # 候選 = 包含查詢每個 bigram 的代號，從最少的集合開始取交集
+            grams = sorted({query[i:i + 2] for i in range(len(query) - 1)} or {query},
+                           key=lambda g: len(self.grams.get(g, ())))
+            candidates = set(self.grams.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= self.grams.get(gram, set())
+            rest = sorted(key for key in candidates if query in key and not key.startswith(query))
+            result += rest[:limit - len(result)]
+        return [self.names[key] for key in result]